@@ -0,0 +1,103 @@
+from concurrent.futures import Future
+import collections
+import logging
+
+import clocks
+import konnected
+import simplethread
+
+logger = logging.getLogger(__name__)
+
+
+class ActuatorCommand:
+    def __init__(self, pin, state, momentary=None, times=None, pause=None):
+        self.pin = pin
+        self.state = state
+        self.momentary = momentary
+        self.times = times
+        self.pause = pause
+        self.future = Future()
+
+    def is_momentary(self):
+        return self.momentary is not None
+
+
+class ActuatorQueue(simplethread.ConditionThread):
+    """Sends actuator commands to one board from a worker thread, coalescing them per pin"""
+    MAX_ATTEMPTS = 4
+    CONST_RETRY_BACKOFF_s = 0.25
+    CONST_COALESCE_WINDOW_s = 0.005
+
+    def __init__(self, client):
+        simplethread.ConditionThread.__init__(self)
+        self._client = client
+        self._pending = collections.OrderedDict()
+        self._last_sent = {}
+
+    def submit(self, pin, state, momentary=None, times=None, pause=None):
+        """Queue a command for the pin. Returns a Future of the device response"""
+        command = ActuatorCommand(pin, state, momentary, times, pause)
+
+        with self._condition:
+            superseded = self._pending.pop(pin, None)
+            self._pending[pin] = command
+            self._condition.notify()
+
+            if not self._running:
+                self.start()
+
+        if superseded is not None:
+            superseded.future.set_result(None)
+        return command.future
+
+    def thread_loop(self):
+        while True:
+            with self._condition:
+                if not self._pending:
+                    while self._running and not self._pending:
+                        self._condition.wait()
+                    # Let commands issued together (tone on then off) land before any of them are sent
+                    clocks.clock.wait_for(self._condition, lambda: not self._running, self.CONST_COALESCE_WINDOW_s)
+                if not self._running:
+                    break
+
+                pin, command = self._pending.popitem(last=False)
+
+            if not command.is_momentary() and self._last_sent.get(pin, 0) == command.state:
+                command.future.set_result(None)
+                continue
+
+            self._send(command)
+
+        with self._condition:
+            for command in self._pending.values():
+                command.future.cancel()
+            self._pending.clear()
+
+    def _send(self, command):
+        backoff_s = self.CONST_RETRY_BACKOFF_s
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            try:
+                result = self._client.put_device(command.pin, command.state,
+                                                 command.momentary, command.times, command.pause)
+            except konnected.Client.ClientError as err:
+                logger.warning("Failed to actuate pin %s (attempt %d): %s", command.pin, attempt, err)
+            else:
+                self._last_sent[command.pin] = 0 if command.is_momentary() else command.state
+                command.future.set_result(result)
+                return
+
+            with self._condition:
+                # Give up early if stopping or if a newer command for this pin replaced this one
+                if attempt < self.MAX_ATTEMPTS:
+                    clocks.clock.wait_for(self._condition, lambda: not self._running or command.pin in self._pending,
+                                          backoff_s)
+                if not self._running or command.pin in self._pending:
+                    command.future.set_result(None)
+                    return
+            backoff_s *= 2
+
+        # The pin state is unknown after repeated failures, so don't let it skip the next command
+        self._last_sent[command.pin] = None
+        command.future.set_exception(konnected.Client.ClientError(
+            "Failed to actuate pin " + str(command.pin) + " after " + str(self.MAX_ATTEMPTS) + " attempts"))
@@ -1,31 +1,140 @@
 
+from concurrent.futures import Future
 from enum import Enum
 import logging
+import queue
 import threading
+import time
 
+import eventstream
+import metrics
 import sensors
+import simplethread
+import timerwheel
 
 logger = logging.getLogger(__name__)
 
 
+DEFAULT_AREA = 'default'
+
+
 def load_state_configurations(config):
+    load_alert_configuration(config['alert'])
+    load_areas(config)
+
+
+def load_areas(config):
+    """Build one state machine per [areas] entry; unlisted zones belong to the first area"""
+    global area_machines, area_index
+
+    if not config.has_section('areas'):
+        alarm_state_machine.name = DEFAULT_AREA
+        arm_configurations.load_from_config(config)
+        machines = {DEFAULT_AREA: alarm_state_machine}
+        index = {}
+    else:
+        machines = {}
+        index = {}
+        for position, name in enumerate(config['areas'].get('areas').split(',')):
+            section = config['area_' + name]
+            if position == 0:
+                machine = alarm_state_machine
+            elif name in area_machines and area_machines[name] is not alarm_state_machine:
+                machine = area_machines[name]
+            else:
+                machine = AlarmStateMachine(name, ArmConfigurations())
+                machine.journal = alarm_state_machine.journal
+            machine.name = name
+            machine.arm_configurations.load_from_config(config, section.get('arm_configs').split(','))
+            machines[name] = machine
+
+            for zone_key in ArmConfiguration(name, section).monitored_zones:
+                index.setdefault(zone_key, machine)
+
+    removed = [machine for name, machine in area_machines.items() if machines.get(name) is not machine]
+    area_machines = machines
+    area_index = index
+
+    for machine in removed:
+        if machine is not alarm_state_machine:
+            logger.warning("Area %s was removed, stopping its state machine", machine.name)
+            machine.stop()
+            machine.release_outputs()
+
+
+def start_areas():
+    for machine in area_machines.values():
+        machine.start()
+
+
+def stop_areas():
+    for machine in area_machines.values():
+        machine.stop()
+
+
+def get_dispatcher_metrics():
+    """{area: dispatcher metrics} for every area"""
+    return {name: machine.dispatcher.get_metrics() for name, machine in area_machines.items()}
+
+
+def get_area(name):
+    """Returns the state machine for an area, the first area if name is None, or None if there is no such area"""
+    if name is None:
+        return alarm_state_machine
+    return area_machines.get(name)
+
+
+# Called for every sensor event, so it is a single dict lookup
+def machine_for_zone(zone_data):
+    return area_index.get(zone_data, alarm_state_machine)
+
+
+# Alert.on_entry reads alert_timeout_s each time, so a new value applies from the next alert
+def load_alert_configuration(config):
     global alert_timeout_s
-    alert_timeout_s = config['alert'].getint('duration_s')
-    arm_configurations.load_from_config(config)
+    alert_timeout_s = config.getint('duration_s')
 
 
 class ArmConfigurations:
     def __init__(self):
         self.configurations = {}
+        self.current_zones = frozenset()
         self.current_configuration = ''
 
-    def load_from_config(self, config):
-        config_names = config['arm_configs'].get('configurations')
-        config_name_list = config_names.split(',')
+    # Setting the configuration also caches its zone index, so Armed only needs one lookup per event
+    @property
+    def current_configuration(self):
+        return self._current_configuration
+
+    @current_configuration.setter
+    def current_configuration(self, name):
+        self._current_configuration = name
+        if name in self.configurations:
+            self.current_zones = self.configurations[name].monitored_zones
+        else:
+            self.current_zones = frozenset()
+
+    def load_from_config(self, config, config_name_list=None):
+        if config_name_list is None:
+            config_name_list = config['arm_configs'].get('configurations').split(',')
 
+        # Build the full set before swapping it in, so a reload never exposes a half-loaded set
+        configurations = {}
         for name in config_name_list:
             new_arm_config = ArmConfiguration(name, config[name])
-            self.configurations[name] = new_arm_config
+            configurations[name] = new_arm_config
+
+        active_name = self._current_configuration
+        if active_name in self.configurations and active_name not in configurations:
+            logger.warning("Arm configuration %s was removed while in use, keeping it until the next reload",
+                           active_name)
+            configurations[active_name] = self.configurations[active_name]
+
+        self.configurations = configurations
+        self.current_configuration = active_name
+
+    def is_monitored(self, zone_data):
+        return zone_data in self.current_zones
 
     def get_current_configuration(self):
         return self.configurations[self.current_configuration]
@@ -51,6 +160,9 @@ class ArmConfiguration:
             zone_list = map(int, zone_list)
             self.zones[sensor] = list(zone_list)
 
+        # ZoneData is a namedtuple, so it hashes and compares equal to these (sensor_id, zone_number) keys
+        self.monitored_zones = frozenset((sensor, zone) for sensor in self.sensors for zone in self.zones[sensor])
+
 
 class EventType(Enum):
     arm = 1
@@ -97,7 +209,7 @@ class Disarmed(State):
 
     def process_event(self, event, data):
         if event == EventType.arm:
-            arm_configurations.current_configuration = data
+            self._owning_machine.arm_configurations.current_configuration = data
         elif event == EventType.sensor_changed:
             sensors.sensor_list[data.sensor_id].zones[data.zone_number].process_door_chime()
 
@@ -112,11 +224,8 @@ class Armed(State):
 
     def process_event(self, event, data):
         if event == EventType.sensor_changed:
-            current_arm_config = arm_configurations.get_current_configuration()
-
-            if data.sensor_id in current_arm_config.sensors:
-                if data.zone_number in current_arm_config.zones[data.sensor_id]:
-                    return State.process_event(self, event, data)
+            if self._owning_machine.arm_configurations.is_monitored(data):
+                return State.process_event(self, event, data)
 
             return StateType.armed
 
@@ -125,6 +234,8 @@ class Armed(State):
 
 
 class Alert(State):
+    CONST_RETRY_s = 0.1
+
     def __init__(self, owning_machine):
         State.__init__(self, StateType.alert, owning_machine)
         self.add_transition(EventType.disarm, StateType.disarmed)
@@ -133,21 +244,26 @@ class Alert(State):
         self._transition_timer = None
 
     def on_entry(self):
-        sensors.tone_generator.play_constant_tone()
+        sensors.tone_generator.play_constant_tone(self._owning_machine)
 
-        self._transition_timer = threading.Timer(alert_timeout_s, self.process_expired_alert)
-        self._transition_timer.start()
+        self._transition_timer = timerwheel.timer_wheel.schedule(alert_timeout_s, self.process_expired_alert)
         State.on_entry(self)
 
     def on_exit(self):
-        sensors.tone_generator.stop_constant_tone()
+        sensors.tone_generator.stop_constant_tone(self._owning_machine)
 
         self._transition_timer.cancel()
         State.on_exit(self)
 
     def process_expired_alert(self):
         logger.info("Alert timer expired, transitioning to Alarm")
-        self._owning_machine.process_event(EventType.alert_expired, None)
+        # This runs on the timer wheel thread, which mustn't wait for room in the event queue
+        try:
+            return self._owning_machine.post_event(EventType.alert_expired, None, block=False)
+        except queue.Full:
+            if self._owning_machine.get_current_state() == StateType.alert:
+                self._transition_timer = timerwheel.timer_wheel.schedule(self.CONST_RETRY_s,
+                                                                         self.process_expired_alert)
 
 
 class Alarm(State):
@@ -156,16 +272,20 @@ class Alarm(State):
         self.add_transition(EventType.disarm, StateType.disarmed)
 
     def on_entry(self):
-        sensors.siren.activate_siren()
+        sensors.siren.activate_siren(self._owning_machine)
         State.on_entry(self)
 
     def on_exit(self):
-        sensors.siren.deactivate_siren()
+        sensors.siren.deactivate_siren(self._owning_machine)
         State.on_exit(self)
 
 
 class AlarmStateMachine:
-    def __init__(self):
+    def __init__(self, name=DEFAULT_AREA, area_arm_configurations=None):
+        self.name = name
+        self.arm_configurations = area_arm_configurations if area_arm_configurations is not None \
+            else arm_configurations
+
         self._state_machine = {StateType.disarmed: Disarmed(self),
                                StateType.armed: Armed(self),
                                StateType.alert: Alert(self),
@@ -174,17 +294,58 @@ class AlarmStateMachine:
         self._current_state = StateType.disarmed
         self._state_machine[self._current_state].on_entry()
 
+        self.dispatcher = EventDispatcher(self)
+        self.journal = None
+
     def get_current_state(self):
         return self._current_state
 
-    def process_event(self, event, data):
-        new_state = self._state_machine[self._current_state].process_event(event, data)
+    def start(self):
+        if not self.dispatcher._running:
+            self.dispatcher.start()
 
-        if self._current_state != new_state:
+    def restore(self, state, arm_configuration):
+        """Put the machine back in a previously journaled state, re-running its on_entry (siren, alert timer)"""
+        self.arm_configurations.current_configuration = arm_configuration
+        if state != self._current_state:
             self._state_machine[self._current_state].on_exit()
+            self._current_state = state
+            self._state_machine[state].on_entry()
+
+    def stop(self):
+        self.dispatcher.stop()
+
+    def release_outputs(self):
+        """Let go of the tone and siren, for a machine whose area was removed"""
+        sensors.tone_generator.stop_constant_tone(self)
+        sensors.siren.deactivate_siren(self)
+
+    def post_event(self, event, data, block=True, timeout=None):
+        """Queue an event for the dispatcher. Returns a Future of the resulting state"""
+        return self.dispatcher.submit(event, data, block, timeout)
+
+    # Only the dispatcher thread should call this once the dispatcher is running
+    def process_event(self, event, data):
+        start = time.perf_counter()
+        old_state = self._current_state
+        new_state = self._state_machine[old_state].process_event(event, data)
+
+        if old_state != new_state:
+            self._state_machine[old_state].on_exit()
             self._state_machine[new_state].on_entry()
             self._current_state = new_state
-
+            metrics.increment('alarm_transitions_total', area=self.name, source=old_state.name, target=new_state.name)
+            eventstream.event_broadcaster.publish('state', {'state': new_state.name,
+                                                            'previous_state': old_state.name,
+                                                            'event': event.name,
+                                                            'area': self.name})
+
+        if self.journal is not None:
+            self.journal.record(event, data, self._current_state, self.arm_configurations.current_configuration,
+                                self.name)
+
+        metrics.observe('alarm_process_event_seconds', time.perf_counter() - start,
+                        area=self.name, event=event.name, state=old_state.name)
         return self._current_state
 
     @staticmethod
@@ -195,6 +356,79 @@ class AlarmStateMachine:
             return False
 
 
-alarm_state_machine = AlarmStateMachine()
+class EventDispatcher(simplethread.SimpleThread):
+    MAX_QUEUE_DEPTH = 256
+    CONST_POLL_PERIOD_s = 0.5
+
+    def __init__(self, state_machine):
+        simplethread.SimpleThread.__init__(self)
+        self._state_machine = state_machine
+        self._queue = queue.Queue(self.MAX_QUEUE_DEPTH)
+
+        self._metrics_lock = threading.Lock()
+        self._max_queue_depth = 0
+        self._dispatched = 0
+        self._rejected = 0
+        self._total_latency_s = 0.0
+        self._max_latency_s = 0.0
+
+    def submit(self, event, data, block=True, timeout=None):
+        future = Future()
+        try:
+            self._queue.put((event, data, future, time.perf_counter()), block, timeout)
+        except queue.Full:
+            with self._metrics_lock:
+                self._rejected += 1
+            logger.warning("Event queue full, rejecting %s", event.name)
+            raise
+
+        depth = self._queue.qsize()
+        if depth > self._max_queue_depth:
+            with self._metrics_lock:
+                self._max_queue_depth = max(self._max_queue_depth, depth)
+        return future
+
+    def thread_loop(self):
+        while self._running is True:
+            try:
+                event, data, future, enqueued = self._queue.get(timeout=self.CONST_POLL_PERIOD_s)
+            except queue.Empty:
+                continue
+
+            if not future.set_running_or_notify_cancel():
+                self._queue.task_done()
+                continue
+
+            try:
+                future.set_result(self._state_machine.process_event(event, data))
+            except Exception as err:
+                logger.exception("Failed to process event %s", event.name)
+                future.set_exception(err)
+            self._queue.task_done()
+
+            latency_s = time.perf_counter() - enqueued
+            with self._metrics_lock:
+                self._dispatched += 1
+                self._total_latency_s += latency_s
+                self._max_latency_s = max(self._max_latency_s, latency_s)
+
+    def wait_until_idle(self):
+        """Block until every event queued so far has been processed"""
+        self._queue.join()
+
+    def get_metrics(self):
+        with self._metrics_lock:
+            average_s = self._total_latency_s / self._dispatched if self._dispatched else 0.0
+            return {'queue_depth': self._queue.qsize(),
+                    'max_queue_depth': self._max_queue_depth,
+                    'dispatched': self._dispatched,
+                    'rejected': self._rejected,
+                    'average_latency_ms': average_s * 1000,
+                    'max_latency_ms': self._max_latency_s * 1000}
+
+
 arm_configurations = ArmConfigurations()
+alarm_state_machine = AlarmStateMachine()
+area_machines = {DEFAULT_AREA: alarm_state_machine}
+area_index = {}
 alert_timeout_s = 30
@@ -1,30 +1,84 @@
 # Install the following packages with pip to use this script:
 #   - requests (konnected needs this)
+#   - aiohttp (konnected.aio needs this)
 #   - flask
 #   - flask-restful
+#   - numpy (analytics needs this)
 
 
-from flask import Flask
+from flask import Flask, g, request
 from flask_restful import Api
-import configparser
 import logging
 import argparse
+import os
+import subprocess
+import sys
+import time
 
 import panelhandler
 import alarmstates
+import analytics
+import configstore
+import eventstream
+import history
+import journal
 import sensors
 import konnected_server
+import metrics
+import sensorevents
+import stateowner
+import timerwheel
 
 logging.basicConfig(level=logging.INFO)
 
 
 class AlarmSystem:
     def __init__(self, config_file='config.ini'):
-        config = configparser.ConfigParser()
-        config.read(config_file)
+        config = configstore.config_store.load(config_file)
+        configstore.config_store.add_listener('door_chime', sensors.tone_generator.load_chime_parameters_from_config)
+        configstore.config_store.add_listener('alert', alarmstates.load_alert_configuration)
 
         sensors.load_sensors(config)
+        for sensor_id, result in sensors.initialize_sensor_hardware(config).items():
+            logging.info("Sensor %s hardware %s", sensor_id, result)
+
         alarmstates.load_state_configurations(config)
+        sensorevents.sensor_event_filter.load_from_config(config)
+        analytics.zone_analytics.load_from_config(config)
+        self.restore_from_journal(config)
+        self.open_history(config)
+        alarmstates.start_areas()
+
+    @staticmethod
+    def restore_from_journal(config):
+        journal.event_journal.load_from_config(config)
+        if not journal.event_journal.is_enabled():
+            return
+
+        journal.event_journal.restore()
+        for area, last_entry in journal.event_journal.last_entries().items():
+            # Entries from before areas were configured belong to the first area
+            machine = alarmstates.get_area(None if area == alarmstates.DEFAULT_AREA else area)
+            if machine is None:
+                logging.warning("Not restoring journaled state of area %s, which is no longer configured", area)
+                continue
+
+            logging.info("Restoring area %s to state %s (arm config '%s') from journal",
+                         machine.name, last_entry['state'], last_entry['arm_configuration'])
+            machine.restore(alarmstates.StateType[last_entry['state']], last_entry['arm_configuration'])
+
+        for machine in alarmstates.area_machines.values():
+            machine.journal = journal.event_journal
+        journal.event_journal.start()
+
+    @staticmethod
+    def open_history(config):
+        history.zone_history.load_from_config(config)
+        if not history.zone_history.is_enabled():
+            return
+
+        history.zone_history.open()
+        history.zone_history.start()
 
 
 app = Flask(__name__)
@@ -32,12 +86,48 @@ api = Api(app)
 
 api.add_resource(panelhandler.PanelHandler, '/state')
 api.add_resource(konnected_server.SensorsHandler, '/device/<sensor_id>')
+api.add_resource(konnected_server.SensorsBatchHandler, '/device/<sensor_id>/batch')
+api.add_resource(konnected_server.SensorEventsHandler, '/sensor_events')
+api.add_resource(konnected_server.SensorLivenessHandler, '/sensor_liveness')
+api.add_resource(panelhandler.MetricsHandler, '/metrics')
 api.add_resource(panelhandler.SettingsHandler, '/configuration')
+api.add_resource(panelhandler.ReloadHandler, '/configuration/reload')
+api.add_resource(panelhandler.AnalyticsHandler, '/analytics')
+api.add_resource(panelhandler.DispatcherHandler, '/state/dispatcher')
+api.add_resource(panelhandler.StateEventsHandler, '/state/events')
+api.add_resource(panelhandler.HistoryHandler, '/history')
+api.add_resource(panelhandler.RecentHistoryHandler, '/history/recent')
+
+metrics.registry.add_collector(alarmstates.get_dispatcher_metrics, 'alarm_dispatcher_', 'area')
+metrics.registry.add_collector(sensorevents.sensor_event_filter.get_metrics, 'sensor_events_')
+metrics.registry.add_collector(sensors.get_liveness_counts, 'sensors_')
+metrics.registry.add_collector(eventstream.event_broadcaster.get_metrics, 'event_stream_')
+metrics.registry.add_collector(timerwheel.timer_wheel.get_metrics, 'timer_wheel_')
+metrics.registry.add_collector(history.zone_history.get_metrics, 'history_')
+metrics.registry.add_collector(analytics.zone_analytics.get_metrics, 'analytics_')
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    endpoint = request.endpoint or 'unknown'
+    metrics.observe('http_request_seconds', time.perf_counter() - g.request_start,
+                    endpoint=endpoint, method=request.method)
+    metrics.increment('http_requests_total', endpoint=endpoint, method=request.method,
+                      status=response.status_code)
+    return response
+
 
 config_filename = 'config.ini'
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--config')
+parser.add_argument('--workers', type=int, default=0,
+                    help='serve HTTP from this many worker processes, with this process owning the state')
 args, extra_args = parser.parse_known_args()
 
 if args.config:
@@ -46,8 +136,39 @@ logging.info("Using %s as the configuration file", config_filename)
 
 alarm_system = AlarmSystem(config_filename)
 
+
+def serve_with_workers(workers):
+    """Keep the alarm in this process and serve HTTP from worker processes"""
+    server_config = configstore.config_store.get_config()['server']
+    socket_path = server_config.get('state_socket', stateowner.DEFAULT_SOCKET_PATH)
+    port = server_config.get('port', '5000')
+
+    owner = stateowner.StateOwner(app, socket_path)
+    owner.start()
+
+    worker_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'workerapp.py')
+    processes = [subprocess.Popen([sys.executable, worker_script, '--host', '0.0.0.0', '--port', port,
+                                   '--state-socket', socket_path])
+                 for _ in range(workers)]
+    logging.info("Serving on port %s from %d workers, state socket %s", port, workers, socket_path)
+
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+        owner.stop()
+
+
 if __name__ == '__main__':
-    logging.info("Running standalone server")
-    app.run(host="0.0.0.0", debug=True)
+    if args.workers > 0:
+        serve_with_workers(args.workers)
+    else:
+        logging.info("Running standalone server")
+        app.run(host="0.0.0.0", debug=True)
 
 
@@ -0,0 +1,324 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy
+
+import clocks
+import history
+import sensors
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_DAY = 24
+
+
+class ActivitySummary:
+    """Per zone arrays summarizing a stretch of history"""
+    __slots__ = ('flap_s', 'zones', 'opens', 'open_s', 'flaps', 'first_time', 'first_state', 'last_time',
+                 'last_state', 'hour_cells', 'hour_opens')
+    # Saved columns, after the header line. zones isn't saved: a saved summary names its zones in the header
+    COLUMNS = (('opens', numpy.uint32), ('open_s', numpy.float64), ('flaps', numpy.uint32),
+               ('first_time', numpy.float64), ('first_state', numpy.bool_), ('last_time', numpy.float64),
+               ('last_state', numpy.bool_))
+    # Summaries saved by an older version are summarized again
+    VERSION = 1
+
+    def __init__(self, flap_s):
+        self.flap_s = flap_s
+
+    @classmethod
+    def of_events(cls, zones, times, states, hours, flap_s):
+        """Summarize events given as columns with one entry per event, in time order"""
+        summary = cls(flap_s)
+        # A stable sort by zone puts each zone's events together, still in time order
+        order = numpy.argsort(zones, kind='stable')
+        zones, times, states, hours = zones[order], times[order], states[order], hours[order]
+
+        new_zone = numpy.empty(len(zones), dtype=bool)
+        new_zone[:1] = True
+        numpy.not_equal(zones[1:], zones[:-1], out=new_zone[1:])
+        first = numpy.flatnonzero(new_zone)
+        last = numpy.append(first[1:], len(zones)) - 1
+        # Which of the summary's zones each event belongs to
+        run = numpy.cumsum(new_zone) - 1
+
+        summary.zones = zones[first]
+        summary.opens = numpy.add.reduceat(states, first, dtype=numpy.uint32)
+        summary.first_time = times[first]
+        summary.first_state = states[first]
+        summary.last_time = times[last]
+        summary.last_state = states[last]
+
+        # An open followed by a close of the same zone is one opening, lasting the time between them
+        closed = ~new_zone[1:] & states[:-1] & ~states[1:]
+        durations = times[1:][closed] - times[:-1][closed]
+        closed_run = run[1:][closed]
+        summary.open_s = numpy.bincount(closed_run, weights=durations, minlength=len(first))
+        summary.flaps = numpy.bincount(closed_run[durations < flap_s], minlength=len(first)).astype(numpy.uint32)
+
+        summary.hour_cells, summary.hour_opens = numpy.unique(zones[states] * HOURS_PER_DAY + hours[states],
+                                                              return_counts=True)
+        return summary
+
+    def save(self, path, zone_keys, first_partition):
+        """Save the summary with zones named by (sensor_id, zone)"""
+        order = numpy.argsort(self.zones)
+        positions = order[numpy.searchsorted(self.zones, self.hour_cells // HOURS_PER_DAY, sorter=order)]
+        # Queries and the history writer can both save a day, so each writes its own temporary file
+        temporary_path = '{}.{}.tmp'.format(path, threading.get_ident())
+        with open(temporary_path, 'wb') as summary_file:
+            header = {'version': self.VERSION, 'flap_s': self.flap_s, 'first_partition': first_partition,
+                      'zones': [list(zone_keys[zone_id]) for zone_id in self.zones.tolist()],
+                      'cells': len(self.hour_cells)}
+            summary_file.write(json.dumps(header).encode() + b'\n')
+            for name, dtype in self.COLUMNS:
+                getattr(self, name).astype(dtype, copy=False).tofile(summary_file)
+            (positions * HOURS_PER_DAY + self.hour_cells % HOURS_PER_DAY).astype(numpy.int64).tofile(summary_file)
+            self.hour_opens.astype(numpy.int64).tofile(summary_file)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """(zone_keys, first_partition, summary) saved at path, or None if the format is old"""
+        with open(path, 'rb') as summary_file:
+            header = json.loads(summary_file.readline())
+            if header.get('version') != cls.VERSION:
+                return None
+            summary = cls(header['flap_s'])
+            zone_keys = [(sensor_id, zone) for sensor_id, zone in header['zones']]
+            summary.zones = numpy.arange(len(zone_keys))
+            for name, dtype in cls.COLUMNS:
+                setattr(summary, name, numpy.fromfile(summary_file, dtype, len(zone_keys)))
+            summary.hour_cells = numpy.fromfile(summary_file, numpy.int64, header['cells'])
+            summary.hour_opens = numpy.fromfile(summary_file, numpy.int64, header['cells'])
+        return zone_keys, header['first_partition'], summary
+
+    def renumber(self, zone_ids):
+        """Replace zone id n by zone_ids[n]"""
+        self.zones = zone_ids[self.zones]
+        self.hour_cells = zone_ids[self.hour_cells // HOURS_PER_DAY] * HOURS_PER_DAY + self.hour_cells % HOURS_PER_DAY
+
+
+class ZoneAnalytics:
+    """Per zone open counts, open time, hours of day and flaps, summarized a day at a time"""
+    CONST_DAY_s = 86400
+    SUMMARY_PATTERN = 'analytics-*.sum'
+
+    def __init__(self, zone_history, flap_s=2.0):
+        self.zone_history = zone_history
+        self.flap_s = flap_s
+        zone_history.add_seal_listener(self.partition_sealed)
+
+        # Guards the zone ids and the summaries kept in memory. Reading and summarizing partitions is done
+        # without it, so queries don't wait on each other's file reads
+        self._lock = threading.Lock()
+        self._zone_keys = []
+        self._zone_ids = {}
+        # Day start: (oldest partition summarized, ActivitySummary)
+        self._summaries = {}
+
+    def load_from_config(self, config):
+        flap_s = config.getfloat('analytics', 'flap_ms', fallback=self.flap_s * 1000) / 1000
+        with self._lock:
+            if flap_s != self.flap_s:
+                self.flap_s = flap_s
+                self._summaries.clear()
+
+    def zone_statistics(self, start=None, end=None, sensor_id=None, zone=None):
+        """Statistics for each zone with events in start <= time < end, ordered by sensor and zone"""
+        start = float('-inf') if start is None else start
+        end = float('inf') if end is None else end
+        if self.zone_history.is_enabled():
+            summaries = self._stored_summaries(start, end)
+        else:
+            summaries = [self._recent_summary(start, end)]
+        return self._combine([summary for summary in summaries if summary is not None], end, sensor_id, zone)
+
+    def partition_sealed(self, partition):
+        """Summarize and save a day once the history has moved past it"""
+        day = partition // self.CONST_DAY_s * self.CONST_DAY_s
+        partitions = self.zone_history.partitions()
+        if partitions[-1] < day + self.CONST_DAY_s:
+            return
+        self._day_summary(day, [other for other in partitions if day <= other < day + self.CONST_DAY_s])
+
+        oldest_day = partitions[0] // self.CONST_DAY_s * self.CONST_DAY_s
+        for path in glob.glob(os.path.join(self.zone_history.path, self.SUMMARY_PATTERN)):
+            if int(os.path.basename(path)[len('analytics-'):-len('.sum')]) < oldest_day:
+                os.remove(path)
+
+    def get_metrics(self):
+        with self._lock:
+            return {'zones': len(self._zone_keys),
+                    'cached_days': len(self._summaries)}
+
+    def _stored_summaries(self, start, end):
+        partition_s = self.zone_history.CONST_PARTITION_s
+        partitions = self.zone_history.partitions()
+        if not partitions:
+            return []
+        # Partitions that retention deleted invalidate the days summarized with them
+        with self._lock:
+            for day in [day for day, (first, _) in self._summaries.items() if first < partitions[0]]:
+                del self._summaries[day]
+
+        days = {}
+        for partition in partitions:
+            if start < partition + partition_s and partition < end:
+                days.setdefault(partition // self.CONST_DAY_s * self.CONST_DAY_s, []).append(partition)
+
+        summaries = []
+        for day, day_partitions in days.items():
+            # Only the newest partition can still change
+            if start <= day and day + self.CONST_DAY_s <= min(end, partitions[-1]):
+                summaries.append(self._day_summary(day, day_partitions))
+            else:
+                summaries.append(self._summarize_partitions(day_partitions, start, end))
+        return summaries
+
+    def _day_summary(self, day, partitions):
+        """The summary of a day that is over, from memory, from its saved summary or from its partitions"""
+        with self._lock:
+            first, summary = self._summaries.get(day, (None, None))
+            flap_s = self.flap_s
+        if summary is not None and first == partitions[0] and summary.flap_s == flap_s:
+            return summary
+
+        summary_path = self._summary_path(day)
+        saved = ActivitySummary.load(summary_path) if os.path.exists(summary_path) else None
+        if saved is not None and saved[1] == partitions[0] and saved[2].flap_s == flap_s:
+            zone_keys, _, summary = saved
+            summary.renumber(self._global_ids(zone_keys))
+        else:
+            summary = self._summarize_partitions(partitions, float('-inf'), float('inf'))
+            if summary is None:
+                return None
+            with self._lock:
+                zone_keys = list(self._zone_keys)
+            summary.save(summary_path, zone_keys, partitions[0])
+
+        with self._lock:
+            self._summaries[day] = (partitions[0], summary)
+        return summary
+
+    def _summarize_partitions(self, partitions, start, end):
+        times, states, zones, hours = [], [], [], []
+        for partition in partitions:
+            columns = self.zone_history.columns(partition)
+            if columns is None:
+                continue
+            zone_keys, partition_times, zone_ids, partition_states = columns
+            partition_times = numpy.frombuffer(partition_times, dtype=numpy.float64)
+            times.append(partition_times)
+            states.append(numpy.frombuffer(partition_states, dtype=numpy.bool_))
+            zones.append(self._global_ids(zone_keys)[numpy.frombuffer(zone_ids, dtype=numpy.uint32)])
+            hours.append(self._hours(partition_times, partition))
+        if not times:
+            return None
+
+        times, states, zones, hours = (numpy.concatenate(column) for column in (times, states, zones, hours))
+        in_range = (times >= start) & (times < end)
+        if not in_range.all():
+            times, states, zones, hours = times[in_range], states[in_range], zones[in_range], hours[in_range]
+        if not len(times):
+            return None
+        return ActivitySummary.of_events(zones, times, states, hours, self.flap_s)
+
+    def _recent_summary(self, start, end):
+        events = [event for event in reversed(self.zone_history.recent()) if start <= event['time'] < end]
+        if not events:
+            return None
+
+        times = numpy.array([event['time'] for event in events], dtype=numpy.float64)
+        states = numpy.array([bool(event['state']) for event in events], dtype=numpy.bool_)
+        zones = self._global_ids([(event['sensor_id'], event['zone']) for event in events])
+        return ActivitySummary.of_events(zones, times, states, self._hours(times, times[-1]), self.flap_s)
+
+    def _combine(self, summaries, end, sensor_id, zone):
+        if not summaries:
+            return []
+        with self._lock:
+            zone_keys = list(self._zone_keys)
+        zone_count = len(zone_keys)
+
+        zones = numpy.concatenate([summary.zones for summary in summaries])
+
+        def total(field, dtype):
+            return numpy.bincount(zones, weights=numpy.concatenate([getattr(summary, field) for summary in summaries]),
+                                  minlength=zone_count).astype(dtype)
+        has_events = numpy.zeros(zone_count, dtype=bool)
+        has_events[zones] = True
+        opens = total('opens', numpy.int64)
+        open_s = total('open_s', numpy.float64)
+        flaps = total('flaps', numpy.int64)
+        opens_by_hour = numpy.bincount(numpy.concatenate([summary.hour_cells for summary in summaries]),
+                                       weights=numpy.concatenate([summary.hour_opens for summary in summaries]),
+                                       minlength=zone_count * HOURS_PER_DAY)
+        opens_by_hour = opens_by_hour.astype(numpy.int64).reshape(zone_count, HOURS_PER_DAY)
+
+        # Pair openings left open at the end of one summary with their zone's first event in a later one
+        open_since = numpy.full(zone_count, numpy.nan)
+        for summary in summaries:
+            since = open_since[summary.zones]
+            closed = ~numpy.isnan(since) & ~summary.first_state
+            if closed.any():
+                durations = summary.first_time[closed] - since[closed]
+                numpy.add.at(open_s, summary.zones[closed], durations)
+                numpy.add.at(flaps, summary.zones[closed], durations < self.flap_s)
+            open_since[summary.zones] = numpy.where(summary.last_state, summary.last_time, numpy.nan)
+
+        still_open = ~numpy.isnan(open_since)
+        open_s[still_open] += numpy.maximum(min(end, clocks.clock.time()) - open_since[still_open], 0)
+
+        statistics = []
+        for zone_id in numpy.flatnonzero(has_events):
+            key = zone_keys[zone_id]
+            if (sensor_id is not None and key[0] != sensor_id) or (zone is not None and key[1] != zone):
+                continue
+            zone_opens = int(opens[zone_id])
+            statistics.append({'sensor_id': key[0],
+                               'zone': key[1],
+                               'name': _zone_name(*key),
+                               'opens': zone_opens,
+                               'open_s': float(open_s[zone_id]),
+                               'flaps': int(flaps[zone_id]),
+                               'flap_rate': int(flaps[zone_id]) / zone_opens if zone_opens else 0.0,
+                               'peak_hour': int(opens_by_hour[zone_id].argmax()) if zone_opens else None,
+                               'opens_by_hour': opens_by_hour[zone_id].tolist()})
+        statistics.sort(key=lambda entry: (entry['sensor_id'], entry['zone']))
+        return statistics
+
+    def _global_ids(self, zone_keys):
+        with self._lock:
+            return numpy.array([self._zone_id(key) for key in zone_keys], dtype=numpy.intp)
+
+    def _summary_path(self, day):
+        return os.path.join(self.zone_history.path, 'analytics-{:d}.sum'.format(int(day)))
+
+    # Called with _lock held
+    def _zone_id(self, key):
+        zone_id = self._zone_ids.get(key)
+        if zone_id is None:
+            zone_id = self._zone_ids[key] = len(self._zone_keys)
+            self._zone_keys.append(key)
+        return zone_id
+
+    @staticmethod
+    def _hours(times, at):
+        """Local hour of day of each time, using the UTC offset in force at time at"""
+        offset_s = time.localtime(at).tm_gmtoff
+        return ((times + offset_s) // 3600 % HOURS_PER_DAY).astype(numpy.intp)
+
+
+def _zone_name(sensor_id, zone_number):
+    sensor = sensors.sensor_list.get(sensor_id)
+    if sensor is None or zone_number not in sensor.zones:
+        return ''
+    return sensor.zones[zone_number].name
+
+
+zone_analytics = ZoneAnalytics(history.zone_history)
@@ -0,0 +1,62 @@
+# Compares actuation latency of the pooled konnected.Client against one new connection per call,
+# using a simulated board
+# Run from the repository root:
+#   python -m benchmark.actuation_pool --iterations 500
+
+import argparse
+import statistics
+import time
+
+import requests
+
+import konnected
+import konnected_simulator
+
+
+def time_calls(func, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    print("{:<10} mean {:8.3f} ms   median {:8.3f} ms   p99 {:8.3f} ms".format(
+        name, statistics.mean(samples) * 1000, statistics.median(samples) * 1000, p99 * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=500)
+    args = parser.parse_args()
+
+    board = konnected_simulator.VirtualBoard('000000000001', outputs=[1])
+    simulator = konnected_simulator.Simulator([board])
+    simulator.start()
+
+    url = 'http://{}:{}/device'.format(board.host, board.port)
+    client = konnected.Client(board.host, str(board.port))
+
+    def unpooled():
+        requests.put(url, json={'pin': 1, 'state': 1}, timeout=konnected.DEFAULT_TIMEOUT_S).json()
+
+    def pooled():
+        client.put_device(1, 1)
+
+    # Warm up both paths so the first connection setup isn't counted against the pool
+    unpooled()
+    pooled()
+
+    report('unpooled', time_calls(unpooled, args.iterations))
+    report('pooled', time_calls(pooled, args.iterations))
+
+    konnected.close_sessions()
+    simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+# Fills a zone history store with a year of door traffic for a large install, saving each day's summary as the
+# history moves on to the next, then times the per zone analytics over the whole year: the first query after a
+# restart, which reads the saved summaries, the queries after it, which reuse them from memory, the first query
+# with no saved summaries, which reads and summarizes every partition, and, for comparison, the same open counts
+# and open time added up event by event in Python.
+# Run from the repository root:
+#   python -m benchmark.analytics --sensors 25 --zones 8 --opens 12 --days 365
+
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+import time
+
+import numpy
+
+import clocks
+
+clock = clocks.use_virtual_clock()
+
+import analytics
+import history
+from benchmark import harness
+
+DAY_S = 86400
+
+
+def build_traffic(sensor_count, zone_count, opens_per_day, days, rng):
+    """Time ordered (time_s, sensor index, zone, state) columns of random zone traffic"""
+    times, keys, states = [], [], []
+    for key in range(sensor_count * zone_count):
+        count = rng.poisson(opens_per_day * days)
+        durations = numpy.where(rng.random(count) < 0.05, rng.uniform(0.05, 1, count), rng.exponential(60, count))
+        gaps = rng.exponential(DAY_S / opens_per_day, count)
+        opened = numpy.cumsum(gaps + numpy.concatenate(([0], durations[:-1])))
+        keep = opened + durations < days * DAY_S
+        times.extend((opened[keep], opened[keep] + durations[keep]))
+        keys.extend((numpy.full(keep.sum(), key),) * 2)
+        states.extend((numpy.ones(keep.sum(), dtype=bool), numpy.zeros(keep.sum(), dtype=bool)))
+
+    times, keys, states = numpy.concatenate(times), numpy.concatenate(keys), numpy.concatenate(states)
+    order = numpy.argsort(times, kind='stable')
+    return times[order], keys[order] // zone_count, keys[order] % zone_count + 1, states[order]
+
+
+def fill(zone_history, sensors, traffic):
+    start_time = clock.time()
+    start = time.perf_counter()
+    for time_s, sensor, zone, state in zip(*(column.tolist() for column in traffic)):
+        clock.advance_to(clock.monotonic() + start_time + time_s - clock.time())
+        zone_history.record(sensors[sensor], zone, 'Zone', state)
+    zone_history.stop()
+    return len(traffic[0]) / (time.perf_counter() - start)
+
+
+def python_totals(zone_history):
+    """Open counts and open time per zone, event by event"""
+    opens, open_s, opened_at = {}, {}, {}
+    for partition in zone_history.partitions():
+        zone_keys, times, zone_ids, states = zone_history.columns(partition)
+        for event_time, zone_id, state in zip(times, zone_ids, states):
+            key = zone_keys[zone_id]
+            if state:
+                opens[key] = opens.get(key, 0) + 1
+                opened_at[key] = event_time
+            elif key in opened_at:
+                open_s[key] = open_s.get(key, 0) + event_time - opened_at.pop(key)
+    return opens, open_s
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sensors', type=int, default=25)
+    parser.add_argument('--zones', type=int, default=8, help='zones per sensor')
+    parser.add_argument('--opens', type=float, default=12, help='openings per zone per day')
+    parser.add_argument('--days', type=float, default=365)
+    parser.add_argument('--repeat', type=int, default=20)
+    args, _ = parser.parse_known_args()
+    rng = numpy.random.default_rng(1)
+    sensors = ['{:012d}'.format(100000000000 + index) for index in range(args.sensors)]
+
+    zone_history = history.ZoneHistory()
+    zone_history.path = tempfile.mkdtemp()
+    zone_history.commit_interval_s = 0
+    zone_history.open()
+    zone_history.start()
+    analytics.ZoneAnalytics(zone_history)
+    traffic = build_traffic(args.sensors, args.zones, args.opens, args.days, rng)
+    rate = fill(zone_history, sensors, traffic)
+    print("stored {:,} events for {} zones over {:g} days in {} partitions at {:,.0f} events/s".format(
+        len(traffic[0]), args.sensors * args.zones, args.days, len(zone_history.partitions()), rate))
+
+    # A new ZoneAnalytics starts with nothing in memory, as after a restart
+    zone_analytics = analytics.ZoneAnalytics(zone_history)
+    start = time.perf_counter()
+    statistics = zone_analytics.zone_statistics()
+    restart_ms = (time.perf_counter() - start) * 1000
+
+    samples = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        zone_analytics.zone_statistics()
+        samples.append(time.perf_counter() - start)
+    summary = harness.summarize(samples)
+
+    for path in glob.glob(os.path.join(zone_history.path, analytics.ZoneAnalytics.SUMMARY_PATTERN)):
+        os.remove(path)
+    start = time.perf_counter()
+    assert analytics.ZoneAnalytics(zone_history).zone_statistics() == statistics
+    unsaved_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    opens, open_s = python_totals(zone_history)
+    python_ms = (time.perf_counter() - start) * 1000
+    assert all(entry['opens'] == opens[(entry['sensor_id'], entry['zone'])] for entry in statistics)
+    assert all(abs(entry['open_s'] - open_s[(entry['sensor_id'], entry['zone'])]) < 1e-3 for entry in statistics)
+
+    print("{:<40} {:>10}".format('every zone, whole range', 'ms'))
+    print("{:<40} {:>10.1f}".format('first query after a restart', restart_ms))
+    print("{:<40} {:>10.1f}".format('later queries, median', summary['median_ms']))
+    print("{:<40} {:>10.1f}".format('later queries, p99', summary['p99_ms']))
+    print("{:<40} {:>10.1f}".format('first query, no saved summaries', unsaved_ms))
+    print("{:<40} {:>10.1f}".format('event by event in Python (opens, time)', python_ms))
+    flaps = sum(entry['flaps'] for entry in statistics)
+    print("{:,} openings, {:,} flaps ({:.1%})".format(sum(opens.values()), flaps, flaps / max(1, sum(opens.values()))))
+
+    shutil.rmtree(zone_history.path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import configparser
+
+
+def build_config(num_sensors=1, zones_per_sensor=4, pins_per_zone=2, ip='127.0.0.1', port=1):
+    """Generate a config in the same layout as config.ini, with every input pin assigned to a zone.
+    Pin 1 of each sensor is an output (the chime on the first sensor) so inputs start at 2 like the
+    shipped config, and the first sensor's last pin is the siren.
+    The boards default to a port nothing listens on so heartbeats fail fast"""
+    config = configparser.ConfigParser()
+    config['server'] = {'token': 'secureToken', 'url': '127.0.0.1', 'port': '5000'}
+    config['door_chime'] = {'num_beeps': '3', 'beep_duration_ms': '200', 'pause_duration_ms': '50'}
+    config['alert'] = {'duration_s': '30'}
+
+    sensor_ids = ['{:012d}'.format(100000000000 + index) for index in range(num_sensors)]
+    config['sensors'] = {'sensors': ','.join(sensor_ids)}
+
+    for index, sensor_id in enumerate(sensor_ids):
+        section = {'ip': ip, 'port': str(port), 'zones': str(zones_per_sensor), 'pin1': 'output',
+                   'pin1_name': 'Chime' if index == 0 else 'Spare'}
+        pin_number = 2
+        for zone in range(1, zones_per_sensor + 1):
+            section['zone{}_name'.format(zone)] = 'Zone {}'.format(zone)
+            for _ in range(pins_per_zone):
+                section['pin{}'.format(pin_number)] = 'input'
+                section['pin{}_zone'.format(pin_number)] = str(zone)
+                pin_number += 1
+        if index == 0:
+            section['pin{}'.format(pin_number)] = 'output'
+            section['pin{}_name'.format(pin_number)] = 'Siren'
+            pin_number += 1
+        section['pins'] = str(pin_number - 1)
+        config[sensor_id] = section
+
+    zones = ','.join(str(zone) for zone in range(1, zones_per_sensor + 1))
+    config['arm_configs'] = {'configurations': 'Away'}
+    config['Away'] = {'sensors': ','.join(sensor_ids)}
+    for sensor_id in sensor_ids:
+        config['Away'][sensor_id + '_zones'] = zones
+
+    return config
@@ -0,0 +1,112 @@
+# Measures how many concurrent /state/events subscribers one process can keep up to date
+# Every subscriber is a real streaming HTTP connection to a threaded werkzeug server; each count is run
+# with events published at --rate, and reports how many subscribers received every event and how long
+# delivery took from publish() to the client having parsed the event.
+# Run from the repository root:
+#   python -m benchmark.event_stream --subscribers 10,100,500,1000 --events 200 --rate 50
+
+import argparse
+import asyncio
+import json
+import logging
+import threading
+import time
+
+import aiohttp
+from flask import Flask
+from flask_restful import Api
+from werkzeug.serving import make_server
+
+import eventstream
+import panelhandler
+from benchmark import harness
+
+CONNECT_TIMEOUT_S = 30
+
+
+def start_server():
+    app = Flask(__name__)
+    api = Api(app)
+    api.add_resource(panelhandler.StateEventsHandler, '/state/events')
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def subscribe(session, url, events, latencies):
+    received = 0
+    async with session.get(url) as response:
+        async for line in response.content:
+            if not line.startswith(b'data: '):
+                continue
+            data = json.loads(line[len(b'data: '):])
+            if 'sent' in data:
+                latencies.append(time.perf_counter() - data['sent'])
+                received += 1
+                if received == events:
+                    break
+    return received
+
+
+async def wait_for_subscribers(count):
+    deadline = time.monotonic() + CONNECT_TIMEOUT_S
+    while eventstream.event_broadcaster.get_metrics()['subscribers'] != count:
+        if time.monotonic() > deadline:
+            raise RuntimeError("Only {} of {} subscribers connected".format(
+                eventstream.event_broadcaster.get_metrics()['subscribers'], count))
+        await asyncio.sleep(0.01)
+
+
+async def run(url, subscribers, events, rate):
+    latencies = []
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=None)) as session:
+        tasks = [asyncio.ensure_future(subscribe(session, url, events, latencies)) for _ in range(subscribers)]
+        await wait_for_subscribers(subscribers)
+        dropped_before = eventstream.event_broadcaster.get_metrics()['dropped_subscribers']
+
+        start = time.perf_counter()
+        for sequence in range(events):
+            eventstream.event_broadcaster.publish('state', {'sequence': sequence, 'sent': time.perf_counter()})
+            await asyncio.sleep(1 / rate)
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        elapsed = time.perf_counter() - start
+
+    complete = sum(1 for received in results if received == events)
+    dropped = eventstream.event_broadcaster.get_metrics()['dropped_subscribers'] - dropped_before
+    return {'subscribers': subscribers,
+            'complete': complete,
+            'dropped': dropped,
+            'deliveries_per_s': len(latencies) / elapsed,
+            'latency': harness.summarize(latencies) if latencies else None}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--subscribers', default='10,100,500,1000', help='comma separated subscriber counts')
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=50, help='events published per second')
+    args, _ = parser.parse_known_args()
+
+    # Idle streams notice closed clients on their next keepalive, so keep it short between runs
+    panelhandler.EVENT_STREAM_KEEPALIVE_S = 0.5
+    server = start_server()
+    url = 'http://127.0.0.1:{}/state/events'.format(server.server_port)
+
+    for subscribers in [int(count) for count in args.subscribers.split(',')]:
+        result = asyncio.run(run(url, subscribers, args.events, args.rate))
+        latency = result['latency'] or {'median_ms': float('nan'), 'p99_ms': float('nan')}
+        print("{:>6} subscribers  {:>6} complete  {:>4} dropped  {:10.0f} deliveries/s  "
+              "median {:7.2f} ms  p99 {:7.2f} ms".format(
+                  subscribers, result['complete'], result['dropped'], result['deliveries_per_s'],
+                  latency['median_ms'], latency['p99_ms']))
+        asyncio.run(wait_for_subscribers(0))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
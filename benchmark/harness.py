@@ -0,0 +1,50 @@
+import logging
+import os
+import statistics
+import sys
+import tempfile
+
+import alarmstates
+import sensors
+import timerwheel
+
+
+def load_alarm_system(config):
+    """Import alarmsystem (which builds the Flask app and AlarmSystem at import) against a generated config"""
+    with tempfile.NamedTemporaryFile('w', suffix='.ini', delete=False) as config_file:
+        config.write(config_file)
+
+    sys.argv = [sys.argv[0], '--config', config_file.name]
+    import alarmsystem
+    os.unlink(config_file.name)
+
+    # Keep per-request INFO logging out of the timings
+    logging.getLogger().setLevel(logging.WARNING)
+    return alarmsystem
+
+
+def shutdown():
+    alarmstates.stop_areas()
+    sensors.liveness_scheduler.stop()
+    timerwheel.timer_wheel.stop()
+    sensors.stop_hardware_initialization()
+    for sensor in sensors.sensor_list.values():
+        sensor.stop()
+
+
+def reset_sensors():
+    """Drop every loaded sensor (stopping its heartbeat and actuator queue) and forget the chime and siren"""
+    for sensor in sensors.sensor_list.values():
+        sensor.stop()
+    sensors.sensor_list.clear()
+    sensors.tone_generator.connect(None, 0)
+    sensors.siren.connect(None, 0)
+
+
+def summarize(samples_s):
+    samples = sorted(samples_s)
+    return {'samples': len(samples),
+            'mean_ms': statistics.mean(samples) * 1000,
+            'median_ms': statistics.median(samples) * 1000,
+            'p99_ms': samples[max(0, int(len(samples) * 0.99) - 1)] * 1000,
+            'max_ms': samples[-1] * 1000}
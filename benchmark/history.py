@@ -0,0 +1,109 @@
+# Fills a zone history store with generated events spread over weeks of (virtual) time, then times range
+# queries through the partition indexes against reading the logs through, as a query without them would
+# Run from the repository root:
+#   python -m benchmark.history --events 1000000 --days 30
+
+import argparse
+import glob
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import clocks
+
+clock = clocks.use_virtual_clock()
+
+import history
+from benchmark import harness
+
+SENSORS = ['{:012d}'.format(100000000000 + index) for index in range(20)]
+ZONES = 16
+
+
+def fill(zone_history, events, days, rng):
+    interval_s = days * 86400 / events
+    start = time.perf_counter()
+    for _ in range(events):
+        zone_history.record(rng.choice(SENSORS), rng.randint(1, ZONES), 'Zone', rng.random() < 0.5)
+        clock.advance(interval_s)
+    zone_history.stop()
+    return events / (time.perf_counter() - start)
+
+
+def time_query(zone_history, repeat, **query):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        events, _ = zone_history.query(**query)
+        samples.append(time.perf_counter() - start)
+    return harness.summarize(samples), len(events)
+
+
+def full_scan(path, start, end, sensor_id, zone, limit):
+    events = []
+    for log_path in sorted(glob.glob(os.path.join(path, 'zones-*.log'))):
+        with open(log_path, 'rb') as log_file:
+            for line in log_file:
+                event = json.loads(line)
+                if start <= event['time'] < end and event['sensor_id'] == sensor_id and event['zone'] == zone:
+                    events.append(event)
+                    if len(events) == limit:
+                        return events
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=1000000)
+    parser.add_argument('--days', type=float, default=30)
+    parser.add_argument('--repeat', type=int, default=20)
+    args, _ = parser.parse_known_args()
+    rng = random.Random(1)
+
+    zone_history = history.ZoneHistory()
+    zone_history.path = tempfile.mkdtemp()
+    zone_history.commit_interval_s = 0
+    zone_history.open()
+    zone_history.start()
+    first_time = clock.time()
+    rate = fill(zone_history, args.events, args.days, rng)
+    print("stored {:,} events over {:g} days in {} partitions at {:,.0f} events/s".format(
+        args.events, args.days, len(zone_history._partitions), rate))
+
+    # Indexes load on first use; the timings below are with them cached
+    middle = first_time + args.days * 86400 / 2
+    queries = [('one hour, every zone', {'start': middle, 'end': middle + 3600}),
+               ('one day, one sensor', {'start': middle, 'end': middle + 86400, 'sensor_id': SENSORS[3]}),
+               ('one day, one zone', {'start': middle, 'end': middle + 86400, 'sensor_id': SENSORS[3], 'zone': 7}),
+               ('whole range, one zone', {'sensor_id': SENSORS[3], 'zone': 7})]
+    print("{:<24} {:>7} {:>12} {:>10}".format('query (100 per page)', 'events', 'median ms', 'p99 ms'))
+    for name, query in queries:
+        zone_history.query(**query)
+        summary, count = time_query(zone_history, args.repeat, **query)
+        print("{:<24} {:>7} {:>12.3f} {:>10.3f}".format(name, count, summary['median_ms'], summary['p99_ms']))
+
+    start = time.perf_counter()
+    events = full_scan(zone_history.path, middle, middle + 86400, SENSORS[3], 7, 100)
+    print("{:<24} {:>7} {:>12.3f}".format('one day, one zone, scan', len(events),
+                                          (time.perf_counter() - start) * 1000))
+
+    # Walk every page of a day for one sensor to show paging cost stays flat
+    start = time.perf_counter()
+    pages = 0
+    cursor = None
+    while True:
+        _, cursor = zone_history.query(middle, middle + 86400, SENSORS[3], cursor=cursor)
+        pages += 1
+        if cursor is None:
+            break
+    print("paged one sensor's day in {} pages, {:.3f} ms per page".format(
+        pages, (time.perf_counter() - start) * 1000 / pages))
+
+    shutil.rmtree(zone_history.path)
+
+
+if __name__ == '__main__':
+    main()
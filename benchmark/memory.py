@@ -0,0 +1,64 @@
+# Measures the memory taken by the sensor/zone/pin graph and the cost of snapshotting every pin state
+# Run from the repository root:
+#   python -m benchmark.memory
+
+import argparse
+import gc
+import logging
+import time
+import tracemalloc
+
+import sensors
+from benchmark import harness
+from benchmark.configs import build_config
+
+# (sensors, zones per sensor, pins per zone)
+SIZES = [(10, 8, 2), (50, 8, 4), (200, 16, 4)]
+
+
+def measure(num_sensors, zones, pins_per_zone, iterations):
+    config = build_config(num_sensors, zones, pins_per_zone)
+    sensor_list = [sensors.Sensor(config[sensor_id]) for sensor_id in config['sensors']['sensors'].split(',')]
+
+    # Only the zones and pins are traced; the clients and queues each Sensor owns are the same size either way.
+    # tracemalloc sees every thread, so stop the heartbeats from allocating while it runs
+    sensors.liveness_scheduler.stop()
+    gc.collect()
+    tracemalloc.start()
+    for sensor in sensor_list:
+        sensor.load_zones_and_pins(config)
+    gc.collect()
+    graph_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        snapshot = {sensor.id: sensor.snapshot_pin_states() for sensor in sensor_list}
+    snapshot_s = (time.perf_counter() - start) / iterations
+
+    pins = sum(len(sensor.input_pins) + len(sensor.output_pins) for sensor in sensor_list)
+    for sensor in sensor_list:
+        sensor.stop()
+    sensors.tone_generator.connect(None, 0)
+    sensors.siren.connect(None, 0)
+
+    return {'sensors': num_sensors, 'pins': pins, 'graph_kb': graph_bytes / 1024,
+            'bytes_per_pin': graph_bytes / pins, 'snapshot_us': snapshot_s * 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=100)
+    args, _ = parser.parse_known_args()
+    logging.disable(logging.WARNING)
+
+    for num_sensors, zones, pins_per_zone in SIZES:
+        result = measure(num_sensors, zones, pins_per_zone, args.iterations)
+        print("{:>4} sensors {:>6} pins   {:9.1f} KiB   {:6.1f} bytes/pin   snapshot {:9.1f} us".format(
+            result['sensors'], result['pins'], result['graph_kb'], result['bytes_per_pin'], result['snapshot_us']))
+
+    harness.shutdown()
+
+
+if __name__ == '__main__':
+    main()
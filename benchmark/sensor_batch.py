@@ -0,0 +1,53 @@
+# Compares pin updates per second through the single-pin PUT /device/<sensor_id> path
+# against PUT /device/<sensor_id>/batch
+# Run from the repository root:
+#   python -m benchmark.sensor_batch --zones 8 --pins-per-zone 4 --rounds 200
+
+import argparse
+import time
+
+from benchmark import harness
+from benchmark.configs import build_config
+
+
+def run_single(client, sensor_id, pins, rounds):
+    start = time.perf_counter()
+    for round_number in range(rounds):
+        for pin in pins:
+            client.put('/device/' + sensor_id, json={'pin': pin, 'state': round_number % 2})
+    return time.perf_counter() - start
+
+
+def run_batch(client, sensor_id, pins, rounds):
+    start = time.perf_counter()
+    for round_number in range(rounds):
+        updates = [{'pin': pin, 'state': round_number % 2} for pin in pins]
+        client.put('/device/' + sensor_id + '/batch', json={'updates': updates})
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--zones', type=int, default=8)
+    parser.add_argument('--pins-per-zone', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=200)
+    args, _ = parser.parse_known_args()
+
+    config = build_config(1, args.zones, args.pins_per_zone)
+    alarmsystem = harness.load_alarm_system(config)
+
+    sensor_id = config['sensors']['sensors']
+    pins = list(range(2, 2 + args.zones * args.pins_per_zone))
+    updates = len(pins) * args.rounds
+    client = alarmsystem.app.test_client()
+
+    for name, run in (('single', run_single), ('batch', run_batch)):
+        elapsed = run(client, sensor_id, pins, args.rounds)
+        print("{:<8} {:8d} pin updates in {:7.3f} s   {:10.0f} updates/s".format(
+            name, updates, elapsed, updates / elapsed))
+
+    harness.shutdown()
+
+
+if __name__ == '__main__':
+    main()
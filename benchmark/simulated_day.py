@@ -0,0 +1,126 @@
+# Replays a day of sensor traffic and alarm escalations against a virtual clock and reports how long it took
+# Doors open and close at random through the day, the alarm is armed overnight and while everyone is out,
+# and some of the alerts are disarmed in time while the rest escalate to the siren after the alert timeout.
+# Alert timeouts, debounce windows, hardware init retries and heartbeats all run on virtual time.
+# Run from the repository root:
+#   python -m benchmark.simulated_day --sensors 10 --rate 30 --hours 24
+
+import argparse
+import heapq
+import logging
+import random
+import time
+
+import clocks
+
+# Everything after this schedules against the virtual clock
+clock = clocks.use_virtual_clock()
+
+import alarmstates
+import sensorevents
+import sensors
+import timerwheel
+from benchmark import harness
+from benchmark.configs import build_config
+
+HOUR_S = 3600
+# (hour of day, event) the household arms and disarms at
+ARM_SCHEDULE = [(7, 'disarm'), (8, 'arm'), (18, 'disarm'), (23, 'arm')]
+# Chance an alert is the owner, who disarms within DISARM_WITHIN_S
+OWNER_ALERT_FRACTION = 0.7
+DISARM_WITHIN_S = 20
+ALARM_DISARMED_AFTER_S = 300
+
+
+def build_traffic(config, rate_per_hour, hours, rng):
+    """(time_s, sensor_id, pin_number, state) for every door opening and closing"""
+    traffic = []
+    for sensor_id in config['sensors']['sensors'].split(','):
+        pins = [number for number, pin in sensors.sensor_list[sensor_id].input_pins.items() if pin.zone is not None]
+        now = rng.expovariate(rate_per_hour / HOUR_S)
+        while now < hours * HOUR_S:
+            pin = rng.choice(pins)
+            traffic.append((now, sensor_id, pin, 1))
+            traffic.append((now + rng.uniform(2, 60), sensor_id, pin, 0))
+            now += rng.expovariate(rate_per_hour / HOUR_S)
+    return traffic
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sensors', type=int, default=10)
+    parser.add_argument('--rate', type=float, default=30, help='door openings per sensor per hour')
+    parser.add_argument('--hours', type=float, default=24, help='simulated hours')
+    parser.add_argument('--seed', type=int, default=1)
+    args, _ = parser.parse_known_args()
+    rng = random.Random(args.seed)
+
+    config = build_config(args.sensors, 8, 2)
+    config['sensor_events'] = {'hold_off_ms': '50'}
+    logging.disable(logging.WARNING)
+    harness.load_alarm_system(config)
+
+    machine = alarmstates.alarm_state_machine
+    start = clock.monotonic()
+
+    actions = []
+    for time_s, sensor_id, pin, state in build_traffic(config, args.rate, args.hours, rng):
+        heapq.heappush(actions, (time_s, len(actions), 'pin', (sensor_id, pin, state)))
+    for day in range(int(args.hours // 24) + 1):
+        for hour, event in ARM_SCHEDULE:
+            if day * 24 + hour < args.hours:
+                heapq.heappush(actions, ((day * 24 + hour) * HOUR_S, len(actions), event, None))
+    heapq.heappush(actions, (args.hours * HOUR_S, len(actions), 'end', None))
+
+    counts = {'pin updates': 0, 'alerts': 0, 'alarms': 0, 'disarmed in time': 0}
+    armed = False
+    wall_start = time.perf_counter()
+    while actions:
+        time_s, _, action, data = heapq.heappop(actions)
+        state_before = machine.get_current_state()
+        clock.advance_to(start + time_s)
+        machine.dispatcher.wait_until_idle()
+        current_state = machine.get_current_state()
+        if state_before == alarmstates.StateType.alert and current_state == alarmstates.StateType.alarm:
+            counts['alarms'] += 1
+            heapq.heappush(actions, (time_s + ALARM_DISARMED_AFTER_S, len(actions), 'disarm', 'rearm'))
+
+        if action == 'pin':
+            sensor_id, pin, state = data
+            sensor = sensors.sensor_list[sensor_id]
+            sensorevents.sensor_event_filter.update_pins(sensor_id, [(sensor.input_pins[pin], state)])
+            counts['pin updates'] += 1
+            machine.dispatcher.wait_until_idle()
+            alerted = machine.get_current_state() == alarmstates.StateType.alert
+            if current_state == alarmstates.StateType.armed and alerted:
+                counts['alerts'] += 1
+                if rng.random() < OWNER_ALERT_FRACTION:
+                    counts['disarmed in time'] += 1
+                    disarm_s = time_s + rng.uniform(1, DISARM_WITHIN_S)
+                    heapq.heappush(actions, (disarm_s, len(actions), 'disarm', 'rearm'))
+        elif action == 'arm':
+            armed = True
+            machine.post_event(alarmstates.EventType.arm, 'Away').result()
+        elif action == 'disarm':
+            # A disarm after an alert re-arms straight away if the house should be armed
+            if data is None:
+                armed = False
+            machine.post_event(alarmstates.EventType.disarm, None).result()
+            if data == 'rearm' and armed:
+                machine.post_event(alarmstates.EventType.arm, 'Away').result()
+    wall_s = time.perf_counter() - wall_start
+
+    simulated_s = clock.monotonic() - start
+    print("simulated {:.1f} h in {:.2f} s ({:,.0f}x real time)".format(simulated_s / HOUR_S, wall_s,
+                                                                      simulated_s / wall_s))
+    for name, count in counts.items():
+        print("{:<24} {:>8}".format(name, count))
+    print("{:<24} {:>8}".format('zone events forwarded',
+                                sensorevents.sensor_event_filter.get_metrics()['forwarded_zone_events']))
+    print("{:<24} {:>8}".format('timers fired', timerwheel.timer_wheel.get_metrics()['fired']))
+
+    harness.shutdown()
+
+
+if __name__ == '__main__':
+    main()
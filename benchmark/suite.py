@@ -0,0 +1,182 @@
+# End to end benchmarks for the alarm pipeline, written out as JSON so runs can be compared across versions
+# Run from the repository root:
+#   python -m benchmark.suite --output bench_results.json
+#   python -m benchmark.suite --quick
+
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import time
+
+import alarmstates
+import eventstream
+import konnected
+import konnected_simulator
+import sensors
+from benchmark import harness
+from benchmark.configs import build_config
+
+# (sensors, zones per sensor, pins per zone)
+LOAD_SIZES = [(1, 4, 2), (10, 8, 2), (50, 8, 4), (200, 16, 4)]
+QUICK_LOAD_SIZES = [(1, 4, 2), (10, 8, 2)]
+
+# How long a sensor PUT may take to reach the alert state before the run is failed
+TRANSITION_TIMEOUT_S = 5
+
+# Events that leave each state where it is, so the machine can be driven repeatedly without resetting
+SELF_LOOP_EVENTS = {alarmstates.StateType.disarmed: (alarmstates.EventType.disarm, None),
+                    alarmstates.StateType.armed: (alarmstates.EventType.arm, 'Away'),
+                    alarmstates.StateType.alert: (alarmstates.EventType.arm, 'Away'),
+                    alarmstates.StateType.alarm: (alarmstates.EventType.sensor_changed, None)}
+
+
+def bench_load_times(sizes):
+    results = []
+    for num_sensors, zones, pins_per_zone in sizes:
+        config = build_config(num_sensors, zones, pins_per_zone)
+
+        start = time.perf_counter()
+        sensors.load_sensors(config)
+        load_sensors_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        alarmstates.load_state_configurations(config)
+        load_states_s = time.perf_counter() - start
+
+        results.append({'sensors': num_sensors,
+                        'zones': num_sensors * zones,
+                        'pins': num_sensors * zones * pins_per_zone,
+                        'load_sensors_ms': load_sensors_s * 1000,
+                        'load_state_configurations_ms': load_states_s * 1000})
+        harness.reset_sensors()
+    return results
+
+
+def bench_process_event(iterations):
+    config = build_config()
+    alarmstates.load_state_configurations(config)
+    state_machine = alarmstates.AlarmStateMachine()
+
+    results = {}
+    for state, (event, data) in SELF_LOOP_EVENTS.items():
+        state_machine._current_state = state
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            state_machine.process_event(event, data)
+        elapsed = time.perf_counter() - start
+
+        assert state_machine.get_current_state() == state
+        results[state.name] = {'event': event.name, 'events_per_s': iterations / elapsed}
+    return results
+
+
+def bench_actuation(board, iterations):
+    client = konnected.Client(board.host, str(board.port))
+    queue = sensors.actuators.ActuatorQueue(client)
+
+    def client_round_trip():
+        client.put_device(1, 1)
+
+    def queue_round_trip(state=[0]):
+        # Alternate states so the queue doesn't skip a repeat of the last sent state
+        state[0] ^= 1
+        queue.submit(1, state[0]).result()
+
+    results = {}
+    for name, func in (('client', client_round_trip), ('actuator_queue', queue_round_trip)):
+        func()
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+        results[name] = harness.summarize(samples)
+
+    queue.stop()
+    return results
+
+
+def wait_for_state(subscriber, state, deadline):
+    # Read the event stream up to the transition into state, so a PUT that never gets there fails the run
+    while True:
+        message = subscriber.get(timeout=max(deadline - time.perf_counter(), 0))
+        if message is None:
+            raise RuntimeError("Timed out waiting for the transition to " + state.name)
+        event_type, data = message.split('\n')[:2]
+        if event_type == 'event: state' and json.loads(data[len('data: '):])['state'] == state.name:
+            return
+
+
+def bench_sensor_put_to_transition(alarmsystem, sensor_id, iterations):
+    client = alarmsystem.app.test_client()
+    subscriber = eventstream.event_broadcaster.subscribe()
+
+    samples = []
+    try:
+        for _ in range(iterations):
+            client.post('/state', json={'event': 'arm', 'arm_config': 'Away'})
+
+            start = time.perf_counter()
+            response = client.put('/device/' + sensor_id, json={'pin': 2, 'state': 1})
+            if response.status_code != 200:
+                raise RuntimeError("Sensor PUT failed with status {}".format(response.status_code))
+            wait_for_state(subscriber, alarmstates.StateType.alert, start + TRANSITION_TIMEOUT_S)
+            samples.append(time.perf_counter() - start)
+
+            client.post('/state', json={'event': 'disarm'})
+            client.put('/device/' + sensor_id, json={'pin': 2, 'state': 0})
+    finally:
+        eventstream.event_broadcaster.unsubscribe(subscriber)
+    return harness.summarize(samples)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', help='file to write the JSON results to, instead of stdout')
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--quick', action='store_true', help='smaller sizes and iteration counts')
+    args, _ = parser.parse_known_args()
+
+    iterations = 100 if args.quick else args.iterations
+    results = {'metadata': {'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                            'git_revision': git_revision(),
+                            'python': platform.python_version(),
+                            'platform': platform.platform(),
+                            'iterations': iterations}}
+
+    results['load_time'] = bench_load_times(QUICK_LOAD_SIZES if args.quick else LOAD_SIZES)
+    results['process_event_throughput'] = bench_process_event(iterations * 10)
+
+    board = konnected_simulator.VirtualBoard('100000000000', inputs=range(2, 10), outputs=[1, 10])
+    simulator = konnected_simulator.Simulator([board])
+    simulator.start()
+
+    results['actuation_round_trip'] = bench_actuation(board, iterations)
+
+    alarmsystem = harness.load_alarm_system(build_config(port=board.port))
+    results['sensor_put_to_transition'] = bench_sensor_put_to_transition(alarmsystem, board.id, iterations)
+
+    harness.shutdown()
+    simulator.stop()
+    konnected.close_sessions()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
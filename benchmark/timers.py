@@ -0,0 +1,80 @@
+# Compares one threading.Timer per timeout against the shared timer wheel with N timeouts pending at once.
+# Reports the threads alive while they are pending, the cost of scheduling them, and how late they fire
+# (jitter) relative to their deadlines.
+# Run from the repository root:
+#   python -m benchmark.timers --timers 100,1000,5000 --delay 1
+
+import argparse
+import statistics
+import threading
+import time
+
+import timerwheel
+
+
+def run_threading_timers(count, delay_s, spread_s):
+    lateness = []
+    done = threading.Event()
+
+    def fired(deadline):
+        lateness.append(time.monotonic() - deadline)
+        if len(lateness) == count:
+            done.set()
+
+    threads_before = threading.active_count()
+    start = time.perf_counter()
+    for index in range(count):
+        delay = delay_s + spread_s * index / count
+        timer = threading.Timer(delay, fired, (time.monotonic() + delay,))
+        timer.daemon = True
+        timer.start()
+    schedule_s = time.perf_counter() - start
+    threads = threading.active_count() - threads_before
+
+    done.wait()
+    return threads, schedule_s, lateness
+
+
+def run_timer_wheel(count, delay_s, spread_s):
+    wheel = timerwheel.TimerWheel()
+    lateness = []
+    done = threading.Event()
+
+    def fired(deadline):
+        lateness.append(time.monotonic() - deadline)
+        if len(lateness) == count:
+            done.set()
+
+    threads_before = threading.active_count()
+    start = time.perf_counter()
+    for index in range(count):
+        delay = delay_s + spread_s * index / count
+        wheel.schedule(delay, fired, time.monotonic() + delay)
+    schedule_s = time.perf_counter() - start
+    threads = threading.active_count() - threads_before
+
+    done.wait()
+    wheel.stop()
+    return threads, schedule_s, lateness
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--timers', default='100,1000,5000', help='comma separated pending timer counts')
+    parser.add_argument('--delay', type=float, default=1, help='seconds until the first timer fires')
+    parser.add_argument('--spread', type=float, default=1, help='seconds the deadlines are spread over')
+    args, _ = parser.parse_known_args()
+
+    print("{:<16} {:>7} {:>8} {:>12} {:>13} {:>13} {:>13}".format(
+        'scheduler', 'timers', 'threads', 'schedule us', 'median late ms', 'p99 late ms', 'max late ms'))
+    for count in [int(count) for count in args.timers.split(',')]:
+        for name, run in [('threading.Timer', run_threading_timers), ('timer wheel', run_timer_wheel)]:
+            threads, schedule_s, lateness = run(count, args.delay, args.spread)
+            lateness_ms = sorted(late * 1000 for late in lateness)
+            print("{:<16} {:>7} {:>8} {:>12.1f} {:>13.2f} {:>13.2f} {:>13.2f}".format(
+                name, count, threads, schedule_s / count * 1e6, statistics.median(lateness_ms),
+                lateness_ms[int(len(lateness_ms) * 0.99) - 1], lateness_ms[-1]))
+
+
+if __name__ == '__main__':
+    main()
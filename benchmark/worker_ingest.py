@@ -0,0 +1,118 @@
+# Compares sensor PUT ingest throughput of the single-process server against the production mode,
+# where worker processes forward updates to the state owner over its Unix socket.
+# Load is generated from a separate process so it doesn't compete with the state owner for the GIL.
+# Run from the repository root:
+#   python -m benchmark.worker_ingest --workers 1,2,4 --duration 5 --concurrency 64
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import aiohttp
+from werkzeug.serving import make_server
+
+import stateowner
+from benchmark import harness
+from benchmark.configs import build_config
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout_s=10):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("Nothing listening on port {}".format(port))
+
+
+def generate_load(url, pins, concurrency, duration_s):
+    """Runs in its own process. Returns (requests completed, requests failed)"""
+    async def client(session, pins, counts, deadline):
+        state = 0
+        while time.monotonic() < deadline:
+            state ^= 1
+            for pin in pins:
+                async with session.put(url, json={'pin': pin, 'state': state}) as response:
+                    await response.read()
+                    counts[0 if response.status == 200 else 1] += 1
+
+    async def run():
+        counts = [0, 0]
+        deadline = time.monotonic() + duration_s
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+            await asyncio.gather(*[client(session, pins, counts, deadline) for _ in range(concurrency)])
+        return tuple(counts)
+
+    return asyncio.run(run())
+
+
+def measure(pool, port, sensor_id, pins, args):
+    url = 'http://127.0.0.1:{}/device/{}'.format(port, sensor_id)
+    start = time.perf_counter()
+    completed, failed = pool.apply(generate_load, (url, pins, args.concurrency, args.duration))
+    return completed / (time.perf_counter() - start), failed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', default='1,2,4', help='comma separated worker process counts')
+    parser.add_argument('--duration', type=float, default=5, help='seconds of load per run')
+    parser.add_argument('--concurrency', type=int, default=64, help='concurrent client connections')
+    args, _ = parser.parse_known_args()
+
+    config = build_config(1, 8, 4)
+    alarmsystem = harness.load_alarm_system(config)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    sensor_id = config['sensors']['sensors']
+    pins = list(range(2, 2 + 8 * 4))
+    pool = multiprocessing.get_context('spawn').Pool(1)
+
+    port = free_port()
+    server = make_server('127.0.0.1', port, alarmsystem.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    rate, failed = measure(pool, port, sensor_id, pins, args)
+    server.shutdown()
+    print("{:<16} {:10.0f} requests/s  {:6d} failed".format('single process', rate, failed))
+
+    socket_path = os.path.join(tempfile.mkdtemp(), 'state.sock')
+    owner = stateowner.StateOwner(alarmsystem.app, socket_path)
+    owner.start()
+    worker_script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'workerapp.py')
+
+    for workers in [int(count) for count in args.workers.split(',')]:
+        port = free_port()
+        processes = [subprocess.Popen([sys.executable, worker_script, '--host', '127.0.0.1', '--port', str(port),
+                                       '--state-socket', socket_path])
+                     for _ in range(workers)]
+        wait_for_port(port)
+
+        rate, failed = measure(pool, port, sensor_id, pins, args)
+        print("{:<16} {:10.0f} requests/s  {:6d} failed".format('{} workers'.format(workers), rate, failed))
+
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    owner.stop()
+    pool.close()
+    harness.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+
+
+class SystemClock:
+    """Real time, the default clocks.clock"""
+    is_virtual = False
+
+    @staticmethod
+    def monotonic():
+        return time.monotonic()
+
+    @staticmethod
+    def time():
+        return time.time()
+
+    @staticmethod
+    async def sleep_async(delay_s):
+        await asyncio.sleep(delay_s)
+
+    @staticmethod
+    def wait_for(condition, predicate, timeout_s):
+        return condition.wait_for(predicate, timeout_s)
+
+
+class VirtualClock:
+    """Time that only passes when advance() is called, for replaying long scenarios"""
+    is_virtual = True
+
+    def __init__(self):
+        self._now = time.monotonic()
+        self._epoch = time.time() - self._now
+        self._wheels = []
+        self._lock = threading.Lock()
+
+    def monotonic(self):
+        return self._now
+
+    def time(self):
+        return self._epoch + self._now
+
+    async def sleep_async(self, delay_s):
+        # timerwheel imports this module, so it can't be imported at the top
+        import timerwheel
+
+        loop = asyncio.get_running_loop()
+        woken = loop.create_future()
+        timerwheel.timer_wheel.schedule(delay_s, loop.call_soon_threadsafe, _wake, woken)
+        await woken
+
+    def wait_for(self, condition, predicate, timeout_s):
+        """condition.wait_for in virtual time. Call it with condition held"""
+        import timerwheel
+
+        expired = []
+
+        def expire():
+            with condition:
+                expired.append(True)
+                condition.notify_all()
+
+        timer = None if timeout_s is None else timerwheel.timer_wheel.schedule(timeout_s, expire)
+        try:
+            condition.wait_for(lambda: expired or predicate())
+        finally:
+            if timer is not None:
+                timer.cancel()
+        return predicate()
+
+    def attach(self, wheel):
+        with self._lock:
+            if wheel not in self._wheels:
+                self._wheels.append(wheel)
+
+    def advance(self, delay_s):
+        self.advance_to(self._now + delay_s)
+
+    def advance_to(self, now):
+        """Move the clock forward to now, firing every timer that falls due on the way"""
+        with self._lock:
+            wheels = list(self._wheels)
+
+        while True:
+            deadlines = [deadline for deadline in (wheel.next_deadline() for wheel in wheels) if deadline is not None]
+            if not deadlines or min(deadlines) > now:
+                break
+            self._now = max(self._now, min(deadlines))
+            for wheel in wheels:
+                wheel.run_due()
+
+        self._now = max(self._now, now)
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def use_virtual_clock():
+    """Switch to a VirtualClock and return it. Do this before anything schedules a timer"""
+    global clock
+    clock = VirtualClock()
+    return clock
+
+
+def use_system_clock():
+    global clock
+    clock = SystemClock()
+
+
+clock = SystemClock()
@@ -0,0 +1,112 @@
+import configparser
+import hashlib
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Settings that can be changed at runtime through PUT /configuration, and the type each value must parse as
+EDITABLE_SETTINGS = {'door_chime': {'num_beeps': int, 'beep_duration_ms': int, 'pause_duration_ms': int},
+                     'alert': {'duration_s': int}}
+
+
+class ConfigStore:
+    """Single in-memory copy of the config file"""
+
+    def __init__(self):
+        self.path = None
+        self._config = configparser.ConfigParser()
+        self._lock = threading.Lock()
+        self._listeners = {}
+
+        self.version = 0
+        self.etag = None
+        self.settings_json = None
+
+    def load(self, path):
+        config = configparser.ConfigParser()
+        config.read(path)
+
+        with self._lock:
+            self.path = path
+            self._swap(config)
+        return config
+
+    def reload(self):
+        """Re-read the config file and hand every section with listeners its current values"""
+        config = self.load(self.path)
+        for section, listeners in self._listeners.items():
+            if config.has_section(section):
+                for listener in listeners:
+                    listener(config[section])
+        return config
+
+    def get_config(self):
+        return self._config
+
+    def add_listener(self, section, listener):
+        """listener(section_proxy) is called whenever settings in the section change"""
+        self._listeners.setdefault(section, []).append(listener)
+
+    def update(self, changes, expected_etags=None):
+        """Apply {section: {option: value}} changes. Raises ValueError or VersionMismatch"""
+        validated = {}
+        for section, options in changes.items():
+            if section not in EDITABLE_SETTINGS or not isinstance(options, dict):
+                raise ValueError("Section {} can't be changed".format(section))
+            for option, value in options.items():
+                if option not in EDITABLE_SETTINGS[section]:
+                    raise ValueError("Setting {}.{} can't be changed".format(section, option))
+                try:
+                    validated.setdefault(section, {})[option] = str(EDITABLE_SETTINGS[section][option](value))
+                except (TypeError, ValueError):
+                    raise ValueError("Invalid value {} for {}.{}".format(value, section, option))
+
+        with self._lock:
+            if expected_etags is not None and self.etag not in expected_etags:
+                raise ConfigStore.VersionMismatch(self.etag)
+
+            config = configparser.ConfigParser()
+            config.read_dict(self._config)
+            for section, options in validated.items():
+                if not config.has_section(section):
+                    config.add_section(section)
+                config[section].update(options)
+
+            self._write(config)
+            self._swap(config)
+
+        for section in validated:
+            for listener in self._listeners.get(section, []):
+                listener(config[section])
+
+        return self.etag
+
+    def _write(self, config):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as config_file:
+            config.write(config_file)
+            config_file.flush()
+            os.fsync(config_file.fileno())
+        os.replace(temp_path, self.path)
+
+    def _swap(self, config):
+        settings = {}
+        for section, options in EDITABLE_SETTINGS.items():
+            if config.has_section(section):
+                settings[section] = {option: value_type(config[section][option])
+                                     for option, value_type in options.items() if option in config[section]}
+        settings_json = json.dumps(settings, sort_keys=True)
+
+        self._config = config
+        self.version += 1
+        self.settings_json = settings_json
+        self.etag = hashlib.sha1(settings_json.encode()).hexdigest()[:16]
+
+    class VersionMismatch(Exception):
+        pass
+
+
+config_store = ConfigStore()
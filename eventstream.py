@@ -0,0 +1,96 @@
+import json
+import logging
+import queue
+import threading
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    def __init__(self, max_pending):
+        self._queue = queue.Queue(max_pending)
+        self.dropped = False
+
+    def get(self, timeout=None):
+        """Return the next encoded message, or None on timeout or once dropped"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _offer(self, message):
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except queue.Full:
+            return False
+
+    def _close(self):
+        # Make room for the wake-up so a reader blocked in get() notices straight away
+        self.dropped = True
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        self._queue.put_nowait(None)
+
+
+class EventBroadcaster:
+    """Fans state transitions and zone changes out to every connected event stream"""
+    MAX_PENDING_EVENTS = 64
+
+    def __init__(self, max_pending=MAX_PENDING_EVENTS):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._subscribers = []
+
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    def subscribe(self):
+        subscriber = Subscriber(self.max_pending)
+        with self._lock:
+            self._subscribers = self._subscribers + [subscriber]
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers = [other for other in self._subscribers if other is not subscriber]
+
+    def publish(self, event_type, data):
+        # The subscriber list is replaced rather than changed, so it can be read without the lock
+        subscribers = self._subscribers
+        if not subscribers:
+            return
+
+        message = encode_event(event_type, data)
+        slow = [subscriber for subscriber in subscribers if not subscriber._offer(message)]
+
+        with self._lock:
+            self.published += 1
+            if slow:
+                self._subscribers = [subscriber for subscriber in self._subscribers if subscriber not in slow]
+                self.dropped_subscribers += len(slow)
+
+        for subscriber in slow:
+            logger.warning("Dropping event stream subscriber that fell %d events behind", self.max_pending)
+            metrics.increment('event_stream_dropped_subscribers_total')
+            subscriber._close()
+
+    def get_metrics(self):
+        with self._lock:
+            return {'subscribers': len(self._subscribers),
+                    'max_pending_events': self.max_pending,
+                    'published': self.published,
+                    'dropped_subscribers': self.dropped_subscribers}
+
+
+def encode_event(event_type, data):
+    return 'event: {}\ndata: {}\n\n'.format(event_type, json.dumps(data))
+
+
+event_broadcaster = EventBroadcaster()
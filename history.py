@@ -0,0 +1,420 @@
+from array import array
+import base64
+import bisect
+import collections
+import glob
+import heapq
+import json
+import logging
+import os
+import threading
+
+import clocks
+import simplethread
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class PartitionIndex:
+    """Column index of one partition's log: row times, offsets, zones and states"""
+    __slots__ = ('times', 'offsets', 'zone_ids', 'states', 'size', 'zone_keys', 'rows_by_zone', '_ids_by_zone')
+    # Indexes saved by an older version are rebuilt from their logs
+    VERSION = 2
+
+    def __init__(self):
+        self.times = array('d')
+        self.offsets = array('Q')
+        self.zone_ids = array('I')
+        self.states = array('B')
+        self.size = 0
+        self.zone_keys = []
+        self.rows_by_zone = {}
+        self._ids_by_zone = {}
+
+    def add(self, time, sensor_id, zone, state, line_length):
+        key = (sensor_id, zone)
+        zone_id = self._ids_by_zone.get(key)
+        if zone_id is None:
+            zone_id = self._add_zone(key, array('I'))
+
+        row = len(self.times)
+        self.times.append(time)
+        self.offsets.append(self.size)
+        self.zone_ids.append(zone_id)
+        self.states.append(bool(state))
+        self.size += line_length
+        self.rows_by_zone[key].append(row)
+
+    def _add_zone(self, key, rows):
+        zone_id = self._ids_by_zone[key] = len(self.zone_keys)
+        self.zone_keys.append(key)
+        self.rows_by_zone[key] = rows
+        return zone_id
+
+    def rows(self, start, end, sensor_id=None, zone=None, after_row=-1):
+        """Row numbers with start <= time < end, after after_row, in order"""
+        if sensor_id is None:
+            first = max(bisect.bisect_left(self.times, start), after_row + 1)
+            return range(first, bisect.bisect_left(self.times, end))
+
+        zone_rows = [self._zone_rows(rows, start, end, after_row) for key, rows in self.rows_by_zone.items()
+                     if key[0] == sensor_id and (zone is None or key[1] == zone)]
+        if len(zone_rows) == 1:
+            return zone_rows[0]
+        return heapq.merge(*zone_rows)
+
+    def _zone_rows(self, rows, start, end, after_row):
+        times = self.times
+        first = max(bisect.bisect_left(rows, start, key=times.__getitem__), bisect.bisect_right(rows, after_row))
+        return rows[first:bisect.bisect_left(rows, end, first, key=times.__getitem__)]
+
+    def save(self, path):
+        with open(path + '.tmp', 'wb') as index_file:
+            header = {'version': self.VERSION, 'rows': len(self.times), 'size': self.size,
+                      'zones': [[sensor_id, zone, len(self.rows_by_zone[(sensor_id, zone)])]
+                                for sensor_id, zone in self.zone_keys]}
+            index_file.write(json.dumps(header).encode() + b'\n')
+            for column in (self.times, self.offsets, self.zone_ids, self.states):
+                column.tofile(index_file)
+            for key in self.zone_keys:
+                self.rows_by_zone[key].tofile(index_file)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        """The index saved at path, or None if it was saved by an older version"""
+        index = cls()
+        with open(path, 'rb') as index_file:
+            header = json.loads(index_file.readline())
+            if header.get('version') != cls.VERSION:
+                return None
+            for column in (index.times, index.offsets, index.zone_ids, index.states):
+                column.fromfile(index_file, header['rows'])
+            index.size = header['size']
+            for sensor_id, zone, count in header['zones']:
+                rows = array('I')
+                rows.fromfile(index_file, count)
+                index._add_zone((sensor_id, zone), rows)
+        return index
+
+    @classmethod
+    def load_columns(cls, path):
+        """(zone_keys, times, zone_ids, states) saved at path, or None if the format is old"""
+        with open(path, 'rb') as index_file:
+            header = json.loads(index_file.readline())
+            if header.get('version') != cls.VERSION:
+                return None
+            rows = header['rows']
+            times, zone_ids, states = array('d'), array('I'), array('B')
+            times.fromfile(index_file, rows)
+            index_file.seek(rows * array('Q').itemsize, os.SEEK_CUR)
+            zone_ids.fromfile(index_file, rows)
+            states.fromfile(index_file, rows)
+        return [(sensor_id, zone) for sensor_id, zone, _ in header['zones']], times, zone_ids, states
+
+    @classmethod
+    def rebuild(cls, log_path):
+        """Index a partition log by reading it through, for partitions that were never sealed"""
+        index = cls()
+        with open(log_path, 'rb+') as log_file:
+            for line, entry in simplethread.read_json_lines(log_file, log_path):
+                index.add(entry['time'], entry['sensor_id'], entry['zone'], entry['state'], len(line))
+        return index
+
+
+class ZoneHistory(simplethread.BatchWriter):
+    """Every zone change forwarded to the state machine, kept in memory and in hourly partitions"""
+    PARTITION_PATTERN = 'zones-*.log'
+    CONST_PARTITION_s = 3600
+    # A week of hourly indexes
+    CONST_CACHED_INDEXES = 168
+    MAX_PAGE_SIZE = 1000
+
+    def __init__(self, ring_size=1000):
+        simplethread.BatchWriter.__init__(self)
+        self.path = None
+        self.retention_days = None
+
+        self._recent = collections.deque(maxlen=ring_size)
+        self._seq = 0
+        self._last_time = 0.0
+        self._recorded = 0
+
+        # Guards everything below, which the writer thread changes and queries read
+        self._lock = threading.Lock()
+        self._partitions = []
+        self._active_start = None
+        self._active_index = None
+        self._active_file = None
+        self._indexes = collections.OrderedDict()
+        self._seal_listeners = []
+
+    def load_from_config(self, config):
+        if not config.has_section('history'):
+            return
+
+        section = config['history']
+        self.path = section.get('path', 'history')
+        self.retention_days = section.getfloat('retention_days', fallback=None)
+        self.commit_interval_s = section.getfloat('commit_interval_ms', self.commit_interval_s * 1000) / 1000
+        ring_size = section.getint('ring_size', self._recent.maxlen)
+        if ring_size != self._recent.maxlen:
+            self._recent = collections.deque(self._recent, maxlen=ring_size)
+
+    def is_enabled(self):
+        return self.path is not None
+
+    def add_seal_listener(self, listener):
+        """Call listener(partition) on the writer thread once a partition can no longer change"""
+        self._seal_listeners.append(listener)
+
+    def open(self):
+        """Find the partitions already on disk and carry on numbering events after the newest one"""
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            self._partitions = sorted(self._partition_start(path)
+                                      for path in glob.glob(os.path.join(self.path, self.PARTITION_PATTERN)))
+        if not self._partitions:
+            return
+
+        newest = self._partitions[-1]
+        with self._lock:
+            index = self._get_index(newest)
+        if index.times:
+            entries = self._read_rows(newest, index, [len(index.times) - 1])
+            self._seq = entries[0]['seq']
+            self._last_time = entries[0]['time']
+
+    def record(self, sensor_id, zone, name, state):
+        with self._condition:
+            self._seq += 1
+            # Keep history in time order even if the wall clock steps back
+            self._last_time = max(clocks.clock.time(), self._last_time)
+            entry = {'seq': self._seq, 'time': self._last_time, 'sensor_id': sensor_id, 'zone': zone,
+                     'name': name, 'state': state}
+            self._recent.append(entry)
+            self._recorded += 1
+            if self.path is not None:
+                self._pending.append(entry)
+                self._condition.notify()
+
+    def recent(self, limit=None):
+        """The latest events from memory, newest first"""
+        events = list(self._recent)
+        events.reverse()
+        return events if limit is None else events[:limit]
+
+    def query(self, start=None, end=None, sensor_id=None, zone=None, limit=100, cursor=None):
+        """Events with start <= time < end, oldest first. Returns (events, next_cursor)"""
+        start = float('-inf') if start is None else start
+        end = float('inf') if end is None else end
+        limit = max(1, min(limit, self.MAX_PAGE_SIZE))
+        if self.path is None:
+            return self._query_recent(start, end, sensor_id, zone, limit, cursor)
+
+        after_partition, after_row = self._decode_cursor(cursor, ('p', 'r')) if cursor else (None, -1)
+        with self._lock:
+            partitions = [partition for partition in self._partitions
+                          if start < partition + self.CONST_PARTITION_s and partition < end and
+                          (after_partition is None or partition >= after_partition)]
+
+        events = []
+        for partition in partitions:
+            with self._lock:
+                index = self._get_index(partition)
+                if index is None:
+                    continue
+                rows = index.rows(start, end, sensor_id, zone, after_row if partition == after_partition else -1)
+                # Take one more than needed to know whether there is another page
+                rows = [row for row, _ in zip(rows, range(limit - len(events) + 1))]
+
+            more = len(rows) > limit - len(events)
+            rows = rows[:limit - len(events)]
+            events.extend(self._read_rows(partition, index, rows))
+            if more or (len(events) == limit and partition != partitions[-1]):
+                return events, self._encode_cursor({'p': partition, 'r': rows[-1]})
+        return events, None
+
+    def partitions(self, start=None, end=None):
+        """Start times of the stored partitions overlapping start <= time < end, oldest first"""
+        start = float('-inf') if start is None else start
+        end = float('inf') if end is None else end
+        with self._lock:
+            return [partition for partition in self._partitions
+                    if start < partition + self.CONST_PARTITION_s and partition < end]
+
+    def columns(self, partition):
+        """A copy of one partition's columns, or None if the partition has gone"""
+        with self._lock:
+            if partition != self._active_start and partition not in self._indexes:
+                # Analytics reads every partition in its range once, which shouldn't push out the indexes queries
+                # use, and has no need of the rows of each zone
+                index_path = self._index_path(partition)
+                columns = PartitionIndex.load_columns(index_path) if os.path.exists(index_path) else None
+                if columns is not None:
+                    return columns
+
+            index = self._get_index(partition, cache=False)
+            if index is None:
+                return None
+            return list(index.zone_keys), index.times[:], index.zone_ids[:], index.states[:]
+
+    def _close(self):
+        with self._lock:
+            self._seal()
+
+    def get_metrics(self):
+        with self._lock:
+            return {'recorded': self._recorded,
+                    'recent': len(self._recent),
+                    'partitions': len(self._partitions),
+                    'cached_indexes': len(self._indexes)}
+
+    def _query_recent(self, start, end, sensor_id, zone, limit, cursor):
+        after_seq = self._decode_cursor(cursor, ('s',))[0] if cursor else 0
+        events = [event for event in list(self._recent)
+                  if start <= event['time'] < end and event['seq'] > after_seq and
+                  (sensor_id is None or event['sensor_id'] == sensor_id) and (zone is None or event['zone'] == zone)]
+        if len(events) > limit:
+            return events[:limit], self._encode_cursor({'s': events[limit - 1]['seq']})
+        return events, None
+
+    def _write(self, batch):
+        lines = []
+        for entry in batch:
+            partition = int(entry['time'] // self.CONST_PARTITION_s) * self.CONST_PARTITION_s
+            if partition != self._active_start:
+                self._write_lines(lines)
+                lines = []
+                self._switch_partition(partition)
+            line = json.dumps(entry).encode() + b'\n'
+            lines.append((entry, line))
+        self._write_lines(lines)
+
+    def _write_lines(self, lines):
+        if not lines:
+            return
+        self._active_file.write(b''.join(line for _, line in lines))
+        self._active_file.flush()
+
+        # Rows only become visible to queries once they are in the file
+        with self._lock:
+            for entry, line in lines:
+                self._active_index.add(entry['time'], entry['sensor_id'], entry['zone'], entry['state'], len(line))
+
+    def _switch_partition(self, partition):
+        sealed = self._active_start
+        with self._lock:
+            self._seal()
+            log_path = self._log_path(partition)
+            if os.path.exists(log_path):
+                # Carry on a partition written before a restart; its index is rewritten when it's sealed again
+                self._active_index = self._get_index(partition)
+                self._indexes.pop(partition, None)
+                if os.path.exists(self._index_path(partition)):
+                    os.remove(self._index_path(partition))
+            else:
+                self._active_index = PartitionIndex()
+                bisect.insort(self._partitions, partition)
+            self._active_start = partition
+            self._active_file = open(log_path, 'ab')
+            # Drop anything after the last whole row, such as a line torn by a crash
+            self._active_file.truncate(self._active_index.size)
+
+        self._apply_retention(partition)
+        if sealed is not None:
+            for listener in self._seal_listeners:
+                try:
+                    listener(sealed)
+                except Exception:
+                    logger.exception("Seal listener failed for partition %d", sealed)
+
+    def _seal(self):
+        if self._active_file is None:
+            return
+        self._active_file.close()
+        self._active_index.save(self._index_path(self._active_start))
+        self._cache_index(self._active_start, self._active_index)
+        self._active_file = None
+        self._active_start = None
+        self._active_index = None
+
+    def _apply_retention(self, newest_partition):
+        if self.retention_days is None:
+            return
+
+        cutoff = newest_partition - self.retention_days * 86400
+        with self._lock:
+            expired = [partition for partition in self._partitions if partition + self.CONST_PARTITION_s <= cutoff]
+            self._partitions = [partition for partition in self._partitions if partition not in expired]
+            for partition in expired:
+                self._indexes.pop(partition, None)
+
+        for partition in expired:
+            for path in (self._log_path(partition), self._index_path(partition)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    # Called with _lock held
+    def _get_index(self, partition, cache=True):
+        if partition == self._active_start:
+            return self._active_index
+        index = self._indexes.get(partition)
+        if index is not None:
+            self._indexes.move_to_end(partition)
+            return index
+
+        index_path = self._index_path(partition)
+        index = PartitionIndex.load(index_path) if os.path.exists(index_path) else None
+        if index is None:
+            if not os.path.exists(self._log_path(partition)):
+                return None
+            index = PartitionIndex.rebuild(self._log_path(partition))
+            index.save(index_path)
+        if cache:
+            self._cache_index(partition, index)
+        return index
+
+    def _cache_index(self, partition, index):
+        self._indexes[partition] = index
+        while len(self._indexes) > self.CONST_CACHED_INDEXES:
+            self._indexes.popitem(last=False)
+
+    def _read_rows(self, partition, index, rows):
+        events = []
+        if not rows:
+            return events
+        with open(self._log_path(partition), 'rb') as log_file:
+            for row in rows:
+                log_file.seek(index.offsets[row])
+                events.append(json.loads(log_file.readline()))
+        return events
+
+    def _log_path(self, partition):
+        return os.path.join(self.path, 'zones-{:d}.log'.format(int(partition)))
+
+    def _index_path(self, partition):
+        return os.path.join(self.path, 'zones-{:d}.idx'.format(int(partition)))
+
+    @staticmethod
+    def _partition_start(path):
+        return int(os.path.basename(path)[len('zones-'):-len('.log')])
+
+    @staticmethod
+    def _encode_cursor(position):
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor, fields):
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return tuple(position[field] for field in fields)
+        except (ValueError, TypeError, KeyError) as err:
+            raise InvalidCursor("Invalid cursor " + cursor) from err
+
+
+zone_history = ZoneHistory()
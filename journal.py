@@ -0,0 +1,125 @@
+import glob
+import json
+import logging
+import os
+
+import clocks
+import simplethread
+
+logger = logging.getLogger(__name__)
+
+
+class EventJournal(simplethread.BatchWriter):
+    """Append-only journal of every event the state machine processes"""
+    SNAPSHOT_FILE = 'snapshot.json'
+    SEGMENT_PATTERN = 'journal-*.log'
+
+    def __init__(self):
+        simplethread.BatchWriter.__init__(self)
+        self.path = None
+        self.snapshot_interval = 1000
+
+        self._seq = 0
+        self._segment = None
+        self._entries_since_snapshot = 0
+        self._last_entry = None
+        self._last_entries = {}
+
+    def load_from_config(self, config):
+        if not config.has_section('journal'):
+            return
+
+        section = config['journal']
+        self.path = section.get('path', 'journal')
+        self.snapshot_interval = section.getint('snapshot_interval', self.snapshot_interval)
+        self.commit_interval_s = section.getfloat('commit_interval_ms', self.commit_interval_s * 1000) / 1000
+
+    def is_enabled(self):
+        return self.path is not None
+
+    def restore(self):
+        """Return the most recent entry, or None if nothing was ever recorded"""
+        os.makedirs(self.path, exist_ok=True)
+
+        last_entry = None
+        last_entries = {}
+        snapshot_path = os.path.join(self.path, self.SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path) as snapshot_file:
+                last_entry = json.load(snapshot_file)
+            # Snapshots written before areas existed only hold the last entry
+            area_entries = last_entry.pop('areas', None) or [last_entry]
+            last_entries = {entry.get('area'): entry for entry in area_entries}
+
+        last_seq = last_entry['seq'] if last_entry else 0
+        for segment_path in self._segment_paths():
+            with open(segment_path, 'rb+') as segment_file:
+                for _, entry in simplethread.read_json_lines(segment_file, segment_path):
+                    if entry['seq'] > last_seq:
+                        last_entry = entry
+                        last_entries[entry.get('area')] = entry
+                        last_seq = entry['seq']
+                        self._entries_since_snapshot += 1
+
+        self._seq = last_seq
+        self._last_entry = last_entry
+        self._last_entries = last_entries
+        return last_entry
+
+    def last_entries(self):
+        """{area: most recent entry for that area}. Entries journaled before areas existed are under None"""
+        return dict(self._last_entries)
+
+    def record(self, event, data, state, arm_configuration, area=None):
+        with self._condition:
+            self._seq += 1
+            self._pending.append({'seq': self._seq,
+                                  'time': clocks.clock.time(),
+                                  'event': event.name,
+                                  'data': data,
+                                  'state': state.name,
+                                  'arm_configuration': arm_configuration,
+                                  'area': area})
+            self._condition.notify()
+
+    def _close(self):
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def _segment_paths(self):
+        return sorted(glob.glob(os.path.join(self.path, self.SEGMENT_PATTERN)))
+
+    def _write(self, batch):
+        if self._segment is None:
+            segment_name = 'journal-{:012d}.log'.format(batch[0]['seq'])
+            self._segment = open(os.path.join(self.path, segment_name), 'a')
+
+        self._segment.write(''.join(json.dumps(entry) + '\n' for entry in batch))
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+
+        self._last_entry = batch[-1]
+        for entry in batch:
+            self._last_entries[entry['area']] = entry
+        self._entries_since_snapshot += len(batch)
+        if self._entries_since_snapshot >= self.snapshot_interval:
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        snapshot_path = os.path.join(self.path, self.SNAPSHOT_FILE)
+        with open(snapshot_path + '.tmp', 'w') as snapshot_file:
+            json.dump(dict(self._last_entry, areas=list(self._last_entries.values())), snapshot_file)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(snapshot_path + '.tmp', snapshot_path)
+
+        # Everything written so far is covered by the snapshot, so the next entry starts a new segment
+        self._segment.close()
+        self._segment = None
+        for segment_path in self._segment_paths():
+            os.remove(segment_path)
+        self._entries_since_snapshot = 0
+
+
+event_journal = EventJournal()
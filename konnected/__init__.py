@@ -3,39 +3,106 @@
 
 import requests
 import json
+import logging
 import os
+import threading
+import time
 
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException;
 
 __author__ = 'Nate Clark, Konnected Inc <help@konnected.io>'
 
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_TIMEOUT_S = 10
+
+# Sessions are shared between every Client that talks to the same board, keyed by 'host:port'.
+# Each holds (session, pool_size); the first Client for a board picks the pool size for all of them
+_session_pool = {}
+_session_pool_lock = threading.Lock()
+
+
+# If set, called as request_observer(call, duration_s, succeeded) after every device request
+request_observer = None
+
+
+def set_request_observer(observer):
+    global request_observer
+    request_observer = observer
+
+
+class observed_request(object):
+    """ Times the enclosed device request and reports it to request_observer """
+
+    def __init__(self, call):
+        self.call = call
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if request_observer is not None:
+            request_observer(self.call, time.perf_counter() - self.start, exc_type is None)
+
+
+def get_session(host, port, pool_size=DEFAULT_POOL_SIZE):
+    """ Return the keep-alive session for host:port. The first call for a board sets its pool size """
+    key = host + ':' + str(port)
+    with _session_pool_lock:
+        if key in _session_pool:
+            session, existing_pool_size = _session_pool[key]
+            if pool_size != existing_pool_size:
+                logger.warning("Session for %s already has a pool of %d connections, ignoring pool size %d",
+                               key, existing_pool_size, pool_size)
+            return session
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        _session_pool[key] = (session, pool_size)
+        return session
+
+
+def close_sessions():
+    """ Close every pooled session and drop its connections """
+    with _session_pool_lock:
+        for session, _ in _session_pool.values():
+            session.close()
+        _session_pool.clear()
+
 
 class Client(object):
 
-    def __init__(self, host, port):
+    def __init__(self, host, port, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT_S):
         self.host = host
         self.port = port
-        self.base_url = 'http://' + host + ':' + port
+        self.base_url = 'http://' + host + ':' + str(port)
+        self.timeout = timeout
+        self.session = get_session(host, port, pool_size)
 
-    def get_device(self, pin=None):
+    def get_device(self, pin=None, timeout=None):
         """ Query the status of a specific pin (or all configured pins if pin is ommitted) """
         url = self.base_url + '/device'
-        try:
-            r = requests.get(url, params={'pin': pin}, timeout=10)
-            return r.json()
-        except RequestException as err:
-            raise Client.ClientError(err)
-
-    def get_status(self):
+        with observed_request('get_device'):
+            try:
+                r = self.session.get(url, params={'pin': pin}, timeout=timeout or self.timeout)
+                return r.json()
+            except RequestException as err:
+                raise Client.ClientError(err)
+
+    def get_status(self, timeout=None):
         """ Query the device status. Returns JSON of the device internal state """
         url = self.base_url + '/status'
-        try:
-            r = requests.get(url, timeout=10)
-            return r.json()
-        except RequestException as err:
-            raise Client.ClientError(err)
-
-    def put_device(self, pin, state, momentary=None, times=None, pause=None):
+        with observed_request('get_status'):
+            try:
+                r = self.session.get(url, timeout=timeout or self.timeout)
+                return r.json()
+            except RequestException as err:
+                raise Client.ClientError(err)
+
+    def put_device(self, pin, state, momentary=None, times=None, pause=None, timeout=None):
         """ Actuate a device pin """
         url = self.base_url + '/device'
 
@@ -53,14 +120,15 @@ class Client(object):
         if pause is not None:
             payload["pause"] = pause
 
-        try:
-            r = requests.put(url, json=payload, timeout=10)
-            return r.json()
-        except RequestException as err:
-            raise Client.ClientError(err)
+        with observed_request('put_device'):
+            try:
+                r = self.session.put(url, json=payload, timeout=timeout or self.timeout)
+                return r.json()
+            except RequestException as err:
+                raise Client.ClientError(err)
 
     def put_settings(self, sensors, actuators, auth_token, endpoint,
-                     blink=None, discovery=None):
+                     blink=None, discovery=None, timeout=None):
         """ Sync settings to the Konnected device """
         url = self.base_url + '/settings'
 
@@ -77,11 +145,12 @@ class Client(object):
         if discovery is not None:
             payload['discovery'] = discovery
 
-        try:
-            r = requests.put(url, json=payload, timeout=10)
-            return r.ok
-        except RequestException as err:
-            raise Client.ClientError(err)
+        with observed_request('put_settings'):
+            try:
+                r = self.session.put(url, json=payload, timeout=timeout or self.timeout)
+                return r.ok
+            except RequestException as err:
+                raise Client.ClientError(err)
 
     class ClientError(Exception):
         """Generic Error."""
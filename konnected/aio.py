@@ -0,0 +1,87 @@
+# asyncio variant of konnected.Client
+# Requires aiohttp
+
+import aiohttp
+
+from konnected import Client, DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT_S, observed_request
+
+
+class AsyncClient(object):
+    """ Same calls as konnected.Client, as coroutines. Must be used from a single event loop """
+
+    def __init__(self, host, port, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT_S):
+        self.host = host
+        self.port = port
+        self.base_url = 'http://' + host + ':' + str(port)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._session = None
+
+    def _get_session(self):
+        # The session binds to the running loop, so it can only be created once we are inside it
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, call, method, path, timeout, **kwargs):
+        url = self.base_url + path
+        client_timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+        with observed_request(call):
+            try:
+                async with self._get_session().request(method, url, timeout=client_timeout, **kwargs) as r:
+                    if path == '/settings':
+                        return r.ok
+                    return await r.json(content_type=None)
+            except (aiohttp.ClientError, TimeoutError, ValueError) as err:
+                raise Client.ClientError(err)
+
+    async def get_device(self, pin=None, timeout=None):
+        """ Query the status of a specific pin (or all configured pins if pin is ommitted) """
+        params = {'pin': pin} if pin is not None else None
+        return await self._request('get_device', 'GET', '/device', timeout, params=params)
+
+    async def get_status(self, timeout=None):
+        """ Query the device status. Returns JSON of the device internal state """
+        return await self._request('get_status', 'GET', '/status', timeout)
+
+    async def put_device(self, pin, state, momentary=None, times=None, pause=None, timeout=None):
+        """ Actuate a device pin """
+        payload = {
+            "pin": pin,
+            "state": state
+        }
+
+        if momentary is not None:
+            payload["momentary"] = momentary
+
+        if times is not None:
+            payload["times"] = times
+
+        if pause is not None:
+            payload["pause"] = pause
+
+        return await self._request('put_device', 'PUT', '/device', timeout, json=payload)
+
+    async def put_settings(self, sensors, actuators, auth_token, endpoint,
+                           blink=None, discovery=None, timeout=None):
+        """ Sync settings to the Konnected device """
+        payload = {
+            "sensors": sensors,
+            "actuators": actuators,
+            "token": auth_token,
+            "apiUrl": endpoint
+        }
+
+        if blink is not None:
+            payload['blink'] = blink
+
+        if discovery is not None:
+            payload['discovery'] = discovery
+
+        return await self._request('put_settings', 'PUT', '/settings', timeout, json=payload)
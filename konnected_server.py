@@ -4,8 +4,10 @@ from flask import request
 from flask_restful import Resource, reqparse, abort
 import json
 import logging
+import queue
 
-import alarmstates
+import pinupdates
+import sensorevents
 import sensors
 
 logger = logging.getLogger(__name__)
@@ -14,6 +16,8 @@ put_parser = reqparse.RequestParser()
 put_parser.add_argument('state')
 put_parser.add_argument('pin')
 
+EVENT_QUEUE_TIMEOUT_S = 1
+
 get_parser = reqparse.RequestParser()
 get_parser.add_argument('pin', type=int)
 
@@ -27,7 +31,8 @@ def abort_if_doesnt_exist(sensor_id):
 class SensorsHandler(Resource):
     def get(self, sensor_id):
         # This call is primarily used on startup to query what the state of the output pins should be
-        logger.info("GET function for sensor_id " + str(sensor_id) + ", raw data: " + request.get_data(as_text=True))
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("GET function for sensor_id %s, raw data: %s", sensor_id, request.get_data(as_text=True))
         abort_if_doesnt_exist(sensor_id)
         args = get_parser.parse_args()
 
@@ -35,18 +40,58 @@ class SensorsHandler(Resource):
         return {'state': 0, 'pin': args['pin']}
 
     def put(self, sensor_id):
-        logger.info("PUT function for sensor_id " + str(sensor_id) + ", raw data: " + request.get_data(as_text=True))
-        abort_if_doesnt_exist(sensor_id)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("PUT function for sensor_id %s, raw data: %s", sensor_id, request.get_data(as_text=True))
 
         args = put_parser.parse_args()
-        pin_number = int(args['pin'])
-        if pin_number not in sensors.sensor_list[sensor_id].input_pins:
-            abort(404, message="Pin number {} not found in sensor {}".format(args['pin'], sensor_id))
+        ingest_pin_updates(sensor_id, [{'pin': args['pin'], 'state': args['state']}])
+        return 200
+
 
-        pin = sensors.sensor_list[sensor_id].input_pins[pin_number]
-        pin.update_state(int(args['state']))
+class SensorsBatchHandler(Resource):
+    # Takes {"updates": [{"pin": 2, "state": 1}, ...]} and applies them all before notifying the state machine
+    def put(self, sensor_id):
+        body = request.get_json(silent=True) or {}
+        updates = body.get('updates')
+        if not isinstance(updates, list):
+            abort(400, message="Expected a list of pin updates")
 
-        zone_data = sensors.ZoneData(sensor_id, pin.zone.number)
-        alarmstates.alarm_state_machine.process_event(alarmstates.EventType.sensor_changed, zone_data)
+        return {'zones': ingest_pin_updates(sensor_id, updates)}, 200
 
-        return 200
+
+def ingest_pin_updates(sensor_id, updates):
+    """Apply [{'pin', 'state'}] updates from a sensor. Returns the zones forwarded"""
+    # Validate the whole batch first so a bad entry doesn't leave it half applied
+    try:
+        pin_states = pinupdates.parse_pin_updates(updates)
+    except ValueError as err:
+        abort(400, message=str(err))
+    return apply_pin_states(sensor_id, pin_states)
+
+
+def apply_pin_states(sensor_id, pin_states):
+    """Apply parsed (pin, state) updates from a sensor. Returns the zones forwarded"""
+    abort_if_doesnt_exist(sensor_id)
+    sensor = sensors.sensor_list[sensor_id]
+    sensor.liveness_check.record_activity()
+
+    pins = []
+    for pin_number, state in pin_states:
+        if pin_number not in sensor.input_pins:
+            abort(404, message="Pin number {} not found in sensor {}".format(pin_number, sensor_id))
+        pins.append((sensor.input_pins[pin_number], state))
+
+    try:
+        return sensorevents.sensor_event_filter.update_pins(sensor_id, pins, EVENT_QUEUE_TIMEOUT_S)
+    except queue.Full:
+        abort(503, message="Event queue full")
+
+
+class SensorEventsHandler(Resource):
+    def get(self):
+        return sensorevents.sensor_event_filter.get_metrics()
+
+
+class SensorLivenessHandler(Resource):
+    def get(self):
+        return {sensor_id: sensor.liveness_check.get_status() for sensor_id, sensor in sensors.sensor_list.items()}
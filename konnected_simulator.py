@@ -0,0 +1,281 @@
+# Simulates Konnected boards so the alarm system can be load tested without hardware
+# Every board runs on its own port, all served from a single asyncio loop
+#
+# Boards matching the sensors in a config file:
+#   python konnected_simulator.py --config config.ini --rate 20
+# 50 generated boards with 8 inputs each on ports 20000-20049:
+#   python konnected_simulator.py --boards 50 --base-port 20000 --inputs 8 --server http://127.0.0.1:5000
+
+from aiohttp import web
+import aiohttp
+import argparse
+import asyncio
+import configparser
+import logging
+import random
+import socket
+import threading
+
+import simplethread
+
+logger = logging.getLogger(__name__)
+
+
+class VirtualBoard:
+    def __init__(self, board_id, host='127.0.0.1', port=0, inputs=(), outputs=(),
+                 latency_ms=0, failure_rate=0.0, failure_mode='error'):
+        self.id = board_id
+        self.host = host
+        self.port = port
+
+        self.inputs = {pin: 0 for pin in inputs}
+        self.outputs = {pin: 0 for pin in outputs}
+        self.token = None
+        self.api_url = None
+
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.failure_mode = failure_mode
+
+        self.requests = 0
+        self.failures = 0
+        self.settings_updates = 0
+
+    def mac(self):
+        digits = self.id.rjust(12, '0')[-12:]
+        return ':'.join(digits[i:i + 2] for i in range(0, 12, 2))
+
+    def get_status(self):
+        return {'mac': self.mac(),
+                'ip': self.host,
+                'port': self.port,
+                'hwVersion': 'simulator',
+                'swVersion': 'simulator',
+                'sensors': [{'pin': pin, 'state': state} for pin, state in self.inputs.items()],
+                'actuators': [{'pin': pin, 'trigger': 1} for pin in self.outputs]}
+
+    def apply_settings(self, settings):
+        self.inputs = {sensor['pin']: self.inputs.get(sensor['pin'], 0) for sensor in settings.get('sensors', [])}
+        self.outputs = {actuator['pin']: 0 for actuator in settings.get('actuators', [])}
+        self.token = settings.get('token')
+        self.api_url = settings.get('apiUrl')
+        self.settings_updates += 1
+
+    def set_output(self, pin, state, momentary=None):
+        # Momentary outputs pulse and return to off, which is how the board reports them afterwards
+        self.outputs[pin] = 0 if momentary is not None else state
+        return {'pin': pin, 'state': state}
+
+    def toggle_random_input(self):
+        pin = random.choice(list(self.inputs))
+        self.inputs[pin] = 0 if self.inputs[pin] else 1
+        return pin, self.inputs[pin]
+
+    def create_app(self):
+        app = web.Application(middlewares=[self._fault_injection])
+        app.router.add_get('/status', self._handle_status)
+        app.router.add_get('/device', self._handle_get_device)
+        app.router.add_put('/device', self._handle_put_device)
+        app.router.add_put('/settings', self._handle_put_settings)
+        return app
+
+    @web.middleware
+    async def _fault_injection(self, request, handler):
+        self.requests += 1
+        if self.latency_ms:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency_ms / 1000)
+
+        if self.failure_rate and random.random() < self.failure_rate:
+            self.failures += 1
+            if self.failure_mode == 'hang':
+                # Longer than any client timeout, so the caller sees the request time out
+                await asyncio.sleep(60)
+            return web.Response(status=503, text='Simulated failure')
+
+        return await handler(request)
+
+    async def _handle_status(self, request):
+        return web.json_response(self.get_status())
+
+    async def _handle_get_device(self, request):
+        pin = request.query.get('pin')
+        if pin is None:
+            return web.json_response([{'pin': p, 'state': s} for p, s in self.outputs.items()])
+        return web.json_response({'pin': int(pin), 'state': self.outputs.get(int(pin), 0)})
+
+    async def _handle_put_device(self, request):
+        body = await request.json()
+        return web.json_response(self.set_output(body['pin'], body['state'], body.get('momentary')))
+
+    async def _handle_put_settings(self, request):
+        self.apply_settings(await request.json())
+        return web.Response(status=200)
+
+
+class Simulator(simplethread.SimpleThread):
+    """Serves every VirtualBoard from one event loop thread, optionally pushing sensor changes to the server"""
+
+    def __init__(self, boards, server_url=None, rate=0.0):
+        simplethread.SimpleThread.__init__(self)
+        self.boards = boards
+        self.server_url = server_url
+        self.rate = rate
+
+        self.sensor_puts = 0
+        self.sensor_put_failures = 0
+
+        self._started = threading.Event()
+        self._start_error = None
+        self._loop = None
+        self._stopped = None
+
+    def start(self):
+        simplethread.SimpleThread.start(self)
+        self._started.wait()
+        if self._start_error is not None:
+            self.stop()
+            raise self._start_error
+
+    def stop(self):
+        if self._running and self._start_error is None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        simplethread.SimpleThread.stop(self)
+
+    def thread_loop(self):
+        asyncio.run(self._run())
+
+    async def _run(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+
+        runners = []
+        try:
+            for board in self.boards:
+                runner = web.AppRunner(board.create_app(), access_log=None)
+                await runner.setup()
+                runners.append(runner)
+
+                # Bind the socket ourselves so boards can ask for port 0 and learn the port they got
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.bind((board.host, board.port))
+                board.port = sock.getsockname()[1]
+                await web.SockSite(runner, sock).start()
+        except OSError as err:
+            self._start_error = err
+            for runner in runners:
+                await runner.cleanup()
+            self._started.set()
+            return
+
+        traffic = None
+        if self.rate > 0:
+            traffic = asyncio.ensure_future(self._push_sensor_changes())
+
+        self._started.set()
+        await self._stopped.wait()
+
+        if traffic is not None:
+            traffic.cancel()
+        for runner in runners:
+            await runner.cleanup()
+
+    async def _push_sensor_changes(self):
+        boards = [board for board in self.boards if board.inputs]
+        if not boards:
+            return
+
+        interval_s = 1 / self.rate
+        in_flight = set()
+        async with aiohttp.ClientSession() as session:
+            next_time = self._loop.time()
+            while True:
+                next_time += interval_s
+                await asyncio.sleep(max(0.0, next_time - self._loop.time()))
+
+                board = random.choice(boards)
+                api_url = self.server_url or board.api_url
+                if api_url is None:
+                    continue
+
+                task = asyncio.ensure_future(self._put_sensor_change(session, api_url, board))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+
+    async def _put_sensor_change(self, session, api_url, board):
+        pin, state = board.toggle_random_input()
+        headers = {'Authorization': 'Bearer ' + board.token} if board.token else None
+        try:
+            async with session.put(api_url + '/device/' + board.id, json={'pin': pin, 'state': state},
+                                   headers=headers) as response:
+                if response.status >= 400:
+                    self.sensor_put_failures += 1
+        except aiohttp.ClientError:
+            self.sensor_put_failures += 1
+        self.sensor_puts += 1
+
+
+def boards_from_config(config, host=None, **board_options):
+    """Build one board per sensor in an alarm system config, pre-configured with its pins"""
+    boards = []
+    for sensor_id in config['sensors'].get('sensors').split(','):
+        section = config[sensor_id]
+        inputs = []
+        outputs = []
+        for pin_number in range(1, section.getint('pins', 0) + 1):
+            if section.get('pin' + str(pin_number), '').lower() == 'output':
+                outputs.append(pin_number)
+            else:
+                inputs.append(pin_number)
+
+        boards.append(VirtualBoard(sensor_id, host or section.get('ip', '127.0.0.1'), section.getint('port', 0),
+                                   inputs, outputs, **board_options))
+    return boards
+
+
+def generated_boards(count, host='127.0.0.1', base_port=0, num_inputs=8, num_outputs=2, **board_options):
+    boards = []
+    for index in range(count):
+        port = base_port + index if base_port else 0
+        inputs = range(2, 2 + num_inputs)
+        outputs = range(2 + num_inputs, 2 + num_inputs + num_outputs)
+        boards.append(VirtualBoard('{:012d}'.format(100000000000 + index), host, port,
+                                   inputs, outputs, **board_options))
+    return boards
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', help='create a board for every sensor in this alarm system config')
+    parser.add_argument('--boards', type=int, default=1, help='number of generated boards without --config')
+    parser.add_argument('--host', help='address to serve the boards on')
+    parser.add_argument('--base-port', type=int, default=20000)
+    parser.add_argument('--inputs', type=int, default=6)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--failure-mode', choices=['error', 'hang'], default='error')
+    parser.add_argument('--server', help='alarm system URL to push sensor changes to, instead of the apiUrl '
+                                         'each board was given through /settings')
+    parser.add_argument('--rate', type=float, default=0.0, help='sensor changes pushed per second')
+    args = parser.parse_args()
+
+    options = {'latency_ms': args.latency_ms, 'failure_rate': args.failure_rate, 'failure_mode': args.failure_mode}
+    if args.config:
+        config = configparser.ConfigParser()
+        config.read(args.config)
+        simulated_boards = boards_from_config(config, args.host, **options)
+    else:
+        simulated_boards = generated_boards(args.boards, args.host or '127.0.0.1', args.base_port,
+                                            args.inputs, **options)
+
+    simulator = Simulator(simulated_boards, args.server, args.rate)
+    simulator.start()
+    for simulated_board in simulated_boards:
+        logger.info("Board %s listening on %s:%d", simulated_board.id, simulated_board.host, simulated_board.port)
+
+    try:
+        simulator._thread.join()
+    except KeyboardInterrupt:
+        simulator.stop()
@@ -0,0 +1,165 @@
+import bisect
+import threading
+
+# Upper bounds in seconds, matching the latencies we care about from sub-millisecond dispatch to board timeouts
+DEFAULT_BUCKETS_S = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Shard:
+    """The counters and histograms recorded by one thread"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+
+class MetricsRegistry:
+    """Counters and latency histograms, rendered in the Prometheus text format"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS_S):
+        self._buckets = buckets
+        self._local = threading.local()
+        # Guards the list of shards and what threads that have finished left behind
+        self._lock = threading.Lock()
+        self._shards = []
+        self._finished = _Shard()
+        self._collectors = []
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        shard = self._shard()
+        with shard.lock:
+            shard.counters[key] = shard.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        shard = self._shard()
+        with shard.lock:
+            histogram = shard.histograms.get(key)
+            if histogram is None:
+                histogram = shard.histograms[key] = Histogram(self._buckets)
+            histogram.observe(value)
+
+    def add_collector(self, collector, prefix='', label=None):
+        """Export the {name: value} gauges collector() returns on every scrape"""
+        self._collectors.append((collector, prefix, label))
+
+    def get_counter(self, name, **labels):
+        counters, _ = self._merged()
+        return counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def get_histogram(self, name, **labels):
+        _, histograms = self._merged()
+        return histograms.get((name, tuple(sorted(labels.items()))))
+
+    def clear(self):
+        with self._lock:
+            self._finished = _Shard()
+            for _, shard in self._shards:
+                with shard.lock:
+                    shard.counters.clear()
+                    shard.histograms.clear()
+
+    def render(self):
+        counters, histograms = self._merged()
+        counters = sorted(counters.items())
+        histograms = sorted((key, (h.counts, h.sum, h.count)) for key, h in histograms.items())
+
+        lines = []
+        last_name = None
+        for (name, labels), value in counters:
+            if name != last_name:
+                lines.append('# TYPE ' + name + ' counter')
+                last_name = name
+            lines.append(name + format_labels(labels) + ' ' + format_value(value))
+
+        for (name, labels), (counts, total, count) in histograms:
+            if name != last_name:
+                lines.append('# TYPE ' + name + ' histogram')
+                last_name = name
+            cumulative = 0
+            for bound, bucket_count in zip(self._buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(name + '_bucket' + format_labels(labels + (('le', str(bound)),)) + ' ' + str(cumulative))
+            lines.append(name + '_sum' + format_labels(labels) + ' ' + format_value(total))
+            lines.append(name + '_count' + format_labels(labels) + ' ' + str(count))
+
+        for collector, prefix, label in self._collectors:
+            groups = collector()
+            if label is None:
+                groups = {None: groups}
+            gauges = {}
+            for label_value, values in sorted(groups.items(), key=lambda group: str(group[0])):
+                labels = () if label is None else ((label, label_value),)
+                for name, value in values.items():
+                    gauges.setdefault(name, []).append((labels, value))
+
+            for name, samples in sorted(gauges.items()):
+                lines.append('# TYPE ' + prefix + name + ' gauge')
+                for labels, value in samples:
+                    lines.append(prefix + name + format_labels(labels) + ' ' + format_value(value))
+
+        return '\n'.join(lines) + '\n'
+
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                # Threads come and go (one per HTTP request), so fold the shards of finished ones together
+                for thread, finished in [entry for entry in self._shards if not entry[0].is_alive()]:
+                    self._shards.remove((thread, finished))
+                    _add_shard(self._finished, finished, self._buckets)
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _merged(self):
+        """({key: count}, {key: Histogram}) over every shard"""
+        merged = _Shard()
+        with self._lock:
+            _add_shard(merged, self._finished, self._buckets)
+            for _, shard in self._shards:
+                with shard.lock:
+                    _add_shard(merged, shard, self._buckets)
+        return merged.counters, merged.histograms
+
+
+def _add_shard(total, shard, buckets):
+    for key, value in shard.counters.items():
+        total.counters[key] = total.counters.get(key, 0) + value
+    for key, histogram in shard.histograms.items():
+        merged = total.histograms.get(key)
+        if merged is None:
+            merged = total.histograms[key] = Histogram(buckets)
+        merged.counts = [count + other for count, other in zip(merged.counts, histogram.counts)]
+        merged.sum += histogram.sum
+        merged.count += histogram.count
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(key + '="' + str(value).replace('"', '\\"') + '"' for key, value in labels) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
+increment = registry.increment
+observe = registry.observe
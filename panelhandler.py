@@ -1,43 +1,202 @@
 
+from flask import Response, request
 from flask_restful import Resource, reqparse
-import configparser
-import json
+from concurrent.futures import TimeoutError
+import queue
 import alarmstates
+import analytics
+import configstore
+import eventstream
+import history
+import metrics
+import sensorevents
+import sensors
+
+EVENT_TIMEOUT_S = 5
+# Comment lines sent on idle event streams, so proxies keep them open and closed clients are noticed
+EVENT_STREAM_KEEPALIVE_S = 15
 
 parser = reqparse.RequestParser()
 parser.add_argument("event")
 parser.add_argument("arm_config")
+parser.add_argument("area")
+
+get_parser = reqparse.RequestParser()
+get_parser.add_argument("area", location='args')
+
+history_parser = reqparse.RequestParser()
+history_parser.add_argument("start", type=float, location='args')
+history_parser.add_argument("end", type=float, location='args')
+history_parser.add_argument("sensor_id", location='args')
+history_parser.add_argument("zone", type=int, location='args')
+history_parser.add_argument("limit", type=int, default=100, location='args')
+history_parser.add_argument("cursor", location='args')
+
+analytics_parser = reqparse.RequestParser()
+analytics_parser.add_argument("start", type=float, location='args')
+analytics_parser.add_argument("end", type=float, location='args')
+analytics_parser.add_argument("sensor_id", location='args')
+analytics_parser.add_argument("zone", type=int, location='args')
 
 
 class PanelHandler(Resource):
     def get(self):
-        return {'current state': alarmstates.alarm_state_machine.get_current_state().name}
+        return get_area_state(get_parser.parse_args()['area'])
 
     def post(self):
         args = parser.parse_args()
-        event = alarmstates.EventType[args['event']]
-        config = args['arm_config']
-        if not alarmstates.AlarmStateMachine.is_valid_external_event(event):
-            return {'error': 'invalid event ' + args['event']}, 400
+        return post_external_event(args['event'], args['arm_config'], args['area'])
 
-        if event == alarmstates.EventType.arm:
-            if not alarmstates.arm_configurations.is_valid_arm_config(config):
-                return {'error': 'invalid arm_config ' + (config if config else "")}, 400
 
-        state = alarmstates.alarm_state_machine.process_event(event, config)
-        return {'current state': state.name}, 201
+def get_area_state(area):
+    """Returns (body, status) with the state of an area, or of the first area if area is None"""
+    machine = alarmstates.get_area(area)
+    if machine is None:
+        return {'error': 'invalid area ' + area}, 404
+    return {'current state': machine.get_current_state().name}, 200
 
 
-class SettingsHandler(Resource):
+def post_external_event(event_name, config, area=None):
+    """Post an arm/disarm event to an area and wait for its state. Returns (body, status)"""
+    machine = alarmstates.get_area(area)
+    if machine is None:
+        return {'error': 'invalid area ' + area}, 404
+
+    event = alarmstates.EventType[event_name]
+    if not alarmstates.AlarmStateMachine.is_valid_external_event(event):
+        return {'error': 'invalid event ' + event_name}, 400
+
+    if event == alarmstates.EventType.arm:
+        if not machine.arm_configurations.is_valid_arm_config(config):
+            return {'error': 'invalid arm_config ' + (config if config else "")}, 400
+
+    try:
+        future = machine.post_event(event, config, timeout=EVENT_TIMEOUT_S)
+        state = future.result(EVENT_TIMEOUT_S)
+    except (queue.Full, TimeoutError):
+        return {'error': 'event ' + event_name + ' was not processed in time'}, 503
+
+    return {'current state': state.name}, 201
+
+
+class StateEventsHandler(Resource):
+    # Server-Sent Events stream of state transitions and zone changes, starting with the current state of every area
+    def get(self):
+        return Response(state_event_stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+def state_event_stream():
+    """Yields encoded events until the subscriber is dropped or the generator is closed"""
+    broadcaster = eventstream.event_broadcaster
+    subscriber = broadcaster.subscribe()
+    current_states = [(name, machine.get_current_state()) for name, machine in alarmstates.area_machines.items()]
+
+    try:
+        for area, current_state in current_states:
+            yield eventstream.encode_event('state', {'state': current_state.name, 'area': area})
+        while True:
+            message = subscriber.get(EVENT_STREAM_KEEPALIVE_S)
+            if message is not None:
+                yield message
+            elif subscriber.dropped:
+                return
+            else:
+                yield ': keepalive\n\n'
+    finally:
+        broadcaster.unsubscribe(subscriber)
+
+
+class HistoryHandler(Resource):
+    # Zone events with start <= time < end (seconds since the epoch), oldest first, a page at a time
+    def get(self):
+        args = history_parser.parse_args()
+        if args['zone'] is not None and args['sensor_id'] is None:
+            return {'error': 'zone needs a sensor_id'}, 400
+
+        try:
+            events, next_cursor = history.zone_history.query(args['start'], args['end'], args['sensor_id'],
+                                                             args['zone'], args['limit'], args['cursor'])
+        except history.InvalidCursor as err:
+            return {'error': str(err)}, 400
+        return {'events': events, 'next_cursor': next_cursor}
+
+
+class RecentHistoryHandler(Resource):
     def get(self):
-        # TODO: clean this up to not reload config and display necessary info
-        config = configparser.ConfigParser()
-        config.read('config.ini')
+        limit = request.args.get('limit', type=int)
+        return {'events': history.zone_history.recent(limit)}
 
-        settings = {'door_chime': config.items('door_chime'),
-                    'warning': config.items('warning')}
 
-        return json.dumps(settings)
+class AnalyticsHandler(Resource):
+    # Opens, open time, opens by hour of day and flaps of each zone with events in start <= time < end
+    def get(self):
+        args = analytics_parser.parse_args()
+        if args['zone'] is not None and args['sensor_id'] is None:
+            return {'error': 'zone needs a sensor_id'}, 400
+
+        return {'zones': analytics.zone_analytics.zone_statistics(args['start'], args['end'], args['sensor_id'],
+                                                                  args['zone'])}
+
+
+class DispatcherHandler(Resource):
+    # The dispatcher metrics of every area, or of one with ?area=
+    def get(self):
+        area = get_parser.parse_args()['area']
+        if area is None:
+            return alarmstates.get_dispatcher_metrics()
+
+        machine = alarmstates.get_area(area)
+        if machine is None:
+            return {'error': 'invalid area ' + area}, 404
+        return machine.dispatcher.get_metrics()
+
+
+class MetricsHandler(Resource):
+    def get(self):
+        return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+class SettingsHandler(Resource):
+    def get(self):
+        store = configstore.config_store
+        if request.if_none_match.contains(store.etag):
+            response = Response(status=304)
+        else:
+            response = Response(store.settings_json, mimetype='application/json')
+        response.set_etag(store.etag)
+        return response
 
     def put(self):
-        return 200
+        changes = request.get_json(silent=True)
+        if not isinstance(changes, dict):
+            return {'error': 'expected {section: {setting: value}}'}, 400
+
+        expected_etags = None
+        if request.if_match and not request.if_match.star_tag:
+            expected_etags = request.if_match.as_set()
+
+        try:
+            configstore.config_store.update(changes, expected_etags)
+        except ValueError as err:
+            return {'error': str(err)}, 400
+        except configstore.ConfigStore.VersionMismatch:
+            return {'error': 'configuration has changed'}, 412
+
+        store = configstore.config_store
+        response = Response(store.settings_json, mimetype='application/json')
+        response.set_etag(store.etag)
+        return response
+
+
+class ReloadHandler(Resource):
+    def post(self):
+        config = configstore.config_store.reload()
+
+        report = sensors.reload_sensors(config)
+        alarmstates.load_areas(config)
+        alarmstates.start_areas()
+        sensorevents.sensor_event_filter.load_from_config(config)
+
+        report['areas'] = {name: sorted(machine.arm_configurations.configurations)
+                           for name, machine in alarmstates.area_machines.items()}
+        return report
@@ -0,0 +1,13 @@
+# Parsing of sensor pin updates, shared by the HTTP handlers of the single process server and of the HTTP workers,
+# so in the production serving mode malformed updates are rejected by the workers and never reach the state owner
+
+
+def parse_pin_updates(updates):
+    """[(pin, state)] from [{'pin', 'state'}] updates. Raises ValueError naming the first malformed update"""
+    pin_states = []
+    for update in updates:
+        try:
+            pin_states.append((int(update['pin']), int(update['state'])))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Invalid pin update {}".format(update))
+    return pin_states
@@ -0,0 +1,169 @@
+import logging
+import queue
+import threading
+
+import alarmstates
+import clocks
+import eventstream
+import history
+import sensors
+import timerwheel
+
+logger = logging.getLogger(__name__)
+
+
+class SensorEventFilter:
+    """Drops sensor events that carry no news and holds back bouncing zones"""
+    CONST_RETRY_s = 0.1
+
+    def __init__(self, hold_off_s=0.0):
+        self.hold_off_s = hold_off_s
+
+        # Guard the entries of their sensor's zones in the dicts below
+        self._sensor_locks = {}
+        self._last_forwarded = {}
+        self._last_reported_state = {}
+        self._last_recorded_state = {}
+        self._pending_timers = {}
+
+        self._metrics_lock = threading.Lock()
+        self.duplicate_pin_updates = 0
+        self.unchanged_zone_updates = 0
+        self.debounced_zone_events = 0
+        self.trailing_zone_events = 0
+        self.forwarded_zone_events = 0
+
+    def load_from_config(self, config):
+        self.hold_off_s = config.getfloat('sensor_events', 'hold_off_ms', fallback=0) / 1000
+
+    def update_pins(self, sensor_id, pin_states, timeout=None):
+        """Apply (pin, state) pairs for one sensor. Returns the zones forwarded; raises queue.Full"""
+        duplicates = unchanged = debounced = 0
+        to_forward = []
+        with self._sensor_lock(sensor_id):
+            changed_zones = []
+            retried_zones = []
+            for pin, state in pin_states:
+                if pin.state == state:
+                    duplicates += 1
+                    # A board retrying an update that was refused: the pin already has its state but its zone
+                    # may not have reached the state machine, so news is judged against what was last forwarded
+                    if pin.zone is not None and pin.zone not in changed_zones and self._unreported(sensor_id, pin.zone):
+                        changed_zones.append(pin.zone)
+                        retried_zones.append(pin.zone)
+                elif pin.update_state(state):
+                    if pin.zone not in changed_zones:
+                        changed_zones.append(pin.zone)
+                else:
+                    unchanged += 1
+
+            now = clocks.clock.monotonic()
+            for zone in changed_zones:
+                key = sensors.ZoneData(sensor_id, zone.number)
+                if now - self._last_forwarded.get(key, -self.hold_off_s) < self.hold_off_s:
+                    if zone not in retried_zones:
+                        debounced += 1
+                    self._schedule_trailing_check(key, zone, self._last_forwarded[key] + self.hold_off_s - now)
+                    continue
+
+                to_forward.append(self._mark_forwarded(key, zone, now))
+
+        with self._metrics_lock:
+            self.duplicate_pin_updates += duplicates
+            self.unchanged_zone_updates += unchanged
+            self.debounced_zone_events += debounced
+
+        forwarded = []
+        for position, forwarding in enumerate(to_forward):
+            try:
+                self._forward(forwarding, timeout)
+            except queue.Full:
+                self._retry_later(sensor_id, to_forward[position:], self.CONST_RETRY_s)
+                raise
+            forwarded.append(forwarding[0].zone_number)
+        return forwarded
+
+    def _sensor_lock(self, sensor_id):
+        lock = self._sensor_locks.get(sensor_id)
+        if lock is None:
+            lock = self._sensor_locks.setdefault(sensor_id, threading.Lock())
+        return lock
+
+    # The methods below that don't post events are called with the zone's sensor lock held
+    def _unreported(self, sensor_id, zone):
+        return zone.state != self._last_reported_state.get(sensors.ZoneData(sensor_id, zone.number), 0)
+
+    def _mark_forwarded(self, key, zone, now):
+        """Record the zone's state as sent, under the sensor lock, before it is posted"""
+        forwarding = (key, zone, zone.state, self._last_forwarded.get(key), self._last_reported_state.get(key))
+        self._last_forwarded[key] = now
+        self._last_reported_state[key] = zone.state
+        # A zone refused by a full queue is marked again when it is retried, but it only changed once
+        if self._last_recorded_state.get(key) != zone.state:
+            self._last_recorded_state[key] = zone.state
+            eventstream.event_broadcaster.publish('zone', {'sensor_id': key.sensor_id, 'zone': zone.number,
+                                                           'name': zone.name, 'state': zone.state})
+            history.zone_history.record(key.sensor_id, zone.number, zone.name, zone.state)
+        # A trailing check left waiting to send this zone has nothing more to do
+        pending_timer = self._pending_timers.pop(key, None)
+        if pending_timer is not None:
+            pending_timer.cancel()
+        return forwarding
+
+    def _schedule_trailing_check(self, key, zone, delay_s):
+        if key in self._pending_timers:
+            return
+
+        self._pending_timers[key] = timerwheel.timer_wheel.schedule(delay_s, self._trailing_check, key, zone)
+
+    def _forward(self, forwarding, timeout):
+        key = forwarding[0]
+        alarmstates.machine_for_zone(key).post_event(alarmstates.EventType.sensor_changed, key, timeout=timeout)
+        with self._metrics_lock:
+            self.forwarded_zone_events += 1
+
+    def _retry_later(self, sensor_id, unforwarded, delay_s):
+        """Undo _mark_forwarded for events the queue refused and have a trailing check send them instead"""
+        with self._sensor_lock(sensor_id):
+            for key, zone, state, last_forwarded, last_reported_state in unforwarded:
+                # Unless an update since has already decided to send the zone again
+                if self._last_reported_state.get(key) == state and key not in self._pending_timers:
+                    _restore(self._last_forwarded, key, last_forwarded)
+                    _restore(self._last_reported_state, key, last_reported_state)
+                    self._schedule_trailing_check(key, zone, delay_s)
+
+    def _trailing_check(self, key, zone):
+        with self._sensor_lock(key.sensor_id):
+            # Already gone if the zone was forwarded while this was waiting for the lock
+            self._pending_timers.pop(key, None)
+            if not self._unreported(key.sensor_id, zone):
+                return
+            forwarding = self._mark_forwarded(key, zone, clocks.clock.monotonic())
+
+        # This runs on the timer wheel thread, so don't wait for room in the event queue; try again later
+        try:
+            self._forward(forwarding, 0)
+        except queue.Full:
+            self._retry_later(key.sensor_id, [forwarding], max(self.hold_off_s, self.CONST_RETRY_s))
+            return
+        with self._metrics_lock:
+            self.trailing_zone_events += 1
+
+    def get_metrics(self):
+        with self._metrics_lock:
+            return {'hold_off_ms': self.hold_off_s * 1000,
+                    'duplicate_pin_updates': self.duplicate_pin_updates,
+                    'unchanged_zone_updates': self.unchanged_zone_updates,
+                    'debounced_zone_events': self.debounced_zone_events,
+                    'trailing_zone_events': self.trailing_zone_events,
+                    'forwarded_zone_events': self.forwarded_zone_events}
+
+
+def _restore(values, key, value):
+    if value is None:
+        values.pop(key, None)
+    else:
+        values[key] = value
+
+
+sensor_event_filter = SensorEventFilter()
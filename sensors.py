@@ -1,13 +1,28 @@
 
+from concurrent.futures import Future
+from enum import Enum
+import asyncio
+import random
+import threading
 import time
 import konnected
+import konnected.aio
+import array
 import collections
 import logging
 
+import actuators
+import clocks
+import metrics
 import simplethread
+import timerwheel
 
 logger = logging.getLogger(__name__)
 
+HARDWARE_INIT_DEADLINE_s = 15
+HARDWARE_INIT_RETRY_s = 5
+HARDWARE_INIT_MAX_RETRY_s = 300
+
 
 def load_sensors(config):
     sensors_ids = config['sensors'].get('sensors')
@@ -20,35 +35,207 @@ def load_sensors(config):
         sensor_list[sensor_id] = new_sensor
 
 
-def initialize_sensor_hardware(config):
-    for sensor in sensor_list.values():
-        sensor.initialize_hardware(config)
+def reload_sensors(config):
+    """Bring sensor_list in line with config, rebuilding only changed sensors. Returns a change report"""
+    global sensor_list
+    old_list = sensor_list
+    sensor_id_list = config['sensors'].get('sensors').split(',')
+    kept_ids = [sensor_id for sensor_id in sensor_id_list
+                if sensor_id in old_list and old_list[sensor_id].settings == dict(config[sensor_id])]
+
+    report = {'added': [], 'removed': [], 'rebuilt': [], 'unchanged': kept_ids, 'hardware': {}}
+    new_list = {}
+    needs_settings = []
+    for sensor_id in sensor_id_list:
+        if sensor_id in kept_ids:
+            new_list[sensor_id] = old_list[sensor_id]
+            continue
+
+        # The chime and siren keep playing on the old sensors until the new list is swapped in
+        new_sensor = Sensor(config[sensor_id])
+        new_sensor.load_zones_and_pins(config, connect_outputs=False)
+        new_list[sensor_id] = new_sensor
+
+        old_sensor = old_list.get(sensor_id)
+        if old_sensor is None:
+            report['added'].append(sensor_id)
+            needs_settings.append(new_sensor)
+        else:
+            report['rebuilt'].append(sensor_id)
+            new_sensor.copy_pin_states(old_sensor)
+            if (new_sensor.pin_layout() != old_sensor.pin_layout() or
+                    (new_sensor.ip, new_sensor.port) != (old_sensor.ip, old_sensor.port)):
+                needs_settings.append(new_sensor)
+
+    sensor_list = new_list
+    _connect_outputs(new_list.values())
+
+    for sensor_id, old_sensor in old_list.items():
+        if new_list.get(sensor_id) is not old_sensor:
+            old_sensor.stop()
+            if sensor_id not in new_list:
+                report['removed'].append(sensor_id)
+
+    if needs_settings:
+        report['hardware'] = initialize_sensor_hardware(config, needs_settings)
+    return report
+
+
+def _connect_outputs(sensors):
+    """Point the chime and siren at the sensor that declares them, or at nothing if none of sensors does"""
+    for role, output in (('chime', tone_generator), ('siren', siren)):
+        owners = [sensor for sensor in sensors if role in sensor.output_roles]
+        if len(owners) > 1:
+            logger.error('Duplicate ' + role + 's found on sensors ' + ', '.join(owner.id for owner in owners) +
+                         '. Only the one on ' + owners[-1].id + ' will be used')
+        if owners:
+            output.connect(owners[-1], owners[-1].output_roles[role])
+        else:
+            output.connect(None, 0)
+
+
+def get_liveness_counts():
+    counts = {state.name: 0 for state in LivenessState}
+    for sensor in list(sensor_list.values()):
+        counts[sensor.liveness_check.state.name] += 1
+    return counts
+
+
+def initialize_sensor_hardware(config, sensors_to_initialize=None):
+    """Push settings to the boards and wait up to init_deadline_s. Returns {sensor_id: outcome}"""
+    deadline_s = config['server'].getfloat('init_deadline_s', HARDWARE_INIT_DEADLINE_s)
+    _hardware_init_stop.clear()
+
+    if sensors_to_initialize is None:
+        sensors_to_initialize = list(sensor_list.values())
+
+    attempted = threading.Condition()
+
+    def notify_attempted(_):
+        with attempted:
+            attempted.notify_all()
+
+    first_attempts = {}
+    for sensor in sensors_to_initialize:
+        first_attempt = Future()
+        first_attempt.add_done_callback(notify_attempted)
+        first_attempts[sensor.id] = first_attempt
+        _start_initialization(sensor, config, first_attempt)
+
+    with attempted:
+        clocks.clock.wait_for(attempted, lambda: all(attempt.done() for attempt in first_attempts.values()),
+                              deadline_s)
+
+    report = {}
+    for sensor_id, first_attempt in first_attempts.items():
+        if not first_attempt.done():
+            report[sensor_id] = 'timed out'
+        elif first_attempt.result():
+            report[sensor_id] = 'initialized'
+        else:
+            report[sensor_id] = 'failed'
+    return report
+
+
+def stop_hardware_initialization():
+    _hardware_init_stop.set()
+    with _hardware_init_lock:
+        retries = list(_hardware_init_retries.values())
+        _hardware_init_retries.clear()
+    for _, retry in retries:
+        retry.cancel()
+
+
+def _cancel_hardware_initialization(sensor):
+    with _hardware_init_lock:
+        retry = _hardware_init_retries.get(sensor.id)
+        if retry is None or retry[0] is not sensor:
+            return
+        del _hardware_init_retries[sensor.id]
+    retry[1].cancel()
+
+
+def _initialize_until_success(sensor, config, first_attempt, retry_s=None):
+    # A sensor that was reloaded or removed since the attempt was scheduled has nothing left to initialize
+    if _hardware_init_stop.is_set() or sensor_list.get(sensor.id) is not sensor:
+        with _hardware_init_lock:
+            if _hardware_init_retries.get(sensor.id, (None,))[0] is sensor:
+                del _hardware_init_retries[sensor.id]
+        if not first_attempt.done():
+            first_attempt.set_result(False)
+        return
+
+    try:
+        initialized = sensor.initialize_hardware(config)
+    except konnected.Client.ClientError as err:
+        logger.warning("Failed to initialize sensor " + sensor.id + ": " + str(err))
+        initialized = False
+
+    if not first_attempt.done():
+        first_attempt.set_result(initialized)
+
+    # Wait for the next attempt on the timer wheel rather than holding a thread per failing board
+    retry_s = HARDWARE_INIT_RETRY_s if retry_s is None else retry_s
+    with _hardware_init_lock:
+        if _hardware_init_retries.get(sensor.id, (sensor,))[0] is sensor:
+            _hardware_init_retries.pop(sensor.id, None)
+        if initialized or _hardware_init_stop.is_set() or sensor_list.get(sensor.id) is not sensor:
+            return
+        _hardware_init_retries[sensor.id] = (sensor, timerwheel.timer_wheel.schedule(
+            retry_s, _start_initialization, sensor, config, first_attempt,
+            min(retry_s * 2, HARDWARE_INIT_MAX_RETRY_s)))
+
+
+def _start_initialization(sensor, config, first_attempt, retry_s=None):
+    # The attempt is a blocking request, so it gets its own thread
+    threading.Thread(target=_initialize_until_success, args=(sensor, config, first_attempt, retry_s),
+                     daemon=True).start()
 
 
 class Sensor:
+    """One Konnected board; pin_states is indexed by pin number and pin_zones maps pins to zones"""
+    __slots__ = ('id', 'settings', 'ip', 'port', 'total_pins', 'total_zones', 'konnected_client', 'actuator_queue',
+                 'zones', 'input_pins', 'output_pins', 'pin_states', 'pin_zones', 'configured_inputs',
+                 'configured_outputs', 'output_roles', 'settings_payload', 'liveness_check')
     HEART_BEAT_TIMEOUT_S = 5
 
     def __init__(self, config):
         self.id = config.name
+        self.settings = dict(config)
         self.ip = config.get('ip', "127.0.0.1")
         self.port = config.get('port', 65000)
 
         self.total_pins = config.getint('pins', 0)
         self.total_zones = config.getint('zones', 0)
 
-        self.konnected_client = konnected.Client(self.ip, self.port)
+        pool_size = config.getint('pool_size', konnected.DEFAULT_POOL_SIZE)
+        timeout_s = config.getfloat('timeout_s', konnected.DEFAULT_TIMEOUT_S)
+        self.konnected_client = konnected.Client(self.ip, self.port, pool_size, timeout_s)
+        self.actuator_queue = actuators.ActuatorQueue(self.konnected_client)
 
         self.zones = {}
         self.input_pins = {}
         self.output_pins = {}
+        self.pin_states = bytearray(self.total_pins + 1)
+        self.pin_zones = array.array('H', [0]) * (self.total_pins + 1)
+        self.configured_inputs = frozenset()
+        self.configured_outputs = frozenset()
+        # 'chime' / 'siren': the output pin this board drives it on
+        self.output_roles = {}
+        self.settings_payload = None
 
-        self._heart_beat_check = SensorLivenessCheck(self)
-        self._heart_beat_check.start()
+        self.liveness_check = SensorLivenessCheck(self)
+        self.liveness_check.start()
 
     def __del__(self):
-        self._heart_beat_check.stop()
+        self.stop()
+
+    def stop(self):
+        _cancel_hardware_initialization(self)
+        self.liveness_check.stop()
+        self.actuator_queue.stop()
 
-    def load_zones_and_pins(self, config):
+    def load_zones_and_pins(self, config, connect_outputs=True):
         for zone_number in range(1, self.total_zones + 1):
             new_zone = Zone(zone_number, config[self.id])
             self.zones[zone_number] = new_zone
@@ -60,117 +247,351 @@ class Sensor:
             if pin_type.lower() == 'output':
                 self.load_output_pin((pin_number, pin_str), config)
             else:
-                new_pin = Pin(pin_number)
+                new_pin = Pin(pin_number, self.pin_states)
 
                 pin_zone = config[self.id].getint(pin_str + '_zone')
                 if pin_zone is not None:
                     new_pin.zone = self.zones[pin_zone]
-                    new_pin.zone.pins[pin_number] = new_pin
+                    new_pin.zone.pin_numbers.append(pin_number)
+                    self.pin_zones[pin_number] = pin_zone
 
                 self.input_pins[pin_number] = new_pin
 
+        # The pins the board should report back, matching what build_settings_payload sends it
+        self.configured_inputs = frozenset(self.input_pins)
+        self.configured_outputs = frozenset(self.output_roles.values())
+        if connect_outputs:
+            self.connect_outputs()
+
+    def connect_outputs(self):
+        """Play the chime and sound the siren on this board, if it declares them"""
+        for role, output in (('chime', tone_generator), ('siren', siren)):
+            if role not in self.output_roles:
+                continue
+            if output.sensor is not None and output.sensor is not self:
+                logger.error('Duplicate ' + role + 's found. The one on ' + output.sensor.id + ' is replaced by pin ' +
+                             str(self.output_roles[role]) + ' of ' + self.id)
+            output.connect(self, self.output_roles[role])
+
+    def pin_layout(self):
+        return self.configured_inputs, self.configured_outputs
+
+    def snapshot_pin_states(self):
+        return bytes(self.pin_states)
+
+    def copy_pin_states(self, other_sensor):
+        for pin_number, pin in self.input_pins.items():
+            if pin_number in other_sensor.input_pins:
+                pin.update_state(other_sensor.input_pins[pin_number].state)
+
     def load_output_pin(self, pin_params, config):
         pin_number, id_str = pin_params
         pin_name = config[self.id].get(id_str + '_name')
 
-        if pin_name.lower() == 'chime':
-            if tone_generator.pin_number != 0:
-                logger.error('Duplicate chimes found.  Second Chime is pin ' + id_str + '. This will be ignored')
-
-            tone_generator.pin_number = pin_number
-            tone_generator.sensor = self
-            tone_generator.load_chime_parameters_from_config(config['door_chime'])
-
-        elif pin_name.lower() == 'siren':
-            if siren.pin_number != 0:
-                logger.error('Duplicate sirens found.  Second Chime is pin ' + id_str + '. This will be ignored')
-
-            siren.pin_number = pin_number
-            siren.sensor = self
+        role = pin_name.lower()
+        if role in ('chime', 'siren'):
+            if role in self.output_roles:
+                logger.error('Duplicate ' + role + 's found.  Second is pin ' + id_str + '. This will be ignored')
+            else:
+                self.output_roles[role] = pin_number
+            if role == 'chime':
+                tone_generator.load_chime_parameters_from_config(config['door_chime'])
 
-        self.output_pins[pin_number] = Pin(pin_number)
+        self.output_pins[pin_number] = Pin(pin_number, self.pin_states)
 
     def initialize_hardware(self, config):
+        self.settings_payload = self.build_settings_payload(config)
+        return self.konnected_client.put_settings(**self.settings_payload)
+
+    def build_settings_payload(self, config):
         inputs = []
-        for pin in self.input_pins.values():
-            inputs.append({'pin': pin.pin_number})
+        for pin_number in sorted(self.configured_inputs):
+            inputs.append({'pin': pin_number})
 
         outputs = []
-        if tone_generator.pin_number != 0:
-            outputs.append({'pin': tone_generator.pin_number})
-        if siren.pin_number != 0:
-            outputs.append({'pin': siren.pin_number})
+        for pin_number in sorted(self.configured_outputs):
+            outputs.append({'pin': pin_number})
 
         token = config['server'].get('token', 'secureToken')
         url = config['server'].get('url', '127.0.0.1')
         port = config['server'].get('port', '5000')
 
-        self.konnected_client.put_settings(inputs, outputs, 'secureToken', 'http://' + url + ':' + port)
+        return {'sensors': inputs, 'actuators': outputs, 'auth_token': token,
+                'endpoint': 'http://' + url + ':' + port}
+
+
+class LivenessState(Enum):
+    alive = 0
+    suspect = 1
+    dead = 2
 
 
-class SensorLivenessCheck(simplethread.SimpleThread):
+class SensorLivenessCheck:
+    """Polls a board less often the longer it stays healthy, and probes it quickly once it misses"""
     CONST_HEARTBEAT_PERIOD_s = 5
+    CONST_MAX_PERIOD_s = 60
+    CONST_PROBE_PERIOD_s = 1
+    CONST_DEAD_AFTER_MISSES = 3
+    CONST_RECONFIGURE_INTERVAL_s = 60
 
     def __init__(self, sensor):
         self._sensor = sensor
-        self._sensor_alive = False
+        self._client = konnected.aio.AsyncClient(sensor.ip, sensor.port,
+                                                 timeout=sensor.HEART_BEAT_TIMEOUT_S)
+        self._lock = threading.Lock()
+
+        # Nothing is known until the first poll, which comes quickly
+        self.state = LivenessState.suspect
+        self.misses = 0
+        self.last_seen = None
+        self.last_activity = None
+        self.last_polled = None
+        self.last_reconfigured = None
+
+        self.period_s = self.CONST_PROBE_PERIOD_s
+        self.deadline_s = sensor.HEART_BEAT_TIMEOUT_S
+
+    def start(self):
+        liveness_scheduler.add(self)
+
+    def stop(self):
+        liveness_scheduler.remove(self)
+
+    def is_alive(self):
+        return self.state == LivenessState.alive
+
+    def get_status(self):
+        now = clocks.clock.monotonic()
+        return {'state': self.state.name,
+                'misses': self.misses,
+                'period_s': self.period_s,
+                'last_seen_s': None if self.last_seen is None else now - self.last_seen}
+
+    def record_activity(self):
+        """Called for every inbound request from the board, which proves it is up"""
+        self.last_seen = self.last_activity = clocks.clock.monotonic()
+        if self.state != LivenessState.alive:
+            with self._lock:
+                self._set_state(LivenessState.alive)
+                self.misses = 0
+
+    async def check(self):
+        now = clocks.clock.monotonic()
+        # Skip the poll if the board has sent us something since the last one
+        if (self.state == LivenessState.alive and self.last_polled is not None and
+                self.last_activity is not None and self.last_activity > self.last_polled and
+                now - self.last_polled < self.CONST_MAX_PERIOD_s):
+            metrics.increment('sensor_heartbeat_skipped_total', sensor=self._sensor.id)
+            self._succeeded()
+            return
+
+        start = time.perf_counter()
+        self.last_polled = now
+        try:
+            sensor_status = await asyncio.wait_for(self._client.get_status(), self.deadline_s)
+        except (asyncio.TimeoutError, konnected.Client.ClientError) as err:
+            metrics.increment('sensor_heartbeat_failures_total', sensor=self._sensor.id)
+            logger.warning("Failed to get status from sensor " + self._sensor.id + ": " + str(err))
+            self._failed()
+            return
+
+        metrics.observe('sensor_heartbeat_seconds', time.perf_counter() - start, sensor=self._sensor.id)
+        self.last_seen = clocks.clock.monotonic()
+        self._succeeded()
+        if self.process_status(sensor_status) is False:
+            await self.reconfigure()
+
+    def _succeeded(self):
+        with self._lock:
+            self._set_state(LivenessState.alive)
+            self.misses = 0
+            if self.period_s < self.CONST_HEARTBEAT_PERIOD_s:
+                self.period_s = self.CONST_HEARTBEAT_PERIOD_s
+            else:
+                self.period_s = min(self.period_s * 2, self.CONST_MAX_PERIOD_s)
+
+    def _failed(self):
+        with self._lock:
+            self.misses += 1
+            if self.misses < self.CONST_DEAD_AFTER_MISSES:
+                self._set_state(LivenessState.suspect)
+                self.period_s = self.CONST_PROBE_PERIOD_s
+            else:
+                self._set_state(LivenessState.dead)
+                self.period_s = min(self.period_s * 2, self.CONST_MAX_PERIOD_s)
 
-    def thread_loop(self):
-        while self._running is True:
-            sensor_status = self._sensor.konnected_client.get_status()
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        logger.info("Sensor %s is now %s", self._sensor.id, state.name)
+        metrics.increment('sensor_liveness_transitions_total', sensor=self._sensor.id, state=state.name)
+        self.state = state
 
-            input_pins = sensor_status['sensors']
-            if self.compare_pins(self._sensor.input_pins, input_pins) is False:
-                # TODO: reconfigure sensor
-                logger.info("Need to reconfigure sensor due to inputs not configured correctly")
-                pass
+    async def close(self):
+        await self._client.close()
 
-            output_pins = sensor_status['actuators']
-            if SensorLivenessCheck.compare_pins(self._sensor.output_pins, output_pins) is False:
-                # TODO: reconfigure sensor
-                logger.info("Need to reconfigure sensor due to outputs not configured correctly")
-                pass
+    def process_status(self, sensor_status):
+        """Returns False if the pins reported by the board don't match its configuration"""
+        logger.debug("Received status from sensor: " + sensor_status['mac'])
 
-            logger.debug("Received status from sensor: " + sensor_status['mac'])
+        if self.compare_pins(self._sensor.configured_inputs, sensor_status['sensors']) is False:
+            logger.info("Need to reconfigure sensor %s due to inputs not configured correctly", self._sensor.id)
+            return False
 
-            time.sleep(self.CONST_HEARTBEAT_PERIOD_s)
+        if self.compare_pins(self._sensor.configured_outputs, sensor_status['actuators']) is False:
+            logger.info("Need to reconfigure sensor %s due to outputs not configured correctly", self._sensor.id)
+            return False
 
-    # Check through the list of configured pins reported from the sensor to see if there is a mismatch
-    # By individually ensuring that each pin from sensor is present from config, and then comparing
-    # the numbers of configured pins, that SHOULD catch all error cases
+        return True
+
+    async def reconfigure(self):
+        """Push the board's settings again, at most once per CONST_RECONFIGURE_INTERVAL_s"""
+        now = clocks.clock.monotonic()
+        if self._sensor.settings_payload is None:
+            # Hardware initialization hasn't run yet and will send the settings itself
+            return
+        if self.last_reconfigured is not None and now - self.last_reconfigured < self.CONST_RECONFIGURE_INTERVAL_s:
+            metrics.increment('sensor_reconfigurations_skipped_total', sensor=self._sensor.id)
+            return
+        self.last_reconfigured = now
+
+        start = time.perf_counter()
+        try:
+            succeeded = await self._client.put_settings(**self._sensor.settings_payload)
+        except konnected.Client.ClientError as err:
+            logger.warning("Failed to reconfigure sensor " + self._sensor.id + ": " + str(err))
+            succeeded = False
+
+        metrics.increment('sensor_reconfigurations_total', sensor=self._sensor.id,
+                          result='succeeded' if succeeded else 'failed')
+        metrics.observe('sensor_reconfiguration_seconds', time.perf_counter() - start, sensor=self._sensor.id)
+
+    # The board reports every pin it has been configured with, so its settings are correct exactly
+    # when the set of reported pin numbers equals the set we configured. This covers
     # - More config pins than sensor-reported pins
     # - Equal numbers but different pins
     # - More sensor-reported pins than config pins
     @staticmethod
-    def compare_pins(config_pins, reported_pins):
-        for pin in reported_pins:
-            pin_number = pin['pin']
-            if pin_number not in config_pins:
-                logger.warning("Found invalid pin number from sensor: " + str(pin_number))
-                return False
-
-        if len(reported_pins) != len(config_pins):
+    def compare_pins(configured_pins, reported_pins):
+        reported_numbers = {pin['pin'] for pin in reported_pins}
+        if reported_numbers == configured_pins:
+            return True
+
+        if reported_numbers - configured_pins:
+            logger.warning("Found invalid pin numbers from sensor: " + str(sorted(reported_numbers - configured_pins)))
+        else:
             logger.warning("Found mismatched configured pin counts from sensor and config")
-            return False
+        return False
 
-        return True
+
+class LivenessScheduler(simplethread.SimpleThread):
+    """Runs every SensorLivenessCheck as a task on one asyncio loop, so polling uses a single thread"""
+    JITTER_FRACTION = 0.2
+
+    def __init__(self):
+        simplethread.SimpleThread.__init__(self)
+        self._checks = set()
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._stopped = None
+
+    def add(self, check):
+        with self._lock:
+            self._checks.add(check)
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._start_task, check)
+
+            if not self._running:
+                self.start()
+
+    def remove(self, check):
+        with self._lock:
+            self._checks.discard(check)
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._remove_task, check)
+
+    def stop(self):
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._stopped.set)
+
+        self._thread.join()
+        del self._thread
+
+    def thread_loop(self):
+        asyncio.run(self._run())
+
+    async def _run(self):
+        self._stopped = asyncio.Event()
+        with self._lock:
+            if not self._running:
+                return
+            self._loop = asyncio.get_running_loop()
+            for check in self._checks:
+                self._start_task(check)
+
+        await self._stopped.wait()
+
+        with self._lock:
+            self._loop = None
+            checks = list(self._tasks)
+        for check in checks:
+            self._tasks.pop(check).cancel()
+        await asyncio.gather(*[check.close() for check in checks], return_exceptions=True)
+
+    def _start_task(self, check):
+        if check not in self._tasks:
+            self._tasks[check] = asyncio.ensure_future(self._poll(check))
+
+    def _remove_task(self, check):
+        task = self._tasks.pop(check, None)
+        if task is not None:
+            task.cancel()
+            asyncio.ensure_future(check.close())
+
+    async def _poll(self, check):
+        # Spread the first polls over one period so boards aren't all hit in the same instant
+        await clocks.clock.sleep_async(random.uniform(0, check.period_s))
+        while True:
+            try:
+                await check.check()
+            except Exception:
+                logger.exception("Heartbeat check failed")
+            await clocks.clock.sleep_async(self.jittered(check.period_s))
+
+    @classmethod
+    def jittered(cls, period_s):
+        return period_s * random.uniform(1 - cls.JITTER_FRACTION, 1 + cls.JITTER_FRACTION)
 
 
 class Zone:
+    __slots__ = ('number', 'name', 'chime_enabled', 'pin_numbers', 'state', 'active_pins')
+
     def __init__(self, number, config):
         self.number = number
         self.name = config.get('zone' + str(number) + '_name', '')
         self.chime_enabled = config.getboolean('zone' + str(number) + '_chime', False)
 
-        self.pins = {}
+        # Numbers of the member pins, which index the owning sensor's input_pins and pin_states
+        self.pin_numbers = array.array('H')
         self.state = 0
+        self.active_pins = 0
+
+    # Called by a member pin whenever its state changes. Returns True if the zone state changed
+    def update_state(self, pin_was_active, pin_is_active):
+        if pin_was_active == pin_is_active:
+            return False
 
-    def update_state(self):
-        new_state = 0
-        for pin in self.pins:
-            new_state = new_state or self.pins[pin].state
+        self.active_pins += 1 if pin_is_active else -1
 
+        new_state = 1 if self.active_pins > 0 else 0
+        changed = new_state != self.state
         self.state = new_state
+        return changed
 
     def process_door_chime(self):
         if self.chime_enabled:
@@ -178,15 +599,26 @@ class Zone:
 
 
 class Pin:
-    def __init__(self, number):
+    __slots__ = ('pin_number', 'zone', '_states')
+
+    def __init__(self, number, states=None):
         self.pin_number = number
-        self.state = 0
         self.zone = None
+        # The owning sensor's pin_states table; a pin created on its own gets a private one
+        self._states = states if states is not None else bytearray(number + 1)
 
+    @property
+    def state(self):
+        return self._states[self.pin_number]
+
+    # Returns True if this changed the state of the pin's zone
     def update_state(self, new_state):
-        self.state = new_state
-        if self.zone is not None:
-            self.zone.update_state()
+        states = self._states
+        old_state = states[self.pin_number]
+        states[self.pin_number] = 1 if new_state else 0
+        if self.zone is None:
+            return False
+        return self.zone.update_state(bool(old_state), bool(new_state))
 
     def get_zone_number(self):
         if self.zone is None:
@@ -194,10 +626,48 @@ class Pin:
         return self.zone.number
 
 
-class ToneGenerator:
+class Output:
+    """The chime or the siren, driven by one output pin of one sensor"""
+    def __init__(self):
+        self._connection = (None, 0)
+        # Every area's machine drives the same output, so it stays on while any area still holds it
+        self._holders_lock = threading.Lock()
+        self._holders = set()
+
+    @property
+    def sensor(self):
+        return self._connection[0]
+
+    @property
+    def pin_number(self):
+        return self._connection[1]
+
+    def connect(self, sensor, pin_number):
+        self._connection = (sensor, pin_number)
+
+    def submit(self, *args):
+        sensor, pin_number = self._connection
+        return sensor.actuator_queue.submit(pin_number, *args)
+
+    def hold(self, holder):
+        with self._holders_lock:
+            self._holders.add(holder)
+            return self.submit(1)
+
+    def release(self, holder):
+        """Turn the output off unless another holder still needs it, in which case None is returned"""
+        with self._holders_lock:
+            self._holders.discard(holder)
+            if self._holders:
+                logger.info("Output on pin %d kept on for %s", self.pin_number,
+                            ', '.join(str(getattr(holder, 'name', holder)) for holder in self._holders))
+                return None
+            return self.submit(0)
+
+
+class ToneGenerator(Output):
     def __init__(self):
-        self.pin_number = 0
-        self.sensor = None
+        super().__init__()
 
         self.number_of_beeps = 0
         self.beep_duration_ms = 0
@@ -208,40 +678,45 @@ class ToneGenerator:
         self.beep_duration_ms = config.getint('beep_duration_ms')
         self.pause_duration_ms = config.getint('pause_duration_ms')
 
-    def play_constant_tone(self):
+    def play_constant_tone(self, area=None):
         logger.info("Playing tone")
-        self.sensor.konnected_client.put_device(self.pin_number, 1)
+        return self.hold(area)
 
-    def stop_constant_tone(self):
+    def stop_constant_tone(self, area=None):
         logger.info("Stopping tone")
-        self.sensor.konnected_client.put_device(self.pin_number, 0)
+        return self.release(area)
 
     def play_chime(self):
         logger.info("Playing door chime")
-        self.sensor.konnected_client.put_device(self.pin_number,
-                                                1,
-                                                self.beep_duration_ms,
-                                                self.number_of_beeps,
-                                                self.pause_duration_ms)
+        return self.submit(1, self.beep_duration_ms, self.number_of_beeps, self.pause_duration_ms)
 
 
-class Siren:
-    def __init__(self):
-        self.pin_number = 0
-        self.sensor = None
-
-    def activate_siren(self):
+class Siren(Output):
+    def activate_siren(self, area=None):
         logger.info("Siren activated")
-        self.sensor.konnected_client.put_device(self.pin_number, 1)
+        return self.hold(area)
 
-    def deactivate_siren(self):
+    def deactivate_siren(self, area=None):
         logger.info("Siren deactivated")
-        self.sensor.konnected_client.put_device(self.pin_number, 0)
+        return self.release(area)
+
+
+def observe_konnected_request(call, duration_s, succeeded):
+    metrics.observe('konnected_request_seconds', duration_s, call=call)
+    if not succeeded:
+        metrics.increment('konnected_request_failures_total', call=call)
+
 
+konnected.set_request_observer(observe_konnected_request)
 
 sensor_list = {}
 tone_generator = ToneGenerator()
 siren = Siren()
+liveness_scheduler = LivenessScheduler()
+_hardware_init_stop = threading.Event()
+# Reentrant, as dropping the last reference to a Sensor while holding it stops the sensor, which takes it again
+_hardware_init_lock = threading.RLock()
+_hardware_init_retries = {}
 ZoneData = collections.namedtuple('ZoneData', ['sensor_id', 'zone_number'])
 
 
@@ -1,5 +1,8 @@
+from threading import Condition, Lock, Thread
+import json
+import logging
 
-from threading import Thread
+logger = logging.getLogger(__name__)
 
 
 class SimpleThread:
@@ -27,3 +30,85 @@ class SimpleThread:
 
     def thread_loop(self):
         pass
+
+
+class ConditionThread(SimpleThread):
+    """A SimpleThread whose loop sleeps on _condition. stop() wakes it and waits for it to finish"""
+
+    def __init__(self, lock=None):
+        SimpleThread.__init__(self)
+        self._condition = Condition(lock)
+
+    def stop(self):
+        with self._condition:
+            if not self._running:
+                return
+            self._running = False
+            self._condition.notify()
+
+        self._thread.join()
+        del self._thread
+
+
+class BatchWriter(ConditionThread):
+    """Writes entries appended to _pending from its own thread, in batches"""
+
+    def __init__(self):
+        lock = Lock()
+        ConditionThread.__init__(self, lock)
+        self.commit_interval_s = 0.05
+        self._pending = []
+        self._writing = False
+        # Notified after each batch is written, apart from _condition so record() only ever wakes the writer
+        self._written = Condition(lock)
+
+    def flush(self):
+        """Wait until every entry added so far has been written, or the writer has stopped"""
+        with self._condition:
+            self._written.wait_for(lambda: not self._running or not (self._pending or self._writing))
+
+    def thread_loop(self):
+        while True:
+            with self._condition:
+                while self._running and not self._pending:
+                    self._condition.wait()
+                # Group commit: give other entries a moment to join this batch before paying for the write
+                self._condition.wait_for(lambda: not self._running, self.commit_interval_s)
+
+                batch, self._pending = self._pending, []
+                running = self._running
+                self._writing = bool(batch)
+
+            if batch:
+                try:
+                    self._write(batch)
+                finally:
+                    with self._condition:
+                        self._writing = False
+                        self._written.notify_all()
+            if not running:
+                break
+
+        self._close()
+
+    def _write(self, batch):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+
+def read_json_lines(log_file, description):
+    """Yield (line, entry) for each line of a JSON lines log, cutting off a torn last line"""
+    size = 0
+    for line in log_file:
+        try:
+            entry = json.loads(line) if line.endswith(b'\n') else None
+        except ValueError:
+            entry = None
+        if entry is None:
+            logger.warning("Dropping torn entry in %s", description)
+            log_file.truncate(size)
+            return
+        size += len(line)
+        yield line, entry
@@ -0,0 +1,115 @@
+import base64
+import json
+import logging
+import os
+import socketserver
+
+from werkzeug.exceptions import HTTPException
+
+import konnected_server
+import panelhandler
+import simplethread
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = 'alarmsystem.sock'
+
+
+class StateOwner(simplethread.SimpleThread):
+    """Serves the alarm state to HTTP worker processes over a Unix socket"""
+
+    def __init__(self, app, path=DEFAULT_SOCKET_PATH):
+        simplethread.SimpleThread.__init__(self)
+        self.app = app
+        self.path = path
+        self.calls = {'sensor_update': self._sensor_update,
+                      'post_event': self._post_event,
+                      'get_state': self._get_state,
+                      'http': self._http}
+        self._server = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = socketserver.ThreadingUnixStreamServer(self.path, StateOwnerConnection)
+        self._server.daemon_threads = True
+        self._server.owner = self
+        simplethread.SimpleThread.start(self)
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+
+        self._server.shutdown()
+        self._server.server_close()
+        os.unlink(self.path)
+        self._thread.join()
+        del self._thread
+
+    def thread_loop(self):
+        self._server.serve_forever()
+
+    def handle_call(self, message):
+        call = self.calls.get(message.get('call'))
+        if call is None:
+            return {'status': 400, 'body': {'message': "Unknown call {}".format(message.get('call'))}}
+
+        try:
+            return call(message.get('args', {}))
+        except HTTPException as err:
+            return {'status': err.code, 'body': getattr(err, 'data', None) or {'message': err.description}}
+        except Exception:
+            logger.exception("Call %s from worker failed", message.get('call'))
+            return {'status': 500, 'body': {'message': 'Internal Server Error'}}
+
+    @staticmethod
+    def _sensor_update(args):
+        zones = konnected_server.apply_pin_states(args['sensor_id'], args['pin_states'])
+        return {'status': 200, 'body': {'zones': zones}}
+
+    @staticmethod
+    def _post_event(args):
+        body, status = panelhandler.post_external_event(args['event'], args.get('arm_config'), args.get('area'))
+        return {'status': status, 'body': body}
+
+    @staticmethod
+    def _get_state(args):
+        body, status = panelhandler.get_area_state(args.get('area'))
+        return {'status': status, 'body': body}
+
+    def _http(self, args):
+        response = self.app.test_client().open(args['path'], method=args['method'],
+                                               query_string=args.get('query_string', ''),
+                                               headers=args.get('headers', {}),
+                                               data=base64.b64decode(args.get('body', '')))
+        return {'status': response.status_code,
+                'headers': [(name, value) for name, value in response.headers.items() if name != 'Content-Length'],
+                'body': base64.b64encode(response.get_data()).decode()}
+
+
+class StateOwnerConnection(socketserver.StreamRequestHandler):
+    def handle(self):
+        owner = self.server.owner
+        for line in self.rfile:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                logger.warning("Dropping worker connection after malformed call")
+                return
+
+            if message.get('call') == 'subscribe':
+                self.stream_events()
+                return
+
+            self.wfile.write(json.dumps(owner.handle_call(message)).encode() + b'\n')
+
+    def stream_events(self):
+        stream = panelhandler.state_event_stream()
+        try:
+            for message in stream:
+                self.wfile.write(json.dumps(message).encode() + b'\n')
+        except OSError:
+            pass
+        finally:
+            stream.close()
@@ -0,0 +1,65 @@
+import pytest
+from pytest import fixture
+
+import actuators
+import konnected
+
+
+@fixture()
+def client(mocker):
+    client = mocker.Mock()
+    client.put_device.return_value = {'state': 1}
+    return client
+
+
+@fixture()
+def actuator_queue(client, mocker):
+    mocker.patch.object(actuators.ActuatorQueue, 'CONST_RETRY_BACKOFF_s', 0.001)
+    queue = actuators.ActuatorQueue(client)
+    yield queue
+    queue.stop()
+
+
+def test_command_is_sent(actuator_queue, client):
+    future = actuator_queue.submit(1, 1)
+
+    assert future.result(1) == {'state': 1}
+    client.put_device.assert_called_once_with(1, 1, None, None, None)
+
+
+def test_on_then_off_collapses(actuator_queue, client):
+    tone_on = actuator_queue.submit(1, 1)
+    tone_off = actuator_queue.submit(1, 0)
+
+    assert tone_on.result(1) is None
+    assert tone_off.result(1) is None
+    client.put_device.assert_not_called()
+
+
+def test_repeated_state_is_skipped(actuator_queue, client):
+    actuator_queue.submit(8, 1).result(1)
+    assert actuator_queue.submit(8, 1).result(1) is None
+
+    assert client.put_device.call_count == 1
+
+
+def test_momentary_commands_always_sent(actuator_queue, client):
+    actuator_queue.submit(1, 1, 200, 3, 50).result(1)
+    actuator_queue.submit(1, 1, 200, 3, 50).result(1)
+
+    assert client.put_device.call_count == 2
+
+
+def test_retries_with_backoff(actuator_queue, client):
+    client.put_device.side_effect = [konnected.Client.ClientError('timeout'), {'state': 1}]
+
+    assert actuator_queue.submit(8, 1).result(1) == {'state': 1}
+    assert client.put_device.call_count == 2
+
+
+def test_gives_up_after_max_attempts(actuator_queue, client):
+    client.put_device.side_effect = konnected.Client.ClientError('unreachable')
+
+    with pytest.raises(konnected.Client.ClientError):
+        actuator_queue.submit(8, 1).result(1)
+    assert client.put_device.call_count == actuators.ActuatorQueue.MAX_ATTEMPTS
@@ -1,6 +1,8 @@
 import pytest
 from pytest import fixture
 import configparser
+import queue
+import threading
 
 import alarmstates as als
 import sensors
@@ -18,7 +20,7 @@ def als_mocks(mocker):
     mocker.patch('alarmstates.sensors.tone_generator')
     mocker.patch('alarmstates.sensors.siren')
     mocker.patch('alarmstates.sensors.sensor_list')
-    mocker.patch('alarmstates.threading.Timer')
+    mocker.patch('alarmstates.timerwheel.timer_wheel')
 
 
 @fixture()
@@ -115,9 +117,8 @@ def test_alert_timer(state_machine):
     alert_state.on_entry()
     alert_state.on_exit()
 
-    # Verify Timer interactions
-    als.threading.Timer.assert_called_with(30, alert_state.process_expired_alert)
-    alert_state._transition_timer.start.assert_called()
+    # Verify timer interactions
+    als.timerwheel.timer_wheel.schedule.assert_called_with(30, alert_state.process_expired_alert)
     alert_state._transition_timer.cancel.assert_called()
 
 
@@ -126,11 +127,25 @@ def test_alert_timer_elapsed_event(state_machine):
     state_machine._current_state = als.StateType.alert
     alert_state = state_machine._state_machine[state_machine._current_state]
     alert_state.on_entry()
-    alert_state.process_expired_alert()
+
+    state_machine.start()
+    future = alert_state.process_expired_alert()
+    assert future.result(1) == als.StateType.alarm
+    state_machine.stop()
 
     assert state_machine._current_state == als.StateType.alarm
 
 
+def test_alert_expiry_retried_when_queue_full(state_machine):
+    state_machine._current_state = als.StateType.alert
+    alert_state = state_machine._state_machine[state_machine._current_state]
+    for _ in range(als.EventDispatcher.MAX_QUEUE_DEPTH):
+        state_machine.post_event(als.EventType.disarm, None, block=False)
+
+    assert alert_state.process_expired_alert() is None
+    als.timerwheel.timer_wheel.schedule.assert_called_with(als.Alert.CONST_RETRY_s, alert_state.process_expired_alert)
+
+
 def test_alarm_siren(state_machine):
     # Shortcut to alert state
     state_machine._current_state = als.StateType.alarm
@@ -144,3 +159,150 @@ def test_alarm_siren(state_machine):
     alarm_state.on_exit()
     als.sensors.siren.deactivate_siren.assert_called()
 
+
+
+def test_dispatcher_serializes_concurrent_events(state_machine):
+    state_machine.start()
+
+    def post_events():
+        for _ in range(50):
+            state_machine.post_event(als.EventType.arm, 'Stay')
+            state_machine.post_event(als.EventType.disarm, None)
+
+    threads = [threading.Thread(target=post_events) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert state_machine.post_event(als.EventType.arm, 'Away').result(1) == als.StateType.armed
+    state_machine.stop()
+
+    metrics = state_machine.dispatcher.get_metrics()
+    assert metrics['dispatched'] == 401
+    assert metrics['queue_depth'] == 0
+    assert metrics['rejected'] == 0
+
+
+def test_dispatcher_rejects_when_full(state_machine):
+    # Dispatcher isn't started, so nothing drains the queue
+    for _ in range(als.EventDispatcher.MAX_QUEUE_DEPTH):
+        state_machine.post_event(als.EventType.disarm, None, block=False)
+
+    with pytest.raises(queue.Full):
+        state_machine.post_event(als.EventType.disarm, None, block=False)
+
+    metrics = state_machine.dispatcher.get_metrics()
+    assert metrics['max_queue_depth'] == als.EventDispatcher.MAX_QUEUE_DEPTH
+    assert metrics['rejected'] == 1
+
+
+def test_arm_config_zone_index(config_file):
+    arm_configs = als.ArmConfigurations()
+    arm_configs.load_from_config(config_file)
+
+    assert arm_configs.configurations['Stay'].monitored_zones == {('123456789012', 2),
+                                                                  ('123456789012', 3),
+                                                                  ('123456789012', 4)}
+
+    # Nothing is monitored until a configuration is armed
+    assert arm_configs.is_monitored(sensors.ZoneData('123456789012', 2)) is False
+
+    arm_configs.current_configuration = 'Away'
+    assert arm_configs.is_monitored(sensors.ZoneData('123456789012', 5)) is True
+    assert arm_configs.is_monitored(sensors.ZoneData('123456789012', 1)) is False
+
+
+def test_arm_config_reload_keeps_active_config(config_file):
+    arm_configs = als.ArmConfigurations()
+    arm_configs.load_from_config(config_file)
+    arm_configs.current_configuration = 'Away'
+
+    reloaded = configparser.ConfigParser()
+    reloaded.read_dict(config_file)
+    reloaded['arm_configs']['configurations'] = 'Stay'
+    reloaded['Stay']['123456789012_zones'] = '2'
+    arm_configs.load_from_config(reloaded)
+
+    assert arm_configs.configurations['Stay'].zones == {'123456789012': [2]}
+    # Away is still armed, so it survives until the next reload
+    assert arm_configs.is_monitored(sensors.ZoneData('123456789012', 5)) is True
+
+    arm_configs.current_configuration = None
+    arm_configs.load_from_config(reloaded)
+    assert list(arm_configs.configurations) == ['Stay']
+
+
+@fixture()
+def areas_config(config_file):
+    config = configparser.ConfigParser()
+    config.read_dict(config_file)
+    config.read_dict({'areas': {'areas': 'house,garage'},
+                      'area_house': {'sensors': '123456789012', '123456789012_zones': '2,3,4',
+                                     'arm_configs': 'Stay,Away'},
+                      'area_garage': {'sensors': '123456789012', '123456789012_zones': '5',
+                                      'arm_configs': 'Away'}})
+    return config
+
+
+def test_areas_route_zones_to_their_machine(areas_config, als_mocks, mocker):
+    mocker.patch('alarmstates.arm_configurations', als.ArmConfigurations())
+    mocker.patch('alarmstates.alarm_state_machine', als.AlarmStateMachine())
+    mocker.patch('alarmstates.area_machines', {})
+    mocker.patch('alarmstates.area_index', {})
+    als.load_areas(areas_config)
+
+    house = als.get_area('house')
+    garage = als.get_area('garage')
+    assert house is als.alarm_state_machine
+    assert als.get_area(None) is house
+    assert als.get_area('attic') is None
+    assert als.machine_for_zone(sensors.ZoneData('123456789012', 3)) is house
+    assert als.machine_for_zone(sensors.ZoneData('123456789012', 5)) is garage
+    # Zones outside every area go to the first one
+    assert als.machine_for_zone(sensors.ZoneData('123456789012', 7)) is house
+    assert list(garage.arm_configurations.configurations) == ['Away']
+    assert set(als.get_dispatcher_metrics()) == {'house', 'garage'}
+
+    garage.process_event(als.EventType.arm, 'Away')
+    assert garage.get_current_state() == als.StateType.armed
+    assert house.get_current_state() == als.StateType.disarmed
+
+    # Reloading keeps the machines of areas that are still configured
+    als.load_areas(areas_config)
+    assert als.get_area('garage') is garage
+    assert garage.get_current_state() == als.StateType.armed
+
+
+def test_outputs_stay_on_while_another_area_needs_them(areas_config, als_mocks, mocker):
+    board = mocker.Mock()
+    for name, output in (('tone_generator', sensors.ToneGenerator()), ('siren', sensors.Siren())):
+        output.connect(board, 8 if name == 'siren' else 1)
+        mocker.patch('alarmstates.sensors.' + name, output)
+    mocker.patch('alarmstates.arm_configurations', als.ArmConfigurations())
+    mocker.patch('alarmstates.alarm_state_machine', als.AlarmStateMachine())
+    mocker.patch('alarmstates.area_machines', {})
+    mocker.patch('alarmstates.area_index', {})
+    als.load_areas(areas_config)
+    house, garage = als.get_area('house'), als.get_area('garage')
+
+    def commands(pin):
+        return [call.args[1] for call in board.actuator_queue.submit.call_args_list if call.args[0] == pin]
+
+    for machine, zone in ((house, 3), (garage, 5)):
+        machine.process_event(als.EventType.arm, 'Away')
+        machine.process_event(als.EventType.sensor_changed, sensors.ZoneData('123456789012', zone))
+
+    # The tone keeps playing until the last area in alert leaves it
+    house.process_event(als.EventType.alert_expired, None)
+    assert commands(1) == [1, 1]
+    garage.process_event(als.EventType.alert_expired, None)
+    assert commands(1) == [1, 1, 0]
+
+    # Disarming the garage leaves the house's siren sounding
+    garage.process_event(als.EventType.disarm, None)
+    assert house.get_current_state() == als.StateType.alarm
+    assert commands(8) == [1, 1]
+
+    house.process_event(als.EventType.disarm, None)
+    assert commands(8) == [1, 1, 0]
@@ -0,0 +1,131 @@
+from pytest import fixture, approx
+from flask import Flask
+from flask_restful import Api
+import os
+import time
+
+import analytics
+import clocks
+import history
+import panelhandler
+
+SENSOR_ID = '123456789012'
+
+
+@fixture()
+def clock(mocker):
+    clock = clocks.VirtualClock()
+    # Start an hour before midnight (UTC), so the events below fall in the last partition of one day and the
+    # first of the next
+    clock.advance((86400 - 3600 - clock.time()) % 86400)
+    mocker.patch('clocks.clock', clock)
+    return clock
+
+
+@fixture()
+def zone_history(tmp_path, clock):
+    zone_history = history.ZoneHistory()
+    zone_history.path = str(tmp_path)
+    zone_history.commit_interval_s = 0.001
+    zone_history.open()
+    zone_history.start()
+    yield zone_history
+    zone_history.stop()
+
+
+def record_at(zone_history, clock, start, events):
+    """Record (seconds after start, zone, state) events"""
+    for offset_s, zone, state in events:
+        clock.advance_to(clock.monotonic() + start + offset_s - clock.time())
+        zone_history.record(SENSOR_ID, zone, 'Zone', state)
+
+
+# Zone 1 is open for 300 s, then for 200 s across the hour, then flaps open for 1 s. Zone 2 opens and stays open
+EVENTS = [(100, 1, True), (200, 2, True), (400, 1, False), (3500, 1, True), (3700, 1, False), (3800, 1, True),
+          (3801, 1, False)]
+
+
+def hour_of(timestamp):
+    return time.localtime(timestamp).tm_hour
+
+
+def test_statistics_across_partitions(zone_history, clock):
+    start = clock.time()
+    record_at(zone_history, clock, start, EVENTS)
+    clock.advance(3600)
+    zone_history.stop()
+
+    zone_analytics = analytics.ZoneAnalytics(zone_history, flap_s=2)
+    for _ in range(2):
+        first, second = zone_analytics.zone_statistics()
+        assert (first['zone'], first['opens'], first['flaps']) == (1, 3, 1)
+        assert first['open_s'] == approx(501)
+        assert first['flap_rate'] == approx(1 / 3)
+        expected_hours = [0] * 24
+        for offset_s, zone, state in EVENTS:
+            if zone == 1 and state:
+                expected_hours[hour_of(start + offset_s)] += 1
+        assert first['opens_by_hour'] == expected_hours
+        assert first['peak_hour'] == expected_hours.index(max(expected_hours))
+
+        # Zone 2 is still open
+        assert (second['zone'], second['opens'], second['flaps']) == (2, 1, 0)
+        assert second['open_s'] == approx(clock.time() - start - 200)
+
+    # The first day can't change any more, so its summary is kept
+    assert zone_analytics.get_metrics() == {'zones': 2, 'cached_days': 1}
+
+    # An opening before the range isn't counted
+    statistics = zone_analytics.zone_statistics(start=start + 3600)
+    assert [(entry['zone'], entry['opens'], entry['open_s'], entry['flaps']) for entry in statistics] == [(1, 1, 1, 1)]
+    assert zone_analytics.zone_statistics(sensor_id=SENSOR_ID, zone=2)[0]['opens'] == 1
+    assert zone_analytics.zone_statistics(sensor_id='000000000000') == []
+
+
+def test_finished_day_saved_for_restart(zone_history, clock, mocker):
+    start = clock.time()
+    day_end = (start // 86400 + 1) * 86400
+    zone_analytics = analytics.ZoneAnalytics(zone_history, flap_s=2)
+    record_at(zone_history, clock, start, EVENTS)
+    clock.advance(3600)
+    zone_history.stop()
+
+    # The history moving on to the next day saved the first day's summary
+    assert 'analytics-{:d}.sum'.format(int(day_end - 86400)) in os.listdir(zone_history.path)
+    assert zone_analytics.get_metrics()['cached_days'] == 1
+    statistics = zone_analytics.zone_statistics()
+
+    # After a restart the first day comes from its saved summary, so only the next day's partition is read
+    restarted = analytics.ZoneAnalytics(zone_history, flap_s=2)
+    columns = mocker.spy(zone_history, 'columns')
+    assert restarted.zone_statistics() == statistics
+    assert columns.call_count == 1
+    assert columns.call_args.args[0] >= day_end
+
+    # A summary saved with another flap threshold is summarized again
+    assert [entry['flaps'] for entry in analytics.ZoneAnalytics(zone_history, flap_s=0.5).zone_statistics()] == [0, 0]
+
+
+def test_statistics_from_memory(clock):
+    zone_history = history.ZoneHistory()
+    record_at(zone_history, clock, clock.time(), EVENTS)
+
+    zone_analytics = analytics.ZoneAnalytics(zone_history, flap_s=0.5)
+    first, second = zone_analytics.zone_statistics(end=clock.time() + 1)
+    assert (first['opens'], first['open_s'], first['flaps']) == (3, approx(501), 0)
+    assert second['open_s'] == approx(3801 - 200)
+
+
+def test_analytics_handler(mocker, clock):
+    zone_history = history.ZoneHistory()
+    mocker.patch('analytics.zone_analytics', analytics.ZoneAnalytics(zone_history))
+    record_at(zone_history, clock, clock.time(), EVENTS)
+
+    app = Flask(__name__)
+    api = Api(app)
+    api.add_resource(panelhandler.AnalyticsHandler, '/analytics')
+    client = app.test_client()
+
+    response = client.get('/analytics?sensor_id={}&zone=1'.format(SENSOR_ID)).get_json()
+    assert [(entry['zone'], entry['opens'], entry['flaps']) for entry in response['zones']] == [(1, 3, 1)]
+    assert client.get('/analytics?zone=1').status_code == 400
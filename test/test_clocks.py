@@ -0,0 +1,97 @@
+from pytest import fixture
+import configparser
+import threading
+import time
+
+import alarmstates as als
+import clocks
+import sensors
+import timerwheel
+
+
+@fixture()
+def virtual_clock(mocker):
+    clock = clocks.VirtualClock()
+    mocker.patch('clocks.clock', clock)
+    mocker.patch('timerwheel.timer_wheel', timerwheel.TimerWheel())
+    return clock
+
+
+def test_virtual_clock_only_moves_when_advanced(virtual_clock):
+    start = virtual_clock.monotonic()
+    start_time = virtual_clock.time()
+
+    virtual_clock.advance(86400)
+
+    assert virtual_clock.monotonic() == start + 86400
+    assert virtual_clock.time() == start_time + 86400
+
+
+def test_virtual_clock_fires_timers_at_their_deadlines(virtual_clock):
+    start = virtual_clock.monotonic()
+    fired = []
+
+    def record(name):
+        fired.append((name, virtual_clock.monotonic()))
+
+    timerwheel.timer_wheel.schedule(3600, record, 'hour')
+    timerwheel.timer_wheel.schedule(5, record, 'seconds')
+    cancelled = timerwheel.timer_wheel.schedule(60, record, 'cancelled')
+    cancelled.cancel()
+
+    virtual_clock.advance(4)
+    assert fired == []
+
+    virtual_clock.advance(7200)
+    assert [name for name, _ in fired] == ['seconds', 'hour']
+    # Timers fire on the tick after their deadline, never before it
+    assert start + 5 <= fired[0][1] < start + 5 + timerwheel.timer_wheel.tick_s * 2
+    assert start + 3600 <= fired[1][1] < start + 3600 + timerwheel.timer_wheel.tick_s * 2
+    assert timerwheel.timer_wheel._running is False
+
+
+def test_alert_escalates_without_waiting(virtual_clock, mocker):
+    mocker.patch('alarmstates.sensors.tone_generator')
+    mocker.patch('alarmstates.sensors.siren')
+    config = configparser.ConfigParser()
+    config.read('test_config.ini')
+    als.load_state_configurations(config)
+
+    state_machine = als.AlarmStateMachine()
+    state_machine.start()
+    state_machine.post_event(als.EventType.arm, 'Stay')
+    state_machine.post_event(als.EventType.sensor_changed, sensors.ZoneData('123456789012', 2))
+    state_machine.dispatcher.wait_until_idle()
+    assert state_machine.get_current_state() == als.StateType.alert
+
+    virtual_clock.advance(als.alert_timeout_s - 1)
+    state_machine.dispatcher.wait_until_idle()
+    assert state_machine.get_current_state() == als.StateType.alert
+
+    virtual_clock.advance(2)
+    state_machine.dispatcher.wait_until_idle()
+    assert state_machine.get_current_state() == als.StateType.alarm
+    state_machine.stop()
+
+
+def test_hardware_init_deadline_is_virtual(virtual_clock, mocker):
+    config = configparser.ConfigParser()
+    config.read_dict({'server': {'init_deadline_s': '15'}})
+    answered = threading.Event()
+    stuck_board = mocker.Mock(id='1', initialize_hardware=mocker.Mock(side_effect=lambda config: answered.wait()))
+    mocker.patch.dict('sensors.sensor_list', {'1': stuck_board}, clear=True)
+
+    reports = []
+    waiting = threading.Thread(target=lambda: reports.append(sensors.initialize_sensor_hardware(config)))
+    start = time.perf_counter()
+    waiting.start()
+    # Startup waits on virtual time, so it is only held up until the clock passes the deadline
+    while not timerwheel.timer_wheel.next_deadline():
+        time.sleep(0.001)
+    virtual_clock.advance(15)
+    waiting.join(1)
+
+    assert reports == [{'1': 'timed out'}]
+    assert time.perf_counter() - start < 1
+    answered.set()
+    sensors.stop_hardware_initialization()
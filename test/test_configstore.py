@@ -0,0 +1,117 @@
+import pytest
+from pytest import fixture
+from flask import Flask
+from flask_restful import Api
+import configparser
+import shutil
+
+import alarmstates
+import configstore
+import panelhandler
+import sensors
+
+
+@fixture()
+def store(tmp_path):
+    config_path = str(tmp_path / 'config.ini')
+    shutil.copy('test_config.ini', config_path)
+
+    store = configstore.ConfigStore()
+    store.load(config_path)
+    return store
+
+
+@fixture()
+def client(store, mocker):
+    mocker.patch('panelhandler.configstore.config_store', store)
+
+    app = Flask(__name__)
+    api = Api(app)
+    api.add_resource(panelhandler.SettingsHandler, '/configuration')
+    return app.test_client()
+
+
+def test_settings_cached(store):
+    assert store.settings_json == ('{"alert": {"duration_s": 30}, '
+                                   '"door_chime": {"beep_duration_ms": 200, "num_beeps": 3, "pause_duration_ms": 50}}')
+
+
+def test_update_persists_and_notifies(store, mocker):
+    listener = mocker.Mock()
+    store.add_listener('alert', listener)
+    old_etag = store.etag
+
+    store.update({'alert': {'duration_s': '45'}})
+
+    assert store.etag != old_etag
+    assert store.get_config()['alert'].getint('duration_s') == 45
+    assert listener.call_args.args[0].getint('duration_s') == 45
+
+    reloaded = configparser.ConfigParser()
+    reloaded.read(store.path)
+    assert reloaded['alert'].getint('duration_s') == 45
+    assert reloaded['123456789012'].get('ip') == '192.168.1.123'
+
+
+@pytest.mark.parametrize('changes', [{'server': {'token': 'x'}},
+                                     {'alert': {'timeout': 5}},
+                                     {'alert': {'duration_s': 'soon'}},
+                                     {'alert': 30}])
+def test_update_rejects_invalid(store, changes):
+    etag = store.etag
+    with pytest.raises(ValueError):
+        store.update(changes)
+    assert store.etag == etag
+
+
+def test_get_conditional(client, store):
+    response = client.get('/configuration')
+    assert response.status_code == 200
+    assert response.get_json()['door_chime']['num_beeps'] == 3
+
+    response = client.get('/configuration', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+
+def test_put_with_if_match(client, store):
+    etag = client.get('/configuration').headers['ETag']
+
+    response = client.put('/configuration', json={'door_chime': {'num_beeps': 5}}, headers={'If-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['door_chime']['num_beeps'] == 5
+    assert response.headers['ETag'] != etag
+
+    # A second writer holding the old ETag is refused
+    response = client.put('/configuration', json={'door_chime': {'num_beeps': 6}}, headers={'If-Match': etag})
+    assert response.status_code == 412
+    assert store.get_config()['door_chime'].getint('num_beeps') == 5
+
+
+def test_hot_apply_to_chime_and_alert(store, mocker):
+    tone_generator = sensors.ToneGenerator()
+    mocker.patch('alarmstates.alert_timeout_s', 30)
+    store.add_listener('door_chime', tone_generator.load_chime_parameters_from_config)
+    store.add_listener('alert', alarmstates.load_alert_configuration)
+
+    store.update({'door_chime': {'num_beeps': 2, 'beep_duration_ms': 100}, 'alert': {'duration_s': 10}})
+
+    assert tone_generator.number_of_beeps == 2
+    assert tone_generator.beep_duration_ms == 100
+    assert tone_generator.pause_duration_ms == 50
+    assert alarmstates.alert_timeout_s == 10
+
+
+def test_reload_notifies_listeners(store, mocker):
+    listener = mocker.Mock()
+    store.add_listener('alert', listener)
+
+    with open(store.path) as config_file:
+        contents = config_file.read()
+    with open(store.path, 'w') as config_file:
+        config_file.write(contents.replace('duration_s=30', 'duration_s=90'))
+
+    config = store.reload()
+
+    assert config['alert'].getint('duration_s') == 90
+    assert listener.call_args[0][0].getint('duration_s') == 90
+    assert '"duration_s": 90' in store.settings_json
@@ -0,0 +1,93 @@
+import pytest
+from pytest import fixture
+from flask import Flask
+from flask_restful import Api
+import configparser
+import json
+
+import alarmstates
+import eventstream
+import panelhandler
+
+
+@fixture()
+def broadcaster(mocker):
+    broadcaster = eventstream.EventBroadcaster(max_pending=4)
+    mocker.patch('eventstream.event_broadcaster', broadcaster)
+    return broadcaster
+
+
+def test_publish_fans_out(broadcaster):
+    subscribers = [broadcaster.subscribe() for _ in range(3)]
+
+    broadcaster.publish('zone', {'sensor_id': '123456789012', 'zone': 1, 'state': 1})
+
+    expected = 'event: zone\ndata: {"sensor_id": "123456789012", "zone": 1, "state": 1}\n\n'
+    assert [subscriber.get(0) for subscriber in subscribers] == [expected] * 3
+    assert broadcaster.get_metrics()['published'] == 1
+
+
+def test_slow_subscriber_is_dropped(broadcaster):
+    fast = broadcaster.subscribe()
+    slow = broadcaster.subscribe()
+
+    for number in range(6):
+        broadcaster.publish('state', {'state': number})
+        fast.get(0)
+
+    assert slow.dropped is True
+    assert fast.dropped is False
+    assert slow.get(0) is None
+
+    metrics = broadcaster.get_metrics()
+    assert metrics['subscribers'] == 1
+    assert metrics['dropped_subscribers'] == 1
+
+
+def test_no_subscribers_skips_encoding(broadcaster, mocker):
+    encode = mocker.patch('eventstream.encode_event')
+    broadcaster.publish('state', {'state': 'armed'})
+
+    encode.assert_not_called()
+
+
+def test_state_events_stream(broadcaster, mocker):
+    house, garage = mocker.Mock(), mocker.Mock()
+    house.get_current_state.return_value = alarmstates.StateType.disarmed
+    garage.get_current_state.return_value = alarmstates.StateType.armed
+    mocker.patch('panelhandler.alarmstates.area_machines', {'house': house, 'garage': garage})
+
+    app = Flask(__name__)
+    api = Api(app)
+    api.add_resource(panelhandler.StateEventsHandler, '/state/events')
+    response = app.test_client().get('/state/events')
+    stream = response.response
+
+    assert response.mimetype == 'text/event-stream'
+    assert next(stream) == b'event: state\ndata: {"state": "disarmed", "area": "house"}\n\n'
+    assert next(stream) == b'event: state\ndata: {"state": "armed", "area": "garage"}\n\n'
+
+    broadcaster.publish('state', {'state': 'armed', 'previous_state': 'disarmed', 'event': 'arm'})
+    message = next(stream).decode()
+    assert message.startswith('event: state\n')
+    assert json.loads(message.split('data: ')[1]) == {'state': 'armed', 'previous_state': 'disarmed', 'event': 'arm'}
+
+    response.close()
+    assert broadcaster.get_metrics()['subscribers'] == 0
+
+
+def test_transitions_are_published(broadcaster, mocker):
+    config = configparser.ConfigParser()
+    config.read('test_config.ini')
+    mocker.patch('alarmstates.arm_configurations', alarmstates.ArmConfigurations())
+    alarmstates.load_state_configurations(config)
+    subscriber = broadcaster.subscribe()
+
+    state_machine = alarmstates.AlarmStateMachine()
+    state_machine.process_event(alarmstates.EventType.arm, 'Away')
+    state_machine.process_event(alarmstates.EventType.arm, 'Away')
+    state_machine.process_event(alarmstates.EventType.disarm, None)
+
+    assert '"state": "armed"' in subscriber.get(0)
+    assert '"state": "disarmed"' in subscriber.get(0)
+    assert subscriber.get(0) is None
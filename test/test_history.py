@@ -0,0 +1,160 @@
+from pytest import fixture
+from flask import Flask
+from flask_restful import Api
+import configparser
+import os
+
+import clocks
+import history
+import panelhandler
+
+
+@fixture()
+def clock(mocker):
+    clock = clocks.VirtualClock()
+    mocker.patch('clocks.clock', clock)
+    return clock
+
+
+@fixture()
+def zone_history(tmp_path, clock):
+    config = configparser.ConfigParser()
+    config.read_dict({'history': {'path': str(tmp_path), 'ring_size': '10', 'commit_interval_ms': '1'}})
+
+    zone_history = history.ZoneHistory()
+    zone_history.load_from_config(config)
+    zone_history.open()
+    zone_history.start()
+    yield zone_history
+    zone_history.stop()
+
+
+def reopen(zone_history):
+    zone_history.stop()
+    restored = history.ZoneHistory()
+    restored.path = zone_history.path
+    restored.open()
+    return restored
+
+
+def record_hours(zone_history, clock, hours, per_hour):
+    for _ in range(hours):
+        for event in range(per_hour):
+            zone_history.record('123456789012', event % 3 + 1, 'Zone', event % 2 == 0)
+            clock.advance(3600 / per_hour)
+
+
+def page_through(zone_history, **query):
+    events, cursor = zone_history.query(limit=7, **query)
+    while cursor is not None:
+        page, cursor = zone_history.query(limit=7, cursor=cursor, **query)
+        events.extend(page)
+    return events
+
+
+def test_recent_without_store(clock):
+    zone_history = history.ZoneHistory(ring_size=3)
+    for zone in range(1, 6):
+        zone_history.record('123456789012', zone, 'Zone', True)
+        clock.advance(1)
+
+    assert [event['zone'] for event in zone_history.recent()] == [5, 4, 3]
+    events, cursor = zone_history.query(limit=2)
+    assert [event['zone'] for event in events] == [3, 4]
+    events, cursor = zone_history.query(limit=2, cursor=cursor)
+    assert [event['zone'] for event in events] == [5]
+    assert cursor is None
+
+
+def test_query_across_partitions(zone_history, clock):
+    start = clock.time()
+    record_hours(zone_history, clock, 3, 20)
+    restored = reopen(zone_history)
+
+    # record_hours spaces the events 180 s apart, from start on
+    partitions = {int((start + 180 * event) // 3600) for event in range(60)}
+    assert len(os.listdir(restored.path)) == 2 * len(partitions)
+    all_events = page_through(restored)
+    assert [event['seq'] for event in all_events] == list(range(1, 61))
+
+    # Half open range over the middle hour
+    events = page_through(restored, start=start + 3600, end=start + 7200)
+    assert [event['seq'] for event in events] == list(range(21, 41))
+
+    events = page_through(restored, sensor_id='123456789012', zone=2)
+    assert events == [event for event in all_events if event['zone'] == 2]
+    assert page_through(restored, sensor_id='000000000000') == []
+
+    # New events carry on from the stored sequence numbers
+    restored.start()
+    restored.record('123456789012', 1, 'Zone', True)
+    restored.stop()
+    assert page_through(reopen(restored), start=clock.time() - 1)[-1]['seq'] == 61
+
+
+def test_unsealed_partition_is_rebuilt(zone_history, clock):
+    record_hours(zone_history, clock, 1, 5)
+    zone_history.flush()
+    # Simulate a crash: the index of the open partition is never written and the last line is torn
+    log_path = zone_history._log_path(zone_history._active_start)
+    with open(log_path, 'ab') as log_file:
+        log_file.write(b'{"seq": 6, "ti')
+    zone_history._active_file = None
+
+    restored = reopen(zone_history)
+    assert [event['seq'] for event in page_through(restored)] == [1, 2, 3, 4, 5]
+    with open(log_path, 'rb') as log_file:
+        assert log_file.read().endswith(b'}\n')
+
+    restored.start()
+    restored.record('123456789012', 1, 'Zone', True)
+    restored.stop()
+    assert [event['seq'] for event in page_through(reopen(restored))] == [1, 2, 3, 4, 5, 6]
+
+
+def test_index_from_older_version_is_rebuilt(zone_history, clock):
+    record_hours(zone_history, clock, 1, 6)
+    zone_history.stop()
+    events = page_through(zone_history)
+    for partition in zone_history.partitions():
+        with open(zone_history._index_path(partition), 'wb') as index_file:
+            index_file.write(b'{"rows": 0, "size": 0, "zones": []}\n')
+
+    restored = reopen(zone_history)
+    rows = []
+    for partition in restored.partitions():
+        zone_keys, times, zone_ids, states = restored.columns(partition)
+        rows.extend((time, zone_keys[zone_id], bool(state)) for time, zone_id, state in zip(times, zone_ids, states))
+    assert rows == [(event['time'], (event['sensor_id'], event['zone']), event['state']) for event in events]
+
+
+def test_retention_removes_old_partitions(zone_history, clock):
+    zone_history.retention_days = 1 / 24
+    record_hours(zone_history, clock, 4, 2)
+    zone_history.stop()
+
+    assert len(zone_history._partitions) <= 2
+    assert page_through(zone_history)[-1]['seq'] == 8
+    assert page_through(zone_history)[0]['seq'] >= 5
+
+
+def test_history_handler(mocker, clock):
+    mocker.patch('history.zone_history', history.ZoneHistory())
+    for zone in range(1, 4):
+        history.zone_history.record('123456789012', zone, 'Zone', True)
+
+    app = Flask(__name__)
+    api = Api(app)
+    api.add_resource(panelhandler.HistoryHandler, '/history')
+    api.add_resource(panelhandler.RecentHistoryHandler, '/history/recent')
+    client = app.test_client()
+
+    response = client.get('/history?sensor_id=123456789012&limit=2').get_json()
+    assert [event['zone'] for event in response['events']] == [1, 2]
+    response = client.get('/history?sensor_id=123456789012&cursor=' + response['next_cursor']).get_json()
+    assert [event['zone'] for event in response['events']] == [3]
+    assert response['next_cursor'] is None
+
+    assert client.get('/history?zone=1').status_code == 400
+    assert client.get('/history?cursor=nonsense').status_code == 400
+    assert [event['zone'] for event in client.get('/history/recent?limit=1').get_json()['events']] == [3]
@@ -0,0 +1,152 @@
+import pytest
+from pytest import fixture
+import configparser
+import os
+
+import alarmstates as als
+import journal
+import sensors
+
+
+@fixture()
+def event_journal(tmp_path):
+    config = configparser.ConfigParser()
+    config.read_dict({'journal': {'path': str(tmp_path), 'snapshot_interval': '10', 'commit_interval_ms': '1'}})
+
+    event_journal = journal.EventJournal()
+    event_journal.load_from_config(config)
+    return event_journal
+
+
+def reopen(event_journal):
+    restored = journal.EventJournal()
+    restored.path = event_journal.path
+    restored.snapshot_interval = event_journal.snapshot_interval
+    restored.commit_interval_s = event_journal.commit_interval_s
+    return restored
+
+
+def test_disabled_without_config_section():
+    event_journal = journal.EventJournal()
+    event_journal.load_from_config(configparser.ConfigParser())
+
+    assert event_journal.is_enabled() is False
+
+
+def test_restore_empty_journal(event_journal):
+    assert event_journal.restore() is None
+
+
+def test_restore_last_state(event_journal):
+    event_journal.restore()
+    event_journal.start()
+    event_journal.record(als.EventType.arm, 'Stay', als.StateType.armed, 'Stay')
+    event_journal.record(als.EventType.sensor_changed, sensors.ZoneData('123456789012', 2), als.StateType.alert, 'Stay')
+    event_journal.stop()
+
+    last_entry = reopen(event_journal).restore()
+    assert last_entry['seq'] == 2
+    assert last_entry['state'] == 'alert'
+    assert last_entry['arm_configuration'] == 'Stay'
+    assert last_entry['data'] == ['123456789012', 2]
+
+
+def test_snapshot_compacts_segments(event_journal):
+    event_journal.restore()
+    event_journal.start()
+    for _ in range(12):
+        event_journal.record(als.EventType.arm, 'Away', als.StateType.armed, 'Away')
+        # Wait for each commit so the batches land either side of the snapshot
+        event_journal.flush()
+    event_journal.record(als.EventType.disarm, None, als.StateType.disarmed, 'Away')
+    event_journal.stop()
+
+    files = sorted(os.listdir(event_journal.path))
+    assert 'snapshot.json' in files
+    assert len([name for name in files if name.startswith('journal-')]) == 1
+
+    restored = reopen(event_journal)
+    last_entry = restored.restore()
+    assert last_entry['seq'] == 13
+    assert last_entry['state'] == 'disarmed'
+
+    # New entries carry on from the restored sequence number
+    restored.start()
+    restored.record(als.EventType.arm, 'Stay', als.StateType.armed, 'Stay')
+    restored.stop()
+    assert reopen(event_journal).restore()['seq'] == 14
+
+
+def test_restore_last_entry_per_area(event_journal):
+    event_journal.snapshot_interval = 2
+    event_journal.restore()
+    event_journal.start()
+    event_journal.record(als.EventType.arm, 'Stay', als.StateType.armed, 'Stay', 'house')
+    event_journal.record(als.EventType.arm, 'Away', als.StateType.armed, 'Away', 'garage')
+    event_journal.flush()
+    event_journal.record(als.EventType.disarm, None, als.StateType.disarmed, 'Stay', 'house')
+    event_journal.stop()
+
+    restored = reopen(event_journal)
+    assert restored.restore()['area'] == 'house'
+    last_entries = restored.last_entries()
+    assert last_entries['house']['state'] == 'disarmed'
+    assert last_entries['garage']['state'] == 'armed'
+
+
+def test_restore_ignores_torn_entry(event_journal):
+    event_journal.restore()
+    event_journal.start()
+    event_journal.record(als.EventType.arm, 'Stay', als.StateType.armed, 'Stay')
+    event_journal.stop()
+
+    segment = [name for name in os.listdir(event_journal.path) if name.startswith('journal-')][0]
+    with open(os.path.join(event_journal.path, segment), 'a') as segment_file:
+        segment_file.write('{"seq": 2, "sta')
+
+    assert reopen(event_journal).restore()['state'] == 'armed'
+
+
+def test_entries_after_torn_segment_start_are_restored(event_journal):
+    event_journal.restore()
+    event_journal.start()
+    event_journal.record(als.EventType.arm, 'Stay', als.StateType.armed, 'Stay')
+    event_journal.stop()
+
+    # A crash tore the first entry of a new segment, which is named after that entry
+    with open(os.path.join(event_journal.path, 'journal-{:012d}.log'.format(2)), 'w') as segment_file:
+        segment_file.write('{"seq": 2, "sta')
+
+    restored = reopen(event_journal)
+    assert restored.restore()['seq'] == 1
+    restored.start()
+    restored.record(als.EventType.disarm, None, als.StateType.disarmed, None)
+    restored.stop()
+
+    last_entry = reopen(event_journal).restore()
+    assert (last_entry['seq'], last_entry['state']) == (2, 'disarmed')
+
+
+def test_state_machine_records_events(mocker):
+    mocker.patch('alarmstates.sensors.tone_generator')
+    mocker.patch('alarmstates.sensors.siren')
+    mocker.patch('alarmstates.timerwheel.timer_wheel')
+    mocker.patch.dict(als.arm_configurations.configurations, {'Stay': mocker.Mock(monitored_zones=frozenset())})
+
+    state_machine = als.AlarmStateMachine()
+    state_machine.journal = mocker.Mock()
+    state_machine.process_event(als.EventType.arm, 'Stay')
+
+    state_machine.journal.record.assert_called_once_with(als.EventType.arm, 'Stay', als.StateType.armed, 'Stay',
+                                                          als.DEFAULT_AREA)
+
+
+def test_state_machine_restore(mocker):
+    mocker.patch('alarmstates.sensors.siren')
+    state_machine = als.AlarmStateMachine()
+
+    state_machine.restore(als.StateType.alarm, 'Away')
+
+    assert state_machine.get_current_state() == als.StateType.alarm
+    assert als.arm_configurations.current_configuration == 'Away'
+    als.sensors.siren.activate_siren.assert_called()
@@ -0,0 +1,50 @@
+import pytest
+from pytest import fixture
+
+import konnected
+
+
+@fixture()
+def clean_pool():
+    konnected.close_sessions()
+    yield
+    konnected.close_sessions()
+
+
+def test_clients_share_session_per_board(clean_pool):
+    client_a = konnected.Client('192.168.1.123', '12345')
+    client_b = konnected.Client('192.168.1.123', '12345')
+    client_c = konnected.Client('192.168.1.124', '12345')
+
+    assert client_a.session is client_b.session
+    assert client_a.session is not client_c.session
+
+
+def test_later_clients_keep_the_first_pool_size(clean_pool, caplog):
+    client_a = konnected.Client('192.168.1.123', '12345', pool_size=2)
+    client_b = konnected.Client('192.168.1.123', '12345', pool_size=2)
+    assert not caplog.records
+
+    client_c = konnected.Client('192.168.1.123', '12345', pool_size=8)
+    assert client_c.session is client_a.session is client_b.session
+    assert client_a.session.get_adapter('http://')._pool_maxsize == 2
+    assert "ignoring pool size 8" in caplog.text
+
+
+def test_client_timeouts(clean_pool, mocker):
+    client = konnected.Client('192.168.1.123', '12345', timeout=2)
+    mocker.patch.object(client.session, 'put')
+
+    client.put_device(1, 1)
+    assert client.session.put.call_args.kwargs['timeout'] == 2
+
+    client.put_device(1, 1, timeout=0.5)
+    assert client.session.put.call_args.kwargs['timeout'] == 0.5
+
+
+def test_client_error_wraps_request_exception(clean_pool, mocker):
+    client = konnected.Client('192.168.1.123', '12345')
+    mocker.patch.object(client.session, 'get', side_effect=konnected.RequestException('unreachable'))
+
+    with pytest.raises(konnected.Client.ClientError):
+        client.get_status()
@@ -0,0 +1,96 @@
+import pytest
+from pytest import fixture
+from flask import Flask
+from flask_restful import Api
+import configparser
+
+import konnected_server
+import sensorevents
+import sensors
+
+
+@fixture(scope='module')
+def config_file():
+    config = configparser.ConfigParser()
+    config.read('test_config.ini')
+    return config
+
+
+@fixture()
+def server_mocks(mocker):
+    mocker.patch('sensors.konnected.Client')
+    mocker.patch('sensors.SensorLivenessCheck')
+    mocker.patch('sensorevents.alarmstates.alarm_state_machine')
+    mocker.patch('sensorevents.sensor_event_filter', sensorevents.SensorEventFilter())
+    mocker.patch.dict('sensors.sensor_list', clear=True)
+
+
+@fixture()
+def client(server_mocks, config_file):
+    sensors.load_sensors(config_file)
+
+    app = Flask(__name__)
+    api = Api(app)
+    api.add_resource(konnected_server.SensorsHandler, '/device/<sensor_id>')
+    api.add_resource(konnected_server.SensorsBatchHandler, '/device/<sensor_id>/batch')
+    api.add_resource(konnected_server.SensorLivenessHandler, '/sensor_liveness')
+    return app.test_client()
+
+
+def test_batch_coalesces_zone_events(client):
+    updates = [{'pin': 3, 'state': 1}, {'pin': 4, 'state': 1}, {'pin': 2, 'state': 1}, {'pin': 5, 'state': 1}]
+    response = client.put('/device/123456789012/batch', json={'updates': updates})
+
+    assert response.status_code == 200
+    assert response.get_json() == {'zones': [2, 1]}
+
+    sensor = sensors.sensor_list['123456789012']
+    assert [sensor.input_pins[pin].state for pin in (2, 3, 4, 5)] == [1, 1, 1, 1]
+
+    post_event = sensorevents.alarmstates.alarm_state_machine.post_event
+    assert post_event.call_count == 2
+    assert post_event.call_args_list[0].args[1] == sensors.ZoneData('123456789012', 2)
+    assert post_event.call_args_list[1].args[1] == sensors.ZoneData('123456789012', 1)
+
+
+def test_batch_skips_unchanged_zones(client):
+    client.put('/device/123456789012/batch', json={'updates': [{'pin': 3, 'state': 1}]})
+    response = client.put('/device/123456789012/batch', json={'updates': [{'pin': 4, 'state': 1}]})
+
+    assert response.get_json() == {'zones': []}
+    assert sensorevents.alarmstates.alarm_state_machine.post_event.call_count == 1
+
+
+def test_single_pin_skips_unchanged_zone(client):
+    client.put('/device/123456789012', json={'pin': 3, 'state': 1})
+    client.put('/device/123456789012', json={'pin': 3, 'state': 1})
+    client.put('/device/123456789012', json={'pin': 5, 'state': 1})
+
+    assert sensorevents.alarmstates.alarm_state_machine.post_event.call_count == 1
+
+
+def test_batch_rejects_unknown_pin_without_applying(client):
+    updates = [{'pin': 3, 'state': 1}, {'pin': 12, 'state': 1}]
+    response = client.put('/device/123456789012/batch', json={'updates': updates})
+
+    assert response.status_code == 404
+    assert sensors.sensor_list['123456789012'].input_pins[3].state == 0
+    sensorevents.alarmstates.alarm_state_machine.post_event.assert_not_called()
+
+
+@pytest.mark.parametrize('body', [{}, {'updates': {'pin': 3}}, {'updates': [{'pin': 3}]}])
+def test_batch_rejects_malformed_body(client, body):
+    response = client.put('/device/123456789012/batch', json=body)
+
+    assert response.status_code == 400
+
+
+def test_sensor_put_counts_as_heartbeat(client):
+    liveness_check = sensors.sensor_list['123456789012'].liveness_check
+    liveness_check.get_status.return_value = {'state': 'alive'}
+
+    client.put('/device/123456789012', json={'pin': 2, 'state': 1})
+    client.put('/device/123456789012/batch', json={'updates': [{'pin': 3, 'state': 1}]})
+
+    assert liveness_check.record_activity.call_count == 2
+    assert client.get('/sensor_liveness').get_json() == {'123456789012': {'state': 'alive'}}
@@ -0,0 +1,107 @@
+import pytest
+from pytest import fixture
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+import configparser
+import json
+import time
+
+import konnected
+import konnected_simulator
+import sensors
+
+
+@fixture(scope='module')
+def config_file():
+    config = configparser.ConfigParser()
+    config.read('test_config.ini')
+    return config
+
+
+@fixture()
+def simulator(config_file):
+    boards = konnected_simulator.boards_from_config(config_file, host='127.0.0.1')
+    boards[0].port = 0
+    simulator = konnected_simulator.Simulator(boards)
+    simulator.start()
+    yield simulator
+    simulator.stop()
+    konnected.close_sessions()
+
+
+@fixture()
+def board_client(simulator):
+    board = simulator.boards[0]
+    return konnected.Client(board.host, str(board.port), timeout=2)
+
+
+def test_boards_from_config(config_file):
+    board = konnected_simulator.boards_from_config(config_file)[0]
+
+    assert board.id == '123456789012'
+    assert board.port == 12345
+    assert list(board.inputs) == [2, 3, 4, 5, 6, 7]
+    assert list(board.outputs) == [1, 8]
+
+
+def test_status_matches_configured_pins(board_client, simulator, config_file, mocker):
+    compare_pins = sensors.SensorLivenessCheck.compare_pins
+    mocker.patch('sensors.konnected.Client')
+    mocker.patch('sensors.SensorLivenessCheck')
+    sensor = sensors.Sensor(config_file['123456789012'])
+    sensor.load_zones_and_pins(config_file)
+
+    status = board_client.get_status()
+
+    assert status['mac'] == '12:34:56:78:90:12'
+    assert compare_pins(sensor.configured_inputs, status['sensors']) is True
+    assert compare_pins(sensor.configured_outputs, status['actuators']) is True
+
+
+def test_actuation_and_settings(board_client, simulator):
+    board = simulator.boards[0]
+
+    assert board_client.put_device(8, 1) == {'pin': 8, 'state': 1}
+    assert board_client.get_device(8) == {'pin': 8, 'state': 1}
+
+    assert board_client.put_settings([{'pin': 2}], [{'pin': 1}], 'token', 'http://127.0.0.1:5000') is True
+    assert list(board.inputs) == [2]
+    assert list(board.outputs) == [1]
+    assert board.api_url == 'http://127.0.0.1:5000'
+
+
+def test_failure_injection(board_client, simulator):
+    simulator.boards[0].failure_rate = 1.0
+
+    with pytest.raises(konnected.Client.ClientError):
+        board_client.get_status()
+    assert simulator.boards[0].failures == 1
+
+
+def test_pushes_sensor_changes():
+    received = []
+
+    class ServerHandler(BaseHTTPRequestHandler):
+        def do_PUT(self):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            received.append((self.path, json.loads(body)))
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), ServerHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    board = konnected_simulator.VirtualBoard('123456789012', inputs=[2, 3])
+    simulator = konnected_simulator.Simulator([board], 'http://127.0.0.1:{}'.format(server.server_address[1]), 50)
+    simulator.start()
+    time.sleep(0.3)
+    simulator.stop()
+    server.shutdown()
+
+    assert len(received) > 5
+    path, body = received[0]
+    assert path == '/device/123456789012'
+    assert body['pin'] in (2, 3)
@@ -0,0 +1,75 @@
+import pytest
+from pytest import fixture
+import threading
+
+import metrics
+
+
+@fixture()
+def registry():
+    return metrics.MetricsRegistry(buckets=(0.01, 0.1))
+
+
+def test_counters(registry):
+    registry.increment('requests_total', endpoint='state')
+    registry.increment('requests_total', endpoint='state')
+    registry.increment('requests_total', 3, endpoint='device')
+
+    assert registry.get_counter('requests_total', endpoint='state') == 2
+    assert registry.get_counter('requests_total', endpoint='device') == 3
+    assert registry.get_counter('requests_total', endpoint='metrics') == 0
+
+
+def test_histogram_render(registry):
+    registry.observe('latency_seconds', 0.005, call='get_status')
+    registry.observe('latency_seconds', 0.05, call='get_status')
+    registry.observe('latency_seconds', 5, call='get_status')
+
+    histogram = registry.get_histogram('latency_seconds', call='get_status')
+    assert histogram.counts == [1, 1, 1]
+    assert histogram.count == 3
+
+    lines = registry.render().splitlines()
+    assert '# TYPE latency_seconds histogram' in lines
+    assert 'latency_seconds_bucket{call="get_status",le="0.01"} 1' in lines
+    assert 'latency_seconds_bucket{call="get_status",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{call="get_status",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{call="get_status"} 3' in lines
+
+
+def test_collectors_only_run_on_render(registry, mocker):
+    collector = mocker.Mock(return_value={'queue_depth': 4})
+    registry.add_collector(collector, 'dispatcher_')
+    collector.assert_not_called()
+
+    assert 'dispatcher_queue_depth 4' in registry.render().splitlines()
+    collector.assert_called_once()
+
+
+def test_labelled_collector(registry):
+    areas = {'house': {'queue_depth': 1}, 'garage': {'queue_depth': 2}}
+    registry.add_collector(lambda: areas, 'dispatcher_', 'area')
+
+    lines = registry.render().splitlines()
+    assert lines.count('# TYPE dispatcher_queue_depth gauge') == 1
+    assert lines.index('dispatcher_queue_depth{area="garage"} 2') < lines.index('dispatcher_queue_depth{area="house"} 1')
+
+
+def test_threads_record_into_their_own_shards(registry):
+    def record():
+        for _ in range(100):
+            registry.increment('events_total', area='house')
+            registry.observe('latency_seconds', 0.05, area='house')
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    registry.increment('events_total', area='house')
+
+    # The shards of finished threads are folded together, keeping their counts
+    assert len(registry._shards) == 1
+    assert registry.get_counter('events_total', area='house') == 401
+    assert registry.get_histogram('latency_seconds', area='house').counts == [0, 400, 0]
+    assert 'events_total{area="house"} 401' in registry.render().splitlines()
@@ -0,0 +1,152 @@
+import pytest
+from pytest import fixture
+import configparser
+import queue
+import threading
+import time
+
+import history
+import sensorevents
+import sensors
+
+
+@fixture(scope='module')
+def config_file():
+    config = configparser.ConfigParser()
+    config.read('test_config.ini')
+    return config
+
+
+@fixture()
+def post_event(mocker):
+    return mocker.patch('sensorevents.alarmstates.alarm_state_machine').post_event
+
+
+@fixture()
+def pins(config_file):
+    zone = sensors.Zone(1, config_file['123456789012'])
+    states = bytearray(4)
+    pins = {}
+    for pin_number in (2, 3):
+        pin = sensors.Pin(pin_number, states)
+        pin.zone = zone
+        zone.pin_numbers.append(pin_number)
+        pins[pin_number] = pin
+    return pins
+
+
+def test_duplicate_and_unchanged_updates_suppressed(post_event, pins):
+    event_filter = sensorevents.SensorEventFilter()
+    pin2, pin3 = pins[2], pins[3]
+
+    assert event_filter.update_pins('123456789012', [(pin2, 1)]) == [1]
+    assert event_filter.update_pins('123456789012', [(pin2, 1)]) == []
+    assert event_filter.update_pins('123456789012', [(pin3, 1)]) == []
+
+    metrics = event_filter.get_metrics()
+    assert metrics['duplicate_pin_updates'] == 1
+    assert metrics['unchanged_zone_updates'] == 1
+    assert metrics['forwarded_zone_events'] == 1
+    post_event.assert_called_once()
+
+
+def test_bounce_within_hold_off_collapses(post_event, pins):
+    event_filter = sensorevents.SensorEventFilter(hold_off_s=0.05)
+    pin2 = pins[2]
+
+    assert event_filter.update_pins('123456789012', [(pin2, 1)]) == [1]
+    assert event_filter.update_pins('123456789012', [(pin2, 0)]) == []
+    assert event_filter.update_pins('123456789012', [(pin2, 1)]) == []
+
+    # Zone settled back where it was last reported, so nothing trails out after the window
+    time.sleep(0.1)
+    assert post_event.call_count == 1
+    assert event_filter.get_metrics()['debounced_zone_events'] == 2
+
+
+def test_settled_change_forwarded_after_hold_off(post_event, pins):
+    event_filter = sensorevents.SensorEventFilter(hold_off_s=0.05)
+    pin2 = pins[2]
+
+    event_filter.update_pins('123456789012', [(pin2, 1)])
+    event_filter.update_pins('123456789012', [(pin2, 0)])
+
+    time.sleep(0.1)
+    assert post_event.call_count == 2
+    assert event_filter.get_metrics()['trailing_zone_events'] == 1
+
+
+def test_refused_update_forwarded_on_retry(post_event, pins):
+    event_filter = sensorevents.SensorEventFilter()
+    pin2 = pins[2]
+    post_event.side_effect = [queue.Full, None]
+
+    with pytest.raises(queue.Full):
+        event_filter.update_pins('123456789012', [(pin2, 1)])
+    assert pin2.state == 1 and pin2.zone.state == 1
+
+    # The board retries with the same state, which is a duplicate pin update but still news for the zone
+    assert event_filter.update_pins('123456789012', [(pin2, 1)]) == [1]
+    time.sleep(0.2)
+    assert post_event.call_count == 2
+    assert event_filter.get_metrics()['forwarded_zone_events'] == 1
+
+
+def test_refused_update_forwarded_later_without_retry(post_event, pins):
+    event_filter = sensorevents.SensorEventFilter()
+    post_event.side_effect = [queue.Full, None]
+
+    with pytest.raises(queue.Full):
+        event_filter.update_pins('123456789012', [(pins[2], 1)])
+
+    time.sleep(0.2)
+    assert post_event.call_count == 2
+    assert event_filter.get_metrics()['trailing_zone_events'] == 1
+
+
+def test_waiting_for_the_queue_holds_up_no_other_sensor(post_event, pins, config_file):
+    event_filter = sensorevents.SensorEventFilter()
+    other_zone = sensors.Zone(1, config_file['123456789012'])
+    other_pin = sensors.Pin(2)
+    other_pin.zone = other_zone
+    released = threading.Event()
+    # The first sensor's event waits for room in the queue until released
+    post_event.side_effect = lambda event, key, timeout: released.wait() if key.sensor_id == '123456789012' else None
+
+    waiting = threading.Thread(target=event_filter.update_pins, args=('123456789012', [(pins[2], 1)]))
+    waiting.start()
+    assert event_filter.update_pins('000000000001', [(other_pin, 1)]) == [1]
+    assert event_filter.get_metrics()['forwarded_zone_events'] == 1
+
+    released.set()
+    waiting.join()
+    assert event_filter.get_metrics()['forwarded_zone_events'] == 2
+
+
+def test_overtaken_post_keeps_history_in_order(post_event, pins, mocker):
+    zone_history = mocker.patch('sensorevents.history.zone_history', history.ZoneHistory())
+    event_filter = sensorevents.SensorEventFilter()
+    posting, released = threading.Event(), threading.Event()
+
+    # The opening waits for room in the queue while the closing is posted straight away
+    def wait_for_room(event, key, timeout):
+        if not posting.is_set():
+            posting.set()
+            released.wait()
+    post_event.side_effect = wait_for_room
+
+    opening = threading.Thread(target=event_filter.update_pins, args=('123456789012', [(pins[2], 1)]))
+    opening.start()
+    assert posting.wait(1)
+    assert event_filter.update_pins('123456789012', [(pins[2], 0)]) == [1]
+    released.set()
+    opening.join()
+
+    assert [event['state'] for event in reversed(zone_history.recent())] == [1, 0]
+
+
+def test_hold_off_from_config(config_file):
+    event_filter = sensorevents.SensorEventFilter()
+    event_filter.load_from_config(config_file)
+
+    assert event_filter.hold_off_s == pytest.approx(0.05)
@@ -1,6 +1,9 @@
 import pytest
 from pytest import fixture
 import configparser
+import asyncio
+import threading
+import time
 
 import sensors
 
@@ -18,6 +21,13 @@ def sensor_mocks(mocker):
     mocker.patch('sensors.SensorLivenessCheck')
 
 
+@fixture()
+def liveness_sensor(mocker):
+    mocker.patch('sensors.konnected.aio.AsyncClient')
+    return mocker.Mock(id='123456789012', HEART_BEAT_TIMEOUT_S=5, configured_inputs=frozenset(),
+                       configured_outputs=frozenset(), settings_payload=None)
+
+
 @fixture()
 def test_sensor(sensor_mocks, config_file):
     return sensors.Sensor(config_file['123456789012'])
@@ -52,24 +62,24 @@ def test_sensor_load_zones_and_pins(test_sensor, config_file):
     assert test_sensor.zones[1].name == 'Front Door'
     assert test_sensor.zones[1].chime_enabled is True
     # Verify Zone 1 pins are correctly linked
-    assert len(test_sensor.zones[1].pins) == 1
-    assert test_sensor.zones[1].pins[2] is test_sensor.input_pins[2]
+    assert list(test_sensor.zones[1].pin_numbers) == [2]
+    assert test_sensor.pin_zones[2] == 1
 
     # Verify Zone 2 properties
     assert test_sensor.zones[2].number == 2
     assert test_sensor.zones[2].name == 'Back Door'
     assert test_sensor.zones[2].chime_enabled is False
     # Verify Zone 2 pins are correctly linked
-    assert len(test_sensor.zones[2].pins) == 2
-    assert test_sensor.zones[2].pins[3] is test_sensor.input_pins[3]
-    assert test_sensor.zones[2].pins[4] is test_sensor.input_pins[4]
+    assert list(test_sensor.zones[2].pin_numbers) == [3, 4]
+    assert test_sensor.pin_zones[3] == 2
+    assert test_sensor.pin_zones[4] == 2
 
     # Verify Zone 3 properties
     assert test_sensor.zones[3].number == 3
     assert test_sensor.zones[3].name == ''
     assert test_sensor.zones[3].chime_enabled is False
     # Verify Zone 3 pins are correctly linked
-    assert len(test_sensor.zones[3].pins) == 0
+    assert len(test_sensor.zones[3].pin_numbers) == 0
 
     # Verify Input Pin Creation
     # Verify Pin 2 properties
@@ -112,7 +122,7 @@ def test_sensor_load_zones_and_pins(test_sensor, config_file):
                           ([{'pin': 1}, {'pin': 3}], False)
                           ])
 def test_sensor_liveness_check_compare_pins(pins, result):
-    correct_pins = {1: sensors.Pin(1), 8: sensors.Pin(8)}
+    correct_pins = frozenset({1, 8})
 
     assert sensors.SensorLivenessCheck.compare_pins(correct_pins, pins) is result
 
@@ -128,23 +138,34 @@ def test_pin_zone_update(test_sensor, config_file):
     # Ensure zone starts at 0
     assert test_zone.state == 0
 
-    # Update pin 2 and verify zone updates
-    pin3.update_state(1)
+    # Update pin 3 and verify zone updates
+    assert pin3.update_state(1) is True
     assert test_zone.state == 1
 
-    # Update pin 3 and verify zone is still 1
-    pin4.update_state(1)
+    # Update pin 4 and verify zone is still 1
+    assert pin4.update_state(1) is False
     assert test_zone.state == 1
 
-    # Clear pin 2 and verify zone is still 1
-    pin3.update_state(0)
+    # Repeat pin 4 and verify nothing changes
+    assert pin4.update_state(1) is False
+    assert test_zone.active_pins == 2
+
+    # Clear pin 3 and verify zone is still 1
+    assert pin3.update_state(0) is False
     assert test_zone.state == 1
 
-    # Clear pin 3 and verify zone clears
-    pin4.update_state(0)
+    # Clear pin 4 and verify zone clears
+    assert pin4.update_state(0) is True
     assert test_zone.state == 0
 
 
+def test_pin_without_zone_update(test_sensor, config_file):
+    test_sensor.load_zones_and_pins(config_file)
+
+    assert test_sensor.input_pins[5].update_state(1) is False
+    assert test_sensor.input_pins[5].state == 1
+
+
 def test_tone_generator_config(config_file):
     chime = sensors.ToneGenerator()
     chime.load_chime_parameters_from_config(config_file['door_chime'])
@@ -152,3 +173,231 @@ def test_tone_generator_config(config_file):
     assert chime.number_of_beeps == 3
     assert chime.beep_duration_ms == 200
     assert chime.pause_duration_ms == 50
+
+
+def test_liveness_check_marks_unreachable_sensor(liveness_sensor, mocker):
+    check = sensors.SensorLivenessCheck(liveness_sensor)
+    check._client.get_status = mocker.AsyncMock(side_effect=sensors.konnected.Client.ClientError('unreachable'))
+
+    asyncio.run(check.check())
+    assert check.is_alive() is False
+
+    check._client.get_status = mocker.AsyncMock(return_value={'sensors': [], 'actuators': [], 'mac': '00'})
+    asyncio.run(check.check())
+    assert check.is_alive() is True
+
+
+def test_liveness_check_adapts_period(liveness_sensor, mocker):
+    check = sensors.SensorLivenessCheck(liveness_sensor)
+    healthy = mocker.AsyncMock(return_value={'sensors': [], 'actuators': [], 'mac': '00'})
+    check._client.get_status = healthy
+
+    # Healthy boards back off to the maximum period
+    periods = []
+    for _ in range(6):
+        asyncio.run(check.check())
+        periods.append(check.period_s)
+    assert periods == [5, 10, 20, 40, 60, 60]
+    assert check.state == sensors.LivenessState.alive
+
+    # A miss makes the board suspect and probes quickly, then it is dead after enough misses
+    check._client.get_status = mocker.AsyncMock(side_effect=sensors.konnected.Client.ClientError('unreachable'))
+    asyncio.run(check.check())
+    assert check.state == sensors.LivenessState.suspect
+    assert check.period_s == sensors.SensorLivenessCheck.CONST_PROBE_PERIOD_s
+    for _ in range(sensors.SensorLivenessCheck.CONST_DEAD_AFTER_MISSES - 1):
+        asyncio.run(check.check())
+    assert check.state == sensors.LivenessState.dead
+    assert check.get_status()['misses'] == sensors.SensorLivenessCheck.CONST_DEAD_AFTER_MISSES
+
+    # Hearing from the board brings it straight back
+    check.record_activity()
+    assert check.is_alive() is True
+
+
+def test_liveness_check_skips_poll_after_inbound_activity(liveness_sensor, mocker):
+    check = sensors.SensorLivenessCheck(liveness_sensor)
+    check._client.get_status = mocker.AsyncMock(return_value={'sensors': [], 'actuators': [], 'mac': '00'})
+
+    asyncio.run(check.check())
+    check.record_activity()
+    asyncio.run(check.check())
+    assert check._client.get_status.await_count == 1
+    assert check.period_s == 10
+
+    # Busy boards are still polled now and then so their pin settings get verified
+    check.last_polled -= sensors.SensorLivenessCheck.CONST_MAX_PERIOD_s
+    check.record_activity()
+    asyncio.run(check.check())
+    assert check._client.get_status.await_count == 2
+
+
+def test_liveness_scheduler_uses_single_thread(mocker):
+    class FakeCheck:
+        period_s = 0.01
+
+        def __init__(self):
+            self.polls = 0
+
+        async def check(self):
+            self.polls += 1
+
+        async def close(self):
+            pass
+
+    scheduler = sensors.LivenessScheduler()
+    threads_before = threading.active_count()
+
+    checks = [FakeCheck() for _ in range(100)]
+    for check in checks:
+        scheduler.add(check)
+    assert threading.active_count() == threads_before + 1
+
+    time.sleep(0.2)
+    scheduler.stop()
+
+    assert all(check.polls > 0 for check in checks)
+    assert threading.active_count() == threads_before
+
+
+def test_liveness_scheduler_jitter():
+    for _ in range(100):
+        period = sensors.LivenessScheduler.jittered(5)
+        assert 5 * (1 - sensors.LivenessScheduler.JITTER_FRACTION) <= period
+        assert period <= 5 * (1 + sensors.LivenessScheduler.JITTER_FRACTION)
+
+
+def test_initialize_sensor_hardware_report(mocker):
+    config = configparser.ConfigParser()
+    config.read_dict({'server': {'init_deadline_s': '0.2'}})
+    mocker.patch('sensors.HARDWARE_INIT_RETRY_s', 0.01)
+
+    def slow_board(config):
+        time.sleep(1)
+        return True
+
+    flaky_board = mocker.Mock(id='3', initialize_hardware=mocker.Mock(
+        side_effect=[sensors.konnected.Client.ClientError('unreachable'), True]))
+
+    mocker.patch.dict('sensors.sensor_list', {
+        '1': mocker.Mock(id='1', initialize_hardware=mocker.Mock(return_value=True)),
+        '2': mocker.Mock(id='2', initialize_hardware=mocker.Mock(side_effect=slow_board)),
+        '3': flaky_board}, clear=True)
+
+    start = time.perf_counter()
+    report = sensors.initialize_sensor_hardware(config)
+
+    assert time.perf_counter() - start < 0.5
+    assert report == {'1': 'initialized', '2': 'timed out', '3': 'failed'}
+
+    # The failed board is retried in the background
+    time.sleep(0.2)
+    assert flaky_board.initialize_hardware.call_count == 2
+    sensors.stop_hardware_initialization()
+
+
+def test_hardware_retry_gives_up_on_replaced_sensor(mocker):
+    config = configparser.ConfigParser()
+    config.read_dict({'server': {'init_deadline_s': '0.2'}})
+    mocker.patch('sensors.HARDWARE_INIT_RETRY_s', 0.01)
+    mocker.patch('sensors.HARDWARE_INIT_MAX_RETRY_s', 0.02)
+    unreachable = mocker.Mock(id='1', initialize_hardware=mocker.Mock(
+        side_effect=sensors.konnected.Client.ClientError('unreachable')))
+    mocker.patch.dict('sensors.sensor_list', {'1': unreachable}, clear=True)
+
+    assert sensors.initialize_sensor_hardware(config) == {'1': 'failed'}
+
+    # Once the board is replaced by a reload its retries give up
+    sensors.sensor_list['1'] = mocker.Mock(id='1')
+    time.sleep(0.1)
+    attempts = unreachable.initialize_hardware.call_count
+    time.sleep(0.1)
+    assert unreachable.initialize_hardware.call_count == attempts
+    assert '1' not in sensors._hardware_init_retries
+    sensors.stop_hardware_initialization()
+
+
+def test_sensor_stop_cancels_its_hardware_retry(test_sensor, mocker):
+    # Stopping a sensor cancels its own retry, not one of a newer sensor with the same id
+    retry = mocker.Mock()
+    mocker.patch.dict('sensors._hardware_init_retries', {test_sensor.id: (mocker.Mock(), retry)})
+    test_sensor.stop()
+    retry.cancel.assert_not_called()
+    sensors._hardware_init_retries[test_sensor.id] = (test_sensor, retry)
+    test_sensor.stop()
+    retry.cancel.assert_called_once_with()
+    assert test_sensor.id not in sensors._hardware_init_retries
+
+
+def test_reload_sensors(sensor_mocks, config_file, mocker):
+    mocker.patch('sensors.sensor_list', {})
+    mocker.patch('sensors.tone_generator', sensors.ToneGenerator())
+    mocker.patch('sensors.siren', sensors.Siren())
+    mocker.patch('sensors.initialize_sensor_hardware', return_value={})
+    sensors.load_sensors(config_file)
+    original = sensors.sensor_list['123456789012']
+    original.input_pins[3].update_state(1)
+
+    # An unchanged config keeps the existing sensor and pushes no settings
+    report = sensors.reload_sensors(config_file)
+    assert report['unchanged'] == ['123456789012']
+    assert sensors.sensor_list['123456789012'] is original
+    sensors.initialize_sensor_hardware.assert_not_called()
+
+    # Renaming a zone rebuilds the sensor but keeps pin state, and the layout didn't change
+    reloaded = configparser.ConfigParser()
+    reloaded.read_dict(config_file)
+    reloaded['123456789012']['zone2_name'] = 'Patio Door'
+    report = sensors.reload_sensors(reloaded)
+    rebuilt = sensors.sensor_list['123456789012']
+    assert report['rebuilt'] == ['123456789012']
+    assert rebuilt is not original
+    assert rebuilt.zones[2].name == 'Patio Door'
+    assert rebuilt.input_pins[3].state == 1
+    assert rebuilt.zones[2].active_pins == 1
+    assert sensors.tone_generator.sensor is rebuilt
+    assert sensors.siren.sensor is rebuilt
+    sensors.initialize_sensor_hardware.assert_not_called()
+
+    # Outputs a rebuilt sensor no longer declares are let go once the new sensors are in place
+    reloaded['123456789012']['pin8_name'] = 'Strobe'
+    sensors.reload_sensors(reloaded)
+    assert sensors.siren.sensor is None
+    assert sensors.siren.pin_number == 0
+    assert sensors.tone_generator.sensor is sensors.sensor_list['123456789012']
+    assert sensors.sensor_list['123456789012'].configured_outputs == frozenset({1})
+    sensors.initialize_sensor_hardware.assert_called_once_with(reloaded, [sensors.sensor_list['123456789012']])
+    sensors.initialize_sensor_hardware.reset_mock()
+
+    # Changing a pin's role needs new settings on the board
+    reloaded['123456789012']['pin5'] = 'output'
+    reloaded['123456789012']['pin5_name'] = 'Strobe'
+    sensors.reload_sensors(reloaded)
+    sensors.initialize_sensor_hardware.assert_called_once_with(reloaded, [sensors.sensor_list['123456789012']])
+
+
+def test_liveness_check_reconfigures_mismatched_board(liveness_sensor, mocker):
+    payload = {'sensors': [{'pin': 2}], 'actuators': [{'pin': 1}], 'auth_token': 'token', 'endpoint': 'http://x:1'}
+    liveness_sensor.configure_mock(configured_inputs=frozenset({2}), configured_outputs=frozenset({1}),
+                                   settings_payload=payload)
+    check = sensors.SensorLivenessCheck(liveness_sensor)
+    check._client.get_status = mocker.AsyncMock(return_value={'sensors': [{'pin': 3}], 'actuators': [{'pin': 1}],
+                                                              'mac': '00'})
+    check._client.put_settings = mocker.AsyncMock(return_value=True)
+
+    asyncio.run(check.check())
+    check._client.put_settings.assert_awaited_once_with(**payload)
+
+    # Repeated mismatches inside the interval don't send the settings again
+    asyncio.run(check.check())
+    assert check._client.put_settings.await_count == 1
+
+    check.last_reconfigured -= sensors.SensorLivenessCheck.CONST_RECONFIGURE_INTERVAL_s
+    asyncio.run(check.check())
+    assert check._client.put_settings.await_count == 2
+
+    # A board reporting the configured pins is left alone
+    check._client.get_status.return_value = {'sensors': [{'pin': 2}], 'actuators': [{'pin': 1}], 'mac': '00'}
+    check.last_reconfigured = None
+    asyncio.run(check.check())
+    assert check._client.put_settings.await_count == 2
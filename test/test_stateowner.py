@@ -0,0 +1,109 @@
+import pytest
+from pytest import fixture
+from flask import Flask
+from flask_restful import Api
+import configparser
+
+import alarmstates
+import eventstream
+import konnected_server
+import sensorevents
+import sensors
+import stateowner
+import workerapp
+
+
+@fixture(scope='module')
+def config_file():
+    config = configparser.ConfigParser()
+    config.read('test_config.ini')
+    return config
+
+
+@fixture()
+def owner(mocker, config_file, tmp_path):
+    mocker.patch('sensors.konnected.Client')
+    mocker.patch('sensors.SensorLivenessCheck')
+    mocker.patch('sensorevents.alarmstates.alarm_state_machine')
+    mocker.patch('sensorevents.sensor_event_filter', sensorevents.SensorEventFilter())
+    mocker.patch('eventstream.event_broadcaster', eventstream.EventBroadcaster())
+    mocker.patch.dict('sensors.sensor_list', clear=True)
+    sensors.load_sensors(config_file)
+    alarmstates.alarm_state_machine.get_current_state.return_value = alarmstates.StateType.disarmed
+
+    app = Flask(__name__)
+    api = Api(app)
+    api.add_resource(konnected_server.SensorEventsHandler, '/sensor_events')
+
+    owner = stateowner.StateOwner(app, str(tmp_path / 'state.sock'))
+    owner.start()
+    yield owner
+    owner.stop()
+
+
+@fixture()
+def worker(owner, mocker):
+    mocker.patch('workerapp.state_owner', workerapp.StateOwnerClient())
+    return workerapp.create_app(owner.path).test_client()
+
+
+def test_sensor_updates_are_applied_by_owner(worker):
+    assert worker.put('/device/123456789012', json={'pin': 2, 'state': 1}).status_code == 200
+
+    response = worker.put('/device/123456789012/batch', json={'updates': [{'pin': 3, 'state': 1}]})
+    assert response.get_json() == {'zones': [2]}
+
+    sensor = sensors.sensor_list['123456789012']
+    assert sensor.input_pins[2].state == 1
+    assert sensor.input_pins[3].state == 1
+    assert sensorevents.alarmstates.alarm_state_machine.post_event.call_count == 2
+
+
+def test_owner_errors_are_relayed(worker):
+    response = worker.put('/device/000000000000', json={'pin': 2, 'state': 1})
+    assert response.status_code == 404
+    assert response.get_json() == {'message': "Sensor ID 000000000000 doesn't exist"}
+
+    response = worker.put('/device/123456789012/batch', json={'updates': [{'pin': 'x', 'state': 1}]})
+    assert response.status_code == 400
+
+
+def test_state_is_read_from_owner(worker):
+    assert worker.get('/state').get_json() == {'current state': 'disarmed'}
+
+
+def test_other_requests_pass_through(worker):
+    worker.put('/device/123456789012', json={'pin': 2, 'state': 1})
+
+    response = worker.get('/sensor_events')
+    assert response.status_code == 200
+    assert response.get_json()['forwarded_zone_events'] == 1
+    assert worker.get('/unknown').status_code == 404
+
+
+def test_events_stream_from_owner(worker):
+    response = worker.get('/state/events')
+    stream = response.response
+
+    assert next(stream) == b'event: state\ndata: {"state": "disarmed", "area": "default"}\n\n'
+    worker.put('/device/123456789012', json={'pin': 2, 'state': 1})
+    assert next(stream).startswith(b'event: zone\n')
+
+    response.close()
+
+
+def test_worker_without_owner(tmp_path, mocker):
+    mocker.patch('workerapp.state_owner', workerapp.StateOwnerClient())
+    worker = workerapp.create_app(str(tmp_path / 'missing.sock')).test_client()
+
+    assert worker.put('/device/123456789012', json={'pin': 2, 'state': 1}).status_code == 503
+    assert worker.get('/sensor_events').status_code == 503
+
+
+def test_worker_rejects_malformed_updates_itself(tmp_path, mocker):
+    mocker.patch('workerapp.state_owner', workerapp.StateOwnerClient())
+    worker = workerapp.create_app(str(tmp_path / 'missing.sock')).test_client()
+
+    response = worker.put('/device/123456789012/batch', json={'updates': [{'pin': 2}]})
+    assert response.status_code == 400
+    assert worker.put('/device/123456789012', json={'pin': 'x', 'state': 1}).status_code == 400
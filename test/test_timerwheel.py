@@ -0,0 +1,89 @@
+from pytest import fixture
+import threading
+import time
+
+import timerwheel
+
+
+@fixture()
+def wheel():
+    wheel = timerwheel.TimerWheel(tick_s=0.001)
+    yield wheel
+    wheel.stop()
+
+
+def test_timers_fire_in_deadline_order(wheel):
+    fired = []
+    done = threading.Event()
+    wheel.schedule(0.03, fired.append, 3)
+    wheel.schedule(0.01, fired.append, 1)
+    wheel.schedule(0.02, fired.append, 2)
+    wheel.schedule(0.04, done.set)
+
+    assert done.wait(1)
+    assert fired == [1, 2, 3]
+    assert wheel.get_metrics()['fired'] == 4
+    assert wheel.get_metrics()['pending'] == 0
+
+
+def test_timer_never_fires_early(wheel):
+    fired_at = []
+    done = threading.Event()
+    start = time.monotonic()
+    wheel.schedule(0.05, lambda: (fired_at.append(time.monotonic()), done.set()))
+
+    assert done.wait(1)
+    assert fired_at[0] - start >= 0.05
+
+
+def test_cancelled_timer_does_not_fire(wheel):
+    fired = []
+    done = threading.Event()
+    timer = wheel.schedule(0.01, fired.append, 'cancelled')
+    wheel.schedule(0.03, done.set)
+
+    assert timer.cancel() is True
+    assert timer.cancel() is False
+    assert done.wait(1)
+    assert fired == []
+    assert wheel.get_metrics()['cancelled'] == 1
+
+
+def test_long_timers_cascade_down(wheel):
+    # More than one lap of the lowest wheel, so these start on an upper level
+    done = threading.Event()
+    fired = []
+    for delay_s in (0.6, 0.3, 0.45):
+        wheel.schedule(delay_s, fired.append, delay_s)
+    wheel.schedule(0.65, done.set)
+
+    assert done.wait(2)
+    assert fired == [0.3, 0.45, 0.6]
+
+
+def test_failing_callback_does_not_stop_wheel(wheel):
+    done = threading.Event()
+    wheel.schedule(0.01, lambda: 1 / 0)
+    wheel.schedule(0.02, done.set)
+
+    assert done.wait(1)
+
+
+def test_thousands_of_timers_on_one_thread(wheel):
+    done = threading.Event()
+    remaining = [2000]
+
+    def fired():
+        remaining[0] -= 1
+        if remaining[0] == 0:
+            done.set()
+
+    threads = threading.active_count()
+    # Far enough out that every timer is scheduled and half are cancelled before the first fires
+    timers = [wheel.schedule(0.5 + index * 0.00005, fired) for index in range(4000)]
+    for timer in timers[1::2]:
+        timer.cancel()
+
+    assert threading.active_count() <= threads + 1
+    assert done.wait(2)
+    assert wheel.get_metrics()['pending'] == 0
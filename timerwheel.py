@@ -0,0 +1,215 @@
+import logging
+import threading
+
+import clocks
+import simplethread
+
+logger = logging.getLogger(__name__)
+
+
+class Timer:
+    """A deadline registered with a TimerWheel. cancel() is safe to call from any thread, any number of times"""
+    __slots__ = ('wheel', 'tick', 'deadline', 'callback', 'args', 'slot')
+
+    def __init__(self, wheel, tick, deadline, callback, args):
+        self.wheel = wheel
+        self.tick = tick
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.slot = None
+
+    def cancel(self):
+        """Returns True if the timer was still pending"""
+        return self.wheel.cancel(self)
+
+    def is_pending(self):
+        return self.slot is not None
+
+
+class TimerWheel(simplethread.ConditionThread):
+    """Hierarchical timer wheel running every timeout in the process on one thread"""
+    # Callbacks run on the wheel thread, so they must not block
+    CONST_TICK_s = 0.01
+    CONST_SLOT_BITS = 8
+    CONST_LEVELS = 4
+
+    def __init__(self, tick_s=CONST_TICK_s):
+        simplethread.ConditionThread.__init__(self)
+        self.tick_s = tick_s
+        self._slots = 1 << self.CONST_SLOT_BITS
+        self._mask = self._slots - 1
+        self._max_ticks = (1 << (self.CONST_SLOT_BITS * self.CONST_LEVELS)) - 1
+        self._wheels = [[set() for _ in range(self._slots)] for _ in range(self.CONST_LEVELS)]
+
+        self._origin = clocks.clock.monotonic()
+        # The next tick to expire. Every pending timer's tick is at or after it
+        self._next_tick = 1
+        self._wake_tick = None
+
+        self._pending = 0
+        self._fired = 0
+        self._cancelled = 0
+        self._max_lateness_s = 0.0
+        self._total_lateness_s = 0.0
+
+    def schedule(self, delay_s, callback, *args):
+        """Call callback(*args) on the wheel thread once delay_s has passed. Returns the Timer"""
+        clock = clocks.clock
+        deadline = clock.monotonic() + max(delay_s, 0)
+        with self._condition:
+            if self._pending == 0:
+                # Nothing to expire, so skip the idle ticks rather than walking them later
+                self._next_tick = max(self._next_tick, self._tick_at(clock.monotonic()) + 1)
+
+            # Round up so the timer can't fire before its deadline
+            tick = -int(-(deadline - self._origin) // self.tick_s)
+            timer = Timer(self, max(tick, self._next_tick), deadline, callback, args)
+            self._place(timer)
+            self._pending += 1
+
+            if clock.is_virtual:
+                clock.attach(self)
+            elif not self._running:
+                self.start()
+            elif self._wake_tick is None or timer.tick < self._wake_tick:
+                self._condition.notify()
+        return timer
+
+    def start(self):
+        if not hasattr(self, '_thread'):
+            self._thread = threading.Thread(target=self.thread_loop)
+        # Pending timeouts shouldn't keep the process alive, any more than the threading.Timers they replaced did
+        self._thread.daemon = True
+        simplethread.ConditionThread.start(self)
+
+    def cancel(self, timer):
+        with self._condition:
+            if timer.slot is None:
+                return False
+            timer.slot.discard(timer)
+            timer.slot = None
+            self._pending -= 1
+            self._cancelled += 1
+            return True
+
+    def thread_loop(self):
+        with self._condition:
+            while self._running:
+                now = clocks.clock.monotonic()
+                expired = self._expire_until(now)
+                if expired:
+                    self._condition.release()
+                    try:
+                        self._run(expired)
+                    finally:
+                        self._condition.acquire()
+                    continue
+
+                if self._pending:
+                    self._wake_tick = self._next_due_tick()
+                    self._condition.wait(self._origin + self._wake_tick * self.tick_s - now)
+                else:
+                    self._wake_tick = None
+                    self._condition.wait()
+
+    def next_deadline(self):
+        """When the wheel next has something to do, or None if nothing is pending"""
+        with self._condition:
+            if not self._pending:
+                return None
+            due_tick = self._next_due_tick()
+            # The tick's time can round to just under the deadlines in it, and timers never fire early
+            return max([self._origin + due_tick * self.tick_s] +
+                       [timer.deadline for timer in self._wheels[0][due_tick & self._mask]])
+
+    def run_due(self):
+        """Run every timer due by the clock's current time on the calling thread"""
+        with self._condition:
+            expired = self._expire_until(clocks.clock.monotonic())
+        self._run(expired)
+
+    def get_metrics(self):
+        with self._condition:
+            return {'pending': self._pending,
+                    'fired': self._fired,
+                    'cancelled': self._cancelled,
+                    'average_lateness_ms': self._total_lateness_s / self._fired * 1000 if self._fired else 0.0,
+                    'max_lateness_ms': self._max_lateness_s * 1000}
+
+    def _tick_at(self, now):
+        # The allowance keeps a virtual clock set exactly to a tick's time from rounding down to the tick before
+        return int((now - self._origin) / self.tick_s + 1e-6)
+
+    def _expire_until(self, now):
+        expired = []
+        now_tick = self._tick_at(now)
+        while self._pending and self._next_tick <= now_tick:
+            # Skip straight over empty ticks
+            due_tick = self._next_due_tick()
+            if due_tick > now_tick:
+                self._next_tick = now_tick + 1
+                break
+            self._next_tick = due_tick
+            expired.extend(self._expire_next_tick())
+        return expired
+
+    def _place(self, timer):
+        delta = min(timer.tick - self._next_tick, self._max_ticks)
+        level = 0
+        while delta >= self._slots and level < self.CONST_LEVELS - 1:
+            delta >>= self.CONST_SLOT_BITS
+            level += 1
+
+        slot = self._wheels[level][(timer.tick >> (self.CONST_SLOT_BITS * level)) & self._mask]
+        slot.add(timer)
+        timer.slot = slot
+
+    def _expire_next_tick(self):
+        tick = self._next_tick
+
+        # Whenever a level wraps, cascade the next slot of the level above into the levels below
+        level = 0
+        index = tick & self._mask
+        while index == 0 and level < self.CONST_LEVELS - 1:
+            level += 1
+            index = (tick >> (self.CONST_SLOT_BITS * level)) & self._mask
+            cascading = self._wheels[level][index]
+            self._wheels[level][index] = set()
+            for timer in cascading:
+                self._place(timer)
+
+        slot_index = tick & self._mask
+        expired = self._wheels[0][slot_index]
+        self._wheels[0][slot_index] = set()
+        for timer in expired:
+            timer.slot = None
+        self._pending -= len(expired)
+        self._next_tick = tick + 1
+        return expired
+
+    def _next_due_tick(self):
+        """The first tick with something to do: a non-empty slot on the lowest wheel, or the next cascade"""
+        if self._next_tick & self._mask == 0:
+            return self._next_tick
+        wheel = self._wheels[0]
+        for tick in range(self._next_tick, (self._next_tick | self._mask) + 1):
+            if wheel[tick & self._mask]:
+                return tick
+        return (self._next_tick | self._mask) + 1
+
+    def _run(self, expired):
+        for timer in sorted(expired, key=lambda timer: timer.deadline):
+            lateness_s = clocks.clock.monotonic() - timer.deadline
+            try:
+                timer.callback(*timer.args)
+            except Exception:
+                logger.exception("Timer callback %s failed", getattr(timer.callback, '__name__', timer.callback))
+
+            with self._condition:
+                self._fired += 1
+                self._total_lateness_s += lateness_s
+                self._max_lateness_s = max(self._max_lateness_s, lateness_s)
+
+
+timer_wheel = TimerWheel()
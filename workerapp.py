@@ -0,0 +1,209 @@
+# Stateless HTTP worker for the production serving mode. Any number of these can run against one state
+# owner (alarmsystem.py --workers N starts them); the app can also be served by any WSGI server, e.g.
+#   gunicorn -w 4 -b 0.0.0.0:5000 'workerapp:create_app("alarmsystem.sock")'
+
+from flask import Flask, Response, request
+from flask_restful import Api, Resource, abort, reqparse
+import argparse
+import base64
+import json
+import logging
+import socket
+import threading
+
+from werkzeug.serving import make_server
+
+import pinupdates
+
+logger = logging.getLogger(__name__)
+
+# Request headers that describe the connection rather than the request, so aren't passed on to the state owner
+HOP_BY_HOP_HEADERS = {'host', 'connection', 'content-length', 'keep-alive', 'transfer-encoding'}
+
+put_parser = reqparse.RequestParser()
+put_parser.add_argument('state')
+put_parser.add_argument('pin')
+
+state_parser = reqparse.RequestParser()
+state_parser.add_argument('event')
+state_parser.add_argument('arm_config')
+state_parser.add_argument('area')
+
+state_get_parser = reqparse.RequestParser()
+state_get_parser.add_argument('area', location='args')
+
+
+class StateOwnerClient:
+    """Calls into the state owner over its Unix socket, with one persistent connection per thread"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._local = threading.local()
+
+    def call(self, name, **args):
+        """Returns the owner's {'status', 'body'} reply. Raises OSError if the owner can't be reached"""
+        message = json.dumps({'call': name, 'args': args}).encode() + b'\n'
+
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            try:
+                return self._exchange(connection, message)
+            except OSError:
+                # The owner may have restarted since this connection was opened, so try once more on a new one
+                self._close()
+
+        self._local.connection = self._connect()
+        try:
+            return self._exchange(self._local.connection, message)
+        except OSError:
+            self._close()
+            raise
+
+    def stream_events(self):
+        """Yields encoded events from the owner's broadcaster until the generator is closed"""
+        connection = self._connect()
+        try:
+            connection[0].sendall(json.dumps({'call': 'subscribe'}).encode() + b'\n')
+            for line in connection[1]:
+                yield json.loads(line)
+        finally:
+            connection[1].close()
+            connection[0].close()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        return sock, sock.makefile('rb')
+
+    @staticmethod
+    def _exchange(connection, message):
+        connection[0].sendall(message)
+        line = connection[1].readline()
+        if not line:
+            raise ConnectionResetError("State owner closed the connection")
+        return json.loads(line)
+
+    def _close(self):
+        sock, reader = self._local.connection
+        reader.close()
+        sock.close()
+        self._local.connection = None
+
+
+def forward(name, **args):
+    try:
+        reply = state_owner.call(name, **args)
+    except OSError as err:
+        logger.error("Failed to reach the state owner: %s", err)
+        abort(503, message="State owner unavailable")
+    return reply['body'], reply['status']
+
+
+def forward_pin_updates(sensor_id, updates):
+    # Parsed here so the state owner, which every worker shares, only applies them
+    try:
+        pin_states = pinupdates.parse_pin_updates(updates)
+    except ValueError as err:
+        abort(400, message=str(err))
+    return forward('sensor_update', sensor_id=sensor_id, pin_states=pin_states)
+
+
+class SensorsHandler(Resource):
+    def put(self, sensor_id):
+        args = put_parser.parse_args()
+        body, status = forward_pin_updates(sensor_id, [{'pin': args['pin'], 'state': args['state']}])
+        return (200, 200) if status == 200 else (body, status)
+
+
+class SensorsBatchHandler(Resource):
+    def put(self, sensor_id):
+        body = request.get_json(silent=True) or {}
+        updates = body.get('updates')
+        if not isinstance(updates, list):
+            abort(400, message="Expected a list of pin updates")
+
+        return forward_pin_updates(sensor_id, updates)
+
+
+class PanelHandler(Resource):
+    def get(self):
+        return forward('get_state', area=state_get_parser.parse_args()['area'])
+
+    def post(self):
+        args = state_parser.parse_args()
+        return forward('post_event', event=args['event'], arm_config=args['arm_config'], area=args['area'])
+
+
+class StateEventsHandler(Resource):
+    def get(self):
+        try:
+            stream = state_owner.stream_events()
+            first_event = next(stream)
+        except OSError as err:
+            logger.error("Failed to reach the state owner: %s", err)
+            abort(503, message="State owner unavailable")
+
+        def events():
+            try:
+                yield first_event
+                yield from stream
+            finally:
+                stream.close()
+
+        return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+def forward_request(path=''):
+    """Pass any other request to the state owner unchanged and relay its response"""
+    headers = {name: value for name, value in request.headers.items() if name.lower() not in HOP_BY_HOP_HEADERS}
+    try:
+        reply = state_owner.call('http', method=request.method, path=request.path,
+                                 query_string=request.query_string.decode('latin-1'), headers=headers,
+                                 body=base64.b64encode(request.get_data()).decode())
+    except OSError as err:
+        logger.error("Failed to reach the state owner: %s", err)
+        return Response('State owner unavailable', status=503)
+
+    return Response(base64.b64decode(reply['body']), status=reply['status'], headers=reply['headers'])
+
+
+def create_app(socket_path):
+    state_owner.path = socket_path
+
+    app = Flask(__name__)
+    api = Api(app)
+    api.add_resource(PanelHandler, '/state')
+    api.add_resource(SensorsHandler, '/device/<sensor_id>')
+    api.add_resource(SensorsBatchHandler, '/device/<sensor_id>/batch')
+    api.add_resource(StateEventsHandler, '/state/events')
+
+    methods = ['GET', 'PUT', 'POST', 'DELETE', 'PATCH']
+    app.add_url_rule('/', 'forward_request', forward_request, methods=methods)
+    app.add_url_rule('/<path:path>', 'forward_request', forward_request, methods=methods)
+    return app
+
+
+def serve(host, port, socket_path):
+    """Serve the worker app on host:port, bound with SO_REUSEPORT"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+
+    server = make_server(host, port, create_app(socket_path), threaded=True, fd=sock.fileno())
+    server.serve_forever()
+
+
+state_owner = StateOwnerClient()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--state-socket', default='alarmsystem.sock')
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.state_socket)